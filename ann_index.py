@@ -0,0 +1,113 @@
+"""
+    Approximate nearest neighbour search for the MmapVectorStore, using an inverted file (IVF) index.
+
+    The normalized embeddings are clustered with k-means into a number of lists. A query is only compared with the
+    vectors in the `n_probe` lists whose centroids are closest to it, instead of with every vector in the index.
+    More lists make each probe cheaper, more probes give a higher recall: tune both with ANN_LISTS and ANN_PROBES.
+"""
+import os
+import numpy as np
+
+IVF_FNAME = "ivf.npz"
+
+class IVFIndex:
+    """
+    Inverted file index over a matrix of normalized vectors.
+
+    Args:
+        centroids (np.ndarray): The normalized centroid of each list.
+        order (np.ndarray): The row numbers of the vectors, grouped by list.
+        offsets (np.ndarray): The start of each list in `order`, with the total number of rows as last element.
+    """
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @property
+    def n_rows(self):
+        return int(self.offsets[-1])
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, iterations=10, seed=42):
+        """
+        Clusters the vectors with spherical k-means.
+
+        Args:
+            matrix (np.ndarray): The normalized vectors, one per row.
+            n_lists (int): The number of lists, defaults to about the square root of the number of vectors.
+            iterations (int): The number of k-means iterations.
+            seed (int): The seed for the initial centroids, so the index is reproducible.
+
+        Returns:
+            IVFIndex: The built index.
+        """
+        n_rows = len(matrix)
+        n_lists = max(1, min(n_lists or int(np.sqrt(n_rows)), n_rows))
+        rng = np.random.default_rng(seed)
+        centroids = np.array(matrix[rng.choice(n_rows, n_lists, replace=False)], dtype=np.float32)
+        for _ in range(iterations):
+            assignments = cls._assign(matrix, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+            order = np.argsort(assignments, kind="stable")
+            sums = np.zeros_like(centroids)
+            # sum the vectors of each non-empty list in one pass over the sorted rows
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums[counts > 0] = np.add.reduceat(matrix[order], starts[counts > 0], axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # keep the previous centroid for lists that ended up empty
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        assignments = cls._assign(matrix, centroids)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        return cls(centroids, order, offsets)
+
+    @staticmethod
+    def _assign(matrix, centroids, batch_size=8192):
+        # assign in batches to bound the size of the similarity matrix
+        assignments = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), batch_size):
+            assignments[start:start + batch_size] = np.argmax(matrix[start:start + batch_size] @ centroids.T, axis=1)
+        return assignments
+
+    def search(self, matrix, query, top_k, n_probe=8):
+        """
+        Finds the approximate top-k most similar vectors.
+
+        Args:
+            matrix (np.ndarray): The normalized vectors the index was built on.
+            query (np.ndarray): The normalized query vector.
+            top_k (int): The number of results to return.
+            n_probe (int): The number of lists to search.
+
+        Returns:
+            tuple: The row numbers and similarities of the results, most similar first.
+        """
+        n_probe = min(n_probe, self.n_lists)
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        candidates = np.concatenate([self.order[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        if len(candidates) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        scores = matrix[candidates] @ query
+        top_k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def save(self, path):
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, centroids=self.centroids, order=self.order, offsets=self.offsets)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["order"], data["offsets"])
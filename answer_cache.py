@@ -0,0 +1,241 @@
+"""
+    Cache for the answers of the model, so repeated and near-duplicate questions don't need retrieval or a model call.
+
+    Questions are matched exactly by the hash of the prompt, and otherwise by the cosine similarity of the question
+    embedding with the cached questions. The cache key includes a namespace with the index version, so answers are
+    not reused after the index changed. Entries expire after a TTL and the least recently used entries are evicted
+    when the cache is full.
+"""
+import os, time, json, sqlite3, hashlib, threading
+from array import array
+from tracing import traced, set_attributes, log_duration
+
+class AnswerCache:
+    """
+    SQLite backed answer cache with exact and semantic (embedding similarity) lookups.
+
+    Args:
+        path (str): The path to the SQLite database file.
+        max_entries (int): The maximum number of answers to keep before evicting the least recently used ones.
+        ttl_seconds (float): The number of seconds an answer can be reused.
+        similarity_threshold (float): The minimum cosine similarity for a question to be a near-duplicate of a cached one.
+    """
+    def __init__(self, path="answer_cache.sqlite", max_entries=1000, ttl_seconds=24 * 60 * 60, similarity_threshold=0.95):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # in-memory copy of the question embeddings per namespace, for the similarity search
+        self._embeddings = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " namespace TEXT NOT NULL,"
+            " prompt_hash TEXT NOT NULL,"
+            " prompt TEXT NOT NULL,"
+            " embedding BLOB,"
+            " result TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (namespace, prompt_hash))"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def hash_prompt(prompt):
+        return hashlib.sha256(prompt.strip().encode("utf-8")).hexdigest()
+
+    def get(self, namespace, prompt, embedding_fn=None):
+        """
+        Looks up the answer for a prompt, first by the exact prompt and then by similarity.
+
+        Args:
+            namespace (str): The namespace of the answer, e.g. the mode and the index version.
+            prompt (str): The question of the user.
+            embedding_fn (callable): Returns the embedding of the prompt. Only called when there is no exact match,
+                so exact hits don't need an embedding. Without it, only exact matches are found.
+
+        Returns:
+            tuple: The cached result and "exact" or "similar", or (None, None) when the answer is not cached.
+        """
+        prompt_hash = self.hash_prompt(prompt)
+        with self._lock:
+            self._expire()
+            row = self._connection.execute(
+                "SELECT result FROM answers WHERE namespace = ? AND prompt_hash = ?", (namespace, prompt_hash)
+            ).fetchone()
+            if row:
+                self._touch(namespace, prompt_hash)
+                self.exact_hits += 1
+                return json.loads(row[0]), "exact"
+
+        if embedding_fn is not None:
+            # numpy is only needed for the similarity search, so the exact lookups (e.g. of the Azure path) don't import it
+            import numpy as np
+            embedding = np.asarray(embedding_fn(prompt), dtype=np.float32)
+            with self._lock:
+                prompt_hashes, matrix = self._get_embeddings(namespace)
+                if len(prompt_hashes) > 0:
+                    scores = matrix @ (embedding / (np.linalg.norm(embedding) or 1.0))
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        row = self._connection.execute(
+                            "SELECT result FROM answers WHERE namespace = ? AND prompt_hash = ?", (namespace, prompt_hashes[best])
+                        ).fetchone()
+                        if row:
+                            self._touch(namespace, prompt_hashes[best])
+                            self.similar_hits += 1
+                            return json.loads(row[0]), "similar"
+
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def put(self, namespace, prompt, result, embedding=None):
+        """
+        Stores the result for a prompt, and evicts the least recently used answers if the cache is full.
+
+        Args:
+            namespace (str): The namespace of the answer, e.g. the mode and the index version.
+            prompt (str): The question of the user.
+            result (dict): The JSON serializable result to cache.
+            embedding (list): The embedding of the prompt, to find near-duplicate questions later.
+        """
+        now = time.time()
+        blob = array("f", embedding).tobytes() if embedding is not None else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, self.hash_prompt(prompt), prompt, blob, json.dumps(result), now, now),
+            )
+            count = self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self._embeddings.clear()
+            self._connection.commit()
+            self._embeddings.pop(namespace, None)
+
+    def stats(self):
+        """
+        Returns:
+            dict: The number of exact hits, similar hits and misses, and the hit rate.
+        """
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+    def _touch(self, namespace, prompt_hash):
+        self._connection.execute(
+            "UPDATE answers SET last_used = ? WHERE namespace = ? AND prompt_hash = ?", (time.time(), namespace, prompt_hash)
+        )
+        self._connection.commit()
+
+    def _expire(self):
+        deleted = self._connection.execute("DELETE FROM answers WHERE created < ?", (time.time() - self.ttl_seconds,)).rowcount
+        self._connection.commit()
+        if deleted:
+            self._embeddings.clear()
+
+    def _get_embeddings(self, namespace):
+        import numpy as np
+        if namespace not in self._embeddings:
+            rows = self._connection.execute(
+                "SELECT prompt_hash, embedding FROM answers WHERE namespace = ? AND embedding IS NOT NULL", (namespace,)
+            ).fetchall()
+            prompt_hashes = [prompt_hash for prompt_hash, _ in rows]
+            matrix = None
+            if rows:
+                matrix = np.array([array("f", blob) for _, blob in rows], dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                matrix = matrix / norms
+            self._embeddings[namespace] = (prompt_hashes, matrix)
+        return self._embeddings[namespace]
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """
+    Gets the answer cache for this process, configured with environment variables.
+
+    Environment Variables:
+    - ANSWER_CACHE: Set to "off" to disable the answer cache (default: on).
+    - ANSWER_CACHE_PATH: The path to the SQLite database (default: "answer_cache.sqlite").
+    - ANSWER_CACHE_MAX_ENTRIES: The maximum number of cached answers (default: 1000).
+    - ANSWER_CACHE_TTL_SECONDS: The number of seconds an answer can be reused (default: 86400).
+    - ANSWER_CACHE_SIMILARITY: The minimum similarity of a near-duplicate question (default: 0.95).
+
+    Returns:
+        AnswerCache: The answer cache, or None when it is disabled.
+    """
+    global _answer_cache
+    if os.getenv("ANSWER_CACHE", "on").lower() == "off":
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(
+                path=os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite"),
+                max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+                ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 60 * 60))),
+                similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+            )
+    return _answer_cache
+
+@traced("answer_cache.lookup")
+def lookup_answer(namespace, user_prompt, embedding_fn=None):
+    """
+    Looks up the answer to a question in the answer cache.
+
+    Args:
+        namespace (str): The namespace of the answer, see get_local_cache_namespace.
+        user_prompt (str): The question of the user.
+        embedding_fn (callable): Returns the embedding of the question, to also find near-duplicate questions.
+
+    Returns:
+        dict: The cached result with the type of cache hit, or None when the answer is not cached.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+    startTime = time.time()
+    result, cache_hit = cache.get(namespace, user_prompt, embedding_fn)
+    set_attributes(cache_hit=cache_hit or "miss")
+    if result is None:
+        return None
+    duration = log_duration(startTime, f"Answering from the cache ([{cache_hit}] match)")
+    result.update({"question": user_prompt, "cache_hit": cache_hit, "usage": {}, "timings_ms": {"cache_lookup": duration, "total": duration}})
+    return result
+
+def store_answer(namespace, user_prompt, result, embedding_fn=None):
+    """
+    Stores the answer to a question in the answer cache.
+
+    Args:
+        namespace (str): The namespace of the answer, see get_local_cache_namespace.
+        user_prompt (str): The question of the user.
+        result (dict): The result with the answer and citations.
+        embedding_fn (callable): Returns the embedding of the question, to find near-duplicate questions later.
+    """
+    cache = get_answer_cache()
+    if cache is None:
+        return
+    cache.put(namespace, user_prompt, result, embedding_fn(user_prompt) if embedding_fn else None)
+
+def print_answer_cache_stats():
+    cache = get_answer_cache()
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(f"Answer cache: [{stats['exact_hits']}] exact hits, [{stats['similar_hits']}] similar hits, [{stats['misses']}] misses, hit rate [{stats['hit_rate']}]")
@@ -3,7 +3,95 @@
 """
 
 import sys, time, json
-from utils import setup_azure_client, get_github_rate_limit
+from utils import setup_azure_client, create_azure_completion, get_azure_cache_namespace, answer_azure_questions, aggregate_azure_results, log_duration, lookup_answer, store_answer, print_answer_cache_stats
+
+def print_citations(citations):
+    print("Citations:")
+    i=0
+    for citation in citations:
+        i+=1
+        print(f"\t[doc{i}] - {citation.get('title')}")
+
+def print_streamed_completion(completion, startTime):
+    """
+    Prints the answer of a streamed completion while the tokens arrive.
+
+    Args:
+        completion: The stream of completion chunks.
+        startTime (float): The start time of the call, to log the time to the first token.
+
+    Returns:
+        tuple: The full answer, the citations and the token usage (None when not reported).
+    """
+    content = ""
+    citations = []
+    usage = None
+    first_token = True
+    print()
+    print("Answer:")
+    for chunk in completion:
+        if chunk.usage:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        # the citations from Azure AI Search are sent in the context of the first chunk
+        context = getattr(delta, "context", None)
+        if context:
+            citations.extend(context.get("citations", []))
+        if not delta.content:
+            continue
+        if first_token:
+            log_duration(startTime, "Model call time to first token")
+            print("\t", end="")
+            first_token = False
+        print(delta.content.replace("\n", "\n\t"), end="", flush=True)
+        content += delta.content
+    print()
+    print()
+    print_citations(citations)
+    return content, citations, usage
+
+def read_questions(questions_file):
+    # one question per line, or JSON lines with a "question"
+    questions = []
+    with open(questions_file, "r") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["question"] if line.startswith("{") else line)
+    return questions
+
+def answer_batch(questions_file):
+    """
+    Answers all questions in a file at once, and shows the citations and the token usage of the whole batch.
+    """
+    questions = read_questions(questions_file)
+    print(f"Answering [{len(questions)}] questions")
+    startTime = time.time()
+
+    def print_result(position, result):
+        print()
+        print(f"[{position + 1}/{len(questions)}] {result['question']}")
+        if "error" in result:
+            print(f"\t[ERROR] {result['error']}")
+            return
+        for line in result["answer"].splitlines():
+            print(f"\t{line}")
+
+    results = answer_azure_questions(questions, on_result=print_result)
+    print()
+    duration = log_duration(startTime, f"Answering [{len(questions)}] questions")
+    summary = aggregate_azure_results(results)
+    print(f"Answered [{summary['questions'] - summary['errors']}/{summary['questions']}] questions, [{summary['cache_hits']}] from the cache, with [{summary['retries']}] retries")
+    if duration > 0:
+        print(f"Throughput: [{round(len(questions) / (duration / 1000), 2)}] questions per second")
+    print("Citations:")
+    for citation in summary["citations"]:
+        print(f"\t[{citation['answers']}x] {citation['title']} {citation['url'] or ''}")
+    print("Token usage:")
+    print(json.dumps(summary["usage"], indent=2))
+    print_answer_cache_stats()
 
 # Main script
 if __name__ == "__main__":
@@ -14,78 +102,68 @@ if __name__ == "__main__":
     The script is going to use the following command line parameters:
     - The question to be answered, e.g. python script.py "How can you use GitHub Actions with security in mind?"
     - A flag to run with the entire content of the documents, e.g. python script.py "How can you use GitHub Actions with security in mind?" True
+    - Optional: --stream to print the answer while it is generated, e.g. python script.py "How can you use GitHub Actions with security in mind?" --stream
+    - Or: --batch <file> to answer all questions in a file (one per line) at once, e.g. python script.py --batch questions.txt
     """
+    if "--batch" in sys.argv:
+        answer_batch(sys.argv[sys.argv.index("--batch") + 1])
+        sys.exit(0)
+
+    # print the answer while it is generated when the --stream flag is given
+    stream = "--stream" in sys.argv
+    arguments = [argument for argument in sys.argv if argument != "--stream"]
 
     # read the user prompt from the command line parameters
     default_user_prompt = "How can you use GitHub Actions with security in mind?"
-    user_prompt = sys.argv[1] if len(sys.argv) > 1 else default_user_prompt
+    user_prompt = arguments[1] if len(arguments) > 1 else default_user_prompt
 
     # Set up the Azure OpenAI connection
     client, deployment, search_endpoint, search_key, search_index = setup_azure_client()
 
-    startTime = time.time()
-    start_remaining_tokens = 0
-    start_remaining_requests = 0
-        
-    # Get the completion from the Azure OpenAI model
-    completion = client.chat.completions.create(
-        model=deployment,
-        messages= [
-        {
-            "role": "system",
-            "content": "You are an AI assistant that helps people find information in the given documents."
-        },
-        {
-            "role": "user",
-            "content": user_prompt
-        }
-    ],
-        max_tokens=800,
-        temperature=0.7,
-        top_p=0.95,
-        frequency_penalty=0,
-        presence_penalty=0,
-        stop=None,
-        stream=False
-    ,
-        extra_body={
-        "data_sources": [{
-            "type": "azure_search",
-            "parameters": {
-                "endpoint": search_endpoint,
-                "index_name": search_index,
-                "semantic_configuration": "default",
-                "query_type": "simple",
-                "fields_mapping": {},
-                "in_scope": True,
-                "role_information": "You are an AI assistant that helps people find information.",
-                "filter": None,
-                "strictness": 3,
-                "top_n_documents": 5,
-                "authentication": {
-                    "type": "api_key",
-                    "key": search_key
-                }
-            }
-            }]
-        })
-
-    #print(completion.to_json())
-    # loop over the completion.choices and show the answer
-    for choice in completion.choices:
-        print()
+    # Answer from the cache when this exact question was asked before with the same search index
+    cache_namespace = get_azure_cache_namespace(search_index, deployment)
+    cached = lookup_answer(cache_namespace, user_prompt)
+    if cached:
         print("Answer:")
-        # break up the answer in lines
-        for line in choice.message.content.splitlines():
+        for line in cached["answer"].splitlines():
             print(f"\t{line}")
         print()
-        print("Citations:")
-        citations = choice.message.context.get('citations', [])
-        i=0
-        for citation in citations:
-            i+=1
-            print(f"\t[doc{i}] - {citation.get('title')}")
+        print_citations(cached["citations"])
+        print()
+        print_answer_cache_stats()
+        sys.exit(0)
+
+    startTime = time.time()
+        
+    # Get the completion from the Azure OpenAI model
+    completion = create_azure_completion(client, deployment, search_endpoint, search_key, search_index, user_prompt, stream=stream)
+
+    if stream:
+        answer, citations, usage = print_streamed_completion(completion, startTime)
+    else:
+        usage = completion.usage
+        #print(completion.to_json())
+        # loop over the completion.choices and show the answer
+        for choice in completion.choices:
+            print()
+            print("Answer:")
+            # break up the answer in lines
+            for line in choice.message.content.splitlines():
+                print(f"\t{line}")
+            print()
+            print_citations(choice.message.context.get('citations', []))
+        answer = completion.choices[0].message.content
+        citations = completion.choices[0].message.context.get('citations', [])
 
     print()
+    log_duration(startTime, "Model call")
     print("Token usage:")
-    print(completion.usage.to_json())
\ No newline at end of file
+    print(usage.to_json() if usage else "Not reported for this completion")
+
+    store_answer(cache_namespace, user_prompt, {
+        "question": user_prompt,
+        "answer": answer,
+        "citations": [{"title": citation.get("title"), "url": citation.get("url")} for citation in citations],
+        "usage": usage.to_dict() if usage else {},
+    })
+    print_answer_cache_stats()
@@ -0,0 +1,362 @@
+"""
+    Asks the Azure OpenAI model questions, with the blog posts that were uploaded to the Azure AI Search index as data source.
+
+    A single question uses the synchronous client from setup_azure_client. Many questions at once are answered with
+    answer_azure_questions: the questions are fanned out on one event loop with the async client, which shares a pool
+    of kept-alive HTTP/2 connections (the h2 package is installed with `httpx[http2]` from requirements.txt), so the
+    questions don't each pay for a new connection and TLS handshake. Rate limited requests are retried with a backoff.
+"""
+import os, time, random, asyncio, hashlib, dotenv
+from answer_cache import lookup_answer, store_answer
+from tracing import span, traced
+
+def get_azure_settings():
+    """
+    Loads the settings for Azure OpenAI and Azure AI Search from the environment variables.
+
+    Environment Variables:
+    - ENDPOINT_URL: The endpoint URL for the Azure OpenAI service (default: "https://xms-openai.openai.azure.com/").
+    - DEPLOYMENT_NAME: The deployment name for the Azure OpenAI service (default: "gpt-4o").
+    - SEARCH_ENDPOINT: The endpoint URL for the Azure AI Search service (default: "https://xms-azure-search.search.windows.net").
+    - SEARCH_KEY: The admin key for the Azure AI Search service (default: "put your Azure AI Search admin key here").
+    - SEARCH_INDEX_NAME: The index name for the Azure AI Search service (default: "vector-1727189048533").
+    - AZURE_OPENAI_API_KEY: The subscription key for the Azure OpenAI service.
+
+    Raises:
+        ValueError: If the ENDPOINT_URL or AZURE_OPENAI_API_KEY environment variables are not set.
+
+    Returns:
+        tuple: The endpoint, the subscription key, the deployment, the search endpoint, the search key and the search index.
+    """
+    dotenv.load_dotenv()
+    endpoint = os.getenv("ENDPOINT_URL", "https://xms-openai.openai.azure.com/")
+    deployment = os.getenv("DEPLOYMENT_NAME", "gpt-4o")
+    search_endpoint = os.getenv("SEARCH_ENDPOINT", "https://xms-azure-search.search.windows.net")
+    search_key = os.getenv("SEARCH_KEY", "put your Azure AI Search admin key here")
+    search_index = os.getenv("SEARCH_INDEX_NAME", "vector-1727189048533")
+    subscription_key = os.getenv("AZURE_OPENAI_API_KEY")
+
+    # validate the endpint and API Key
+    if not endpoint:
+        raise ValueError("ENDPOINT_URL is not set")
+
+    if not subscription_key:
+        raise ValueError("AZURE_OPENAI_API_KEY is not set")
+
+    # Show the info we got
+    print(f"Endpoint: [{endpoint}] and lenght of the key: [{len(subscription_key)}]")
+    print(f"Using [{search_index}] with key length [{len(search_key)}] and endpoint [{search_endpoint}]")
+    return endpoint, subscription_key, deployment, search_endpoint, search_key, search_index
+
+def setup_azure_client():
+    """
+    Sets up and initializes an Azure OpenAI client using environment variables for configuration, see get_azure_settings.
+
+    Raises:
+    - ValueError: If the ENDPOINT_URL or AZURE_OPENAI_API_KEY environment variables are not set.
+    Returns:
+    - AzureOpenAI: An initialized Azure OpenAI client with key-based authentication.
+    """
+    endpoint, subscription_key, deployment, search_endpoint, search_key, search_index = get_azure_settings()
+
+    # Initialize Azure OpenAI client with key-based authentication, the openai package is only imported here as it takes about a second
+    from openai import AzureOpenAI
+    client = AzureOpenAI(
+        azure_endpoint = endpoint,
+        api_key = subscription_key,
+        api_version = "2024-05-01-preview",
+    )
+
+    return client, deployment, search_endpoint, search_key, search_index
+
+def setup_async_azure_client():
+    """
+    Sets up an async Azure OpenAI client on a pooled HTTP client, to answer many questions at once.
+
+    The client does not retry by itself: create_azure_completion_async retries with a backoff, so the waits of
+    concurrent questions are visible. Close the client (`async with client:`) on the event loop that used it.
+
+    Returns:
+        tuple: The AsyncAzureOpenAI client, the deployment, the search endpoint, the search key and the search index.
+    """
+    endpoint, subscription_key, deployment, search_endpoint, search_key, search_index = get_azure_settings()
+    from openai import AsyncAzureOpenAI
+    client = AsyncAzureOpenAI(
+        azure_endpoint = endpoint,
+        api_key = subscription_key,
+        api_version = "2024-05-01-preview",
+        http_client = get_azure_http_client(),
+        max_retries = 0,
+    )
+    return client, deployment, search_endpoint, search_key, search_index
+
+def get_azure_http_client():
+    """
+    Creates the async HTTP client that all questions share, with a pool of kept-alive connections.
+
+    Environment Variables:
+    - AZURE_HTTP2: "on", "off" or "auto" to use HTTP/2 when the h2 package is installed, which it is with the
+      `httpx[http2]` from requirements.txt (default: "auto").
+    - AZURE_MAX_CONNECTIONS: The maximum number of open connections (default: 20).
+    - AZURE_KEEPALIVE_SECONDS: The number of seconds an idle connection is kept open (default: 30).
+
+    Returns:
+        httpx.AsyncClient: The HTTP client, which reports the rate limit headers to the rate limit tracker.
+    """
+    import importlib.util, httpx
+    from rate_limits import rate_limit_tracker
+
+    http2 = os.getenv("AZURE_HTTP2", "auto").lower()
+    h2_installed = importlib.util.find_spec("h2") is not None
+    if http2 != "off" and not h2_installed:
+        print("[WARNING] HTTP/2 needs the h2 package (pip install -r requirements.txt), using HTTP/1.1")
+    max_connections = int(os.getenv("AZURE_MAX_CONNECTIONS", "20"))
+    return rate_limit_tracker.async_http_client(
+        http2=h2_installed and http2 != "off",
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=float(os.getenv("AZURE_KEEPALIVE_SECONDS", "30")),
+        ),
+    )
+
+def get_azure_content_version(checkpoint_path=None):
+    """
+    Gets a version of the uploaded blog posts that changes whenever upload-data.py uploads a blob.
+
+    Environment Variables:
+    - UPLOAD_CHECKPOINT: The path to the checkpoint file of upload-data.py (default: "upload-checkpoint.json").
+
+    Args:
+        checkpoint_path (str): The path to the checkpoint file, instead of UPLOAD_CHECKPOINT.
+
+    Returns:
+        str: A short hash of the checkpoint with the ETag of every uploaded blob, or "none" when nothing was uploaded
+            from this machine.
+    """
+    checkpoint_path = checkpoint_path or os.getenv("UPLOAD_CHECKPOINT", "upload-checkpoint.json")
+    if not os.path.exists(checkpoint_path):
+        return "none"
+    with open(checkpoint_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+def get_azure_cache_namespace(search_index, deployment):
+    # the answer depends on the search index, the model, how the index is searched and the uploaded blog posts
+    return f"azure:{search_index}:{deployment}:{os.getenv('SEARCH_QUERY_TYPE', 'simple')}:{get_azure_content_version()}"
+
+def get_azure_completion_parameters(deployment, search_endpoint, search_key, search_index, user_prompt):
+    """
+    Gets the parameters for the chat completion, with the Azure AI Search index as data source.
+
+    Environment Variables:
+    - SEARCH_QUERY_TYPE: The Azure AI Search query type: "simple", "semantic", "vector", "vector_simple_hybrid" or "vector_semantic_hybrid" (default: "simple").
+    - SEARCH_SEMANTIC_CONFIGURATION: The semantic configuration of the index, for the semantic query types (default: "default").
+    - SEARCH_EMBEDDING_DEPLOYMENT: The embedding deployment for the vector query types (default: "text-embedding-3-small").
+    - SEARCH_TOP_N_DOCUMENTS: The number of documents to use as context (default: 5).
+
+    Returns:
+        dict: The keyword arguments for chat.completions.create.
+    """
+    query_type = os.getenv("SEARCH_QUERY_TYPE", "simple")
+    search_parameters = {}
+    if query_type.startswith("vector"):
+        # the vector query types embed the question with a deployment in the same Azure OpenAI resource
+        search_parameters["embedding_dependency"] = {
+            "type": "deployment_name",
+            "deployment_name": os.getenv("SEARCH_EMBEDDING_DEPLOYMENT", "text-embedding-3-small"),
+        }
+    return {
+        "model": deployment,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an AI assistant that helps people find information in the given documents."
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ],
+        "max_tokens": 800,
+        "temperature": 0.7,
+        "top_p": 0.95,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+        "stop": None,
+        "extra_body": {
+            "data_sources": [{
+                "type": "azure_search",
+                "parameters": {
+                    "endpoint": search_endpoint,
+                    "index_name": search_index,
+                    "semantic_configuration": os.getenv("SEARCH_SEMANTIC_CONFIGURATION", "default"),
+                    "query_type": query_type,
+                    "fields_mapping": {},
+                    "in_scope": True,
+                    "role_information": "You are an AI assistant that helps people find information.",
+                    "filter": None,
+                    "strictness": 3,
+                    "top_n_documents": int(os.getenv("SEARCH_TOP_N_DOCUMENTS", "5")),
+                    "authentication": {
+                        "type": "api_key",
+                        "key": search_key
+                    },
+                    **search_parameters
+                }
+            }]
+        },
+    }
+
+@traced("azure.completion")
+def create_azure_completion(client, deployment, search_endpoint, search_key, search_index, user_prompt, stream=False):
+    """
+    Asks the Azure OpenAI model a question, using the Azure AI Search index as data source.
+
+    Args:
+        client (AzureOpenAI): The client from setup_azure_client.
+        deployment (str): The deployment name of the model.
+        search_endpoint (str): The endpoint URL of the Azure AI Search service.
+        search_key (str): The admin key for the Azure AI Search service.
+        search_index (str): The index name in the Azure AI Search service.
+        user_prompt (str): The question of the user.
+        stream (bool): Stream the completion while it is generated.
+
+    Returns:
+        The completion, or the stream of completion chunks when streaming.
+    """
+    parameters = get_azure_completion_parameters(deployment, search_endpoint, search_key, search_index, user_prompt)
+    return client.chat.completions.create(stream=stream, **parameters)
+
+async def create_azure_completion_async(client, deployment, search_endpoint, search_key, search_index, user_prompt, max_retries=5):
+    """
+    Asks the Azure OpenAI model a question with the async client, retrying rate limited and failed requests.
+
+    A rate limited request waits for the `retry-after` header of the response, other failures wait with an
+    exponential backoff. A bit of jitter is added, so the questions that were rate limited together don't all
+    retry at the same moment.
+
+    Args:
+        client (AsyncAzureOpenAI): The client from setup_async_azure_client.
+        max_retries (int): The number of times a request is retried.
+        The other arguments are the same as for create_azure_completion.
+
+    Returns:
+        tuple: The completion and the number of retries it took.
+    """
+    import openai
+    parameters = get_azure_completion_parameters(deployment, search_endpoint, search_key, search_index, user_prompt)
+    with span("azure.completion", mode="async") as completion_span:
+        for attempt in range(max_retries + 1):
+            try:
+                completion = await client.chat.completions.create(**parameters)
+                completion_span.set(retries=attempt)
+                return completion, attempt
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt == max_retries:
+                    completion_span.set(retries=attempt)
+                    raise
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                wait = float(retry_after) if retry_after and retry_after.isdigit() else min(2 ** attempt, 60)
+                wait += random.uniform(0, 1)
+                print(f"[WARNING] [{type(e).__name__}] for the question [{user_prompt[:50]}], retrying in [{round(wait, 1)}] seconds")
+                await asyncio.sleep(wait)
+
+def get_azure_result(user_prompt, completion, startTime):
+    """
+    Gets the answer, the citations and the token usage from a completion.
+
+    Returns:
+        dict: The result, in the same format as answer_question of the local index.
+    """
+    choice = completion.choices[0]
+    return {
+        "question": user_prompt,
+        "answer": choice.message.content,
+        "citations": [
+            {"title": citation.get("title"), "url": citation.get("url"), "filepath": citation.get("filepath")}
+            for citation in (getattr(choice.message, "context", None) or {}).get("citations", [])
+        ],
+        "usage": completion.usage.to_dict() if completion.usage else {},
+        "timings_ms": {"model_call": round((time.time() - startTime) * 1000)},
+    }
+
+async def answer_azure_questions_async(questions, concurrency=None, on_result=None):
+    """
+    Answers many questions at once with Azure OpenAI, see answer_azure_questions.
+    """
+    concurrency = concurrency or int(os.getenv("AZURE_CONCURRENCY", "8"))
+    max_retries = int(os.getenv("AZURE_MAX_RETRIES", "5"))
+    client, deployment, search_endpoint, search_key, search_index = setup_async_azure_client()
+    namespace = get_azure_cache_namespace(search_index, deployment)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(position, user_prompt):
+        result = lookup_answer(namespace, user_prompt)
+        if result is None:
+            async with semaphore:
+                startTime = time.time()
+                try:
+                    completion, retries = await create_azure_completion_async(client, deployment, search_endpoint, search_key, search_index, user_prompt, max_retries)
+                    result = get_azure_result(user_prompt, completion, startTime)
+                    store_answer(namespace, user_prompt, result)
+                    result["retries"] = retries
+                except Exception as e:
+                    result = {"question": user_prompt, "error": str(e)}
+        if on_result is not None:
+            on_result(position, result)
+        return result
+
+    async with client:
+        return await asyncio.gather(*(answer(position, user_prompt) for position, user_prompt in enumerate(questions)))
+
+def answer_azure_questions(questions, concurrency=None, on_result=None):
+    """
+    Answers many questions at once with Azure OpenAI and Azure AI Search.
+
+    The questions run concurrently on one event loop and share the connections of one HTTP client. Questions that
+    are in the answer cache are answered from the cache.
+
+    Environment Variables:
+    - AZURE_CONCURRENCY: The maximum number of questions that are sent at the same time (default: 8).
+    - AZURE_MAX_RETRIES: The number of times a rate limited or failed request is retried (default: 5).
+    - And the variables of get_azure_settings, get_azure_http_client and get_azure_completion_parameters.
+
+    Args:
+        questions (list): The questions to answer.
+        concurrency (int): The maximum number of questions that are sent at the same time, instead of AZURE_CONCURRENCY.
+        on_result (callable): Called with the position of the question and its result, as soon as it is answered.
+
+    Returns:
+        list: The result for every question in the same order as the questions, with an "error" when it failed.
+    """
+    return asyncio.run(answer_azure_questions_async(questions, concurrency, on_result))
+
+def aggregate_azure_results(results):
+    """
+    Adds up the token usage of the results and counts how many answers cite each document.
+
+    Args:
+        results (list): The results from answer_azure_questions.
+
+    Returns:
+        dict: The number of questions, errors, cache hits and retries, the total token usage and the cited
+            documents, the most cited first.
+    """
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    citations = {}
+    for result in results:
+        for key in usage:
+            usage[key] += (result.get("usage") or {}).get(key) or 0
+        # count every document once per answer
+        cited = {citation.get("url") or citation.get("filepath") or citation.get("title"): citation for citation in result.get("citations", [])}
+        for key, citation in cited.items():
+            citations.setdefault(key, {"title": citation.get("title"), "url": citation.get("url"), "answers": 0})["answers"] += 1
+    return {
+        "questions": len(results),
+        "errors": sum(1 for result in results if "error" in result),
+        "cache_hits": sum(1 for result in results if result.get("cache_hit")),
+        "retries": sum(result.get("retries", 0) for result in results),
+        "usage": usage,
+        "citations": sorted(citations.values(), key=lambda citation: citation["answers"], reverse=True),
+    }
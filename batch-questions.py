@@ -0,0 +1,106 @@
+"""
+    This script answers a batch of questions from a JSONL file in one process, with the questions running concurrently.
+
+    The index, the models and the HTTP connections are set up once and shared by all questions. Every answer is
+    written as one JSON line to the output file, with the citations, the token usage and the duration of each stage.
+
+    The script is going to use the following command line parameters:
+    - The input file with one question per line, e.g. {"id": "q1", "question": "How can you use GitHub Actions with security in mind?"}
+      Add "full_documents": true to a line to answer that question with the entire content of the documents.
+    - The output file to write the answers to, e.g. python batch-questions.py questions.jsonl answers.jsonl
+    - Optional: the mode, "local" (default) for the local index with GitHub Models or "azure" for Azure OpenAI with Azure AI Search,
+      e.g. python batch-questions.py questions.jsonl answers.jsonl azure
+
+    Environment Variables:
+    - BATCH_CONCURRENCY: The maximum number of questions that are answered at the same time (default: 4).
+    - In the azure mode the questions are sent with the async client, see answer_azure_questions in azure_search.py
+      for the connection and retry settings.
+"""
+import sys, os, time, json, contextlib, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils import answer_azure_questions, log_duration, print_answer_cache_stats
+
+def read_questions(input_file):
+    questions = []
+    with open(input_file, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append({
+                "id": item.get("id", line_number),
+                "question": item.get("question") or item.get("prompt"),
+                "full_documents": bool(item.get("full_documents", False)),
+            })
+    return questions
+
+def setup_local_answerer():
+    # imported here, so the azure mode does not import llama_index
+    from utils import setup_local, get_blogging_directory, get_index, answer_question
+    setup_local()
+    blogging_directory = get_blogging_directory()
+    index = get_index(blogging_directory)
+
+    def answer(item):
+        return answer_question(index, blogging_directory, item["question"], run_with_documents=item["full_documents"])
+    return answer
+
+# Main script
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        raise ValueError("Usage: python batch-questions.py <questions.jsonl> <answers.jsonl> [local|azure]")
+    input_file, output_file = sys.argv[1], sys.argv[2]
+    mode = sys.argv[3] if len(sys.argv) > 3 else "local"
+    concurrency = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+    questions = read_questions(input_file)
+    print(f"Loaded [{len(questions)}] questions from [{input_file}]")
+
+    if mode != "azure":
+        startTime = time.time()
+        answer = setup_local_answerer()
+        log_duration(startTime, "Setup")
+    # the request logging of every call is too verbose for a batch
+    logging.getLogger().setLevel(logging.WARNING)
+
+    def run(item):
+        result = {"id": item["id"]}
+        try:
+            result.update(answer(item))
+        except Exception as e:
+            result.update({"question": item["question"], "error": str(e)})
+        return result
+
+    print(f"Answering the questions with a concurrency of [{concurrency}]")
+    startTime = time.time()
+    completed = 0
+    errors = 0
+    # the pipeline prints every step, which is unreadable with concurrent questions: only show the progress
+    with open(output_file, "w") as output, open(os.devnull, "w") as devnull:
+        def write_result(result):
+            global completed, errors
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            completed += 1
+            errors += 1 if "error" in result else 0
+            print(f"[{completed}/{len(questions)}] answered question [{result['id']}]", file=sys.stderr)
+
+        with contextlib.redirect_stdout(devnull):
+            if mode == "azure":
+                # the Azure questions are fanned out on one event loop, sharing the connections of one HTTP client
+                answer_azure_questions(
+                    [item["question"] for item in questions],
+                    concurrency,
+                    on_result=lambda position, result: write_result({"id": questions[position]["id"], **result}),
+                )
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    futures = [executor.submit(run, item) for item in questions]
+                    for future in as_completed(futures):
+                        write_result(future.result())
+
+    duration = log_duration(startTime, f"Answering [{len(questions)}] questions")
+    print(f"Wrote [{completed}] answers with [{errors}] errors to [{output_file}]")
+    print_answer_cache_stats()
+    if duration > 0:
+        print(f"Throughput: [{round(len(questions) / (duration / 1000 / 3600))}] questions per hour")
@@ -0,0 +1,91 @@
+"""
+    This script compares the approximate IVF search with the exact search of the vector store, side by side.
+
+    It reports the recall@k of the IVF index (the share of the exact top-k results that the IVF search also finds)
+    and the average latency per query, for a range of probe settings. The quantized embeddings (float16 and int8,
+    see vector_quantization.py) are compared the same way, with and without rescoring the candidates with the
+    float32 embeddings, next to the memory the searched matrix takes.
+
+    The script is going to use the following command line parameters:
+    - Optional: the number of synthetic vectors to benchmark with, e.g. python benchmark-ann.py 100000
+      Without it, the embeddings from the persisted `blog_index` folder are used.
+
+    Environment Variables:
+    - BENCHMARK_TOP_K: The number of results per query (default: 10).
+    - BENCHMARK_QUERIES: The number of queries (default: 200).
+    - VECTOR_RESCORE: The number of candidates per result that are rescored (default: 4).
+"""
+import sys, time, os
+import numpy as np
+from ann_index import IVFIndex
+from mmap_vector_store import MmapVectorStore, normalize
+from vector_quantization import QuantizedMatrix, QUANTIZATIONS
+
+def load_vectors():
+    if len(sys.argv) > 1:
+        # clustered synthetic vectors, to mimic topics in a corpus
+        rng = np.random.default_rng(42)
+        n_vectors = int(sys.argv[1])
+        topics = rng.normal(size=(max(1, n_vectors // 100), 1536))
+        vectors = topics[rng.integers(len(topics), size=n_vectors)] + rng.normal(scale=3.0, size=(n_vectors, 1536))
+        print(f"Using [{n_vectors}] synthetic vectors")
+        return normalize(vectors)
+
+    vector_store = MmapVectorStore.from_persist_dir("blog_index")
+    print(f"Using [{len(vector_store.node_ids)}] vectors from the blog_index folder")
+    return vector_store.matrix
+
+def exact_search(matrix, query, top_k):
+    scores = matrix @ query
+    top_k = min(top_k, len(scores))
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    return top[np.argsort(-scores[top])]
+
+def rescored_search(matrix, quantized, query, top_k, rescore):
+    candidates = np.sort(exact_search(quantized, query, top_k * rescore))
+    return candidates[exact_search(matrix[candidates], query, top_k)]
+
+def get_recall(exact_results, results):
+    return np.mean([len(exact & set(result)) / len(exact) for exact, result in zip(exact_results, results)])
+
+# Main script
+if __name__ == "__main__":
+    top_k = int(os.getenv("BENCHMARK_TOP_K", "10"))
+    n_queries = int(os.getenv("BENCHMARK_QUERIES", "200"))
+    matrix = load_vectors()
+
+    # use perturbed copies of indexed vectors as queries
+    rng = np.random.default_rng(7)
+    queries = normalize(matrix[rng.integers(len(matrix), size=n_queries)] + rng.normal(scale=0.02, size=(n_queries, matrix.shape[1])))
+
+    startTime = time.time()
+    ivf = IVFIndex.build(matrix, n_lists=int(os.getenv("ANN_LISTS")) if os.getenv("ANN_LISTS") else None)
+    print(f"Building the IVF index with [{ivf.n_lists}] lists took [{round((time.time() - startTime) * 1000)}] ms")
+    print()
+
+    startTime = time.time()
+    exact_results = [set(exact_search(matrix, query, top_k)) for query in queries]
+    exact_ms = (time.time() - startTime) * 1000 / n_queries
+    print(f"{'search':<24}{'recall@' + str(top_k):>12}{'ms/query':>12}{'MB':>10}")
+    print(f"{'exact':<24}{1.0:>12.3f}{exact_ms:>12.3f}{matrix.nbytes / 1024 / 1024:>10.1f}")
+
+    for n_probe in [1, 2, 4, 8, 16, 32]:
+        if n_probe > ivf.n_lists:
+            break
+        startTime = time.time()
+        ivf_results = [ivf.search(matrix, query, top_k, n_probe=n_probe)[0] for query in queries]
+        ivf_ms = (time.time() - startTime) * 1000 / n_queries
+        recall = get_recall(exact_results, ivf_results)
+        print(f"{'ivf probes=' + str(n_probe):<24}{recall:>12.3f}{ivf_ms:>12.3f}")
+
+    rescore = int(os.getenv("VECTOR_RESCORE", "4"))
+    for dtype in QUANTIZATIONS:
+        quantized = QuantizedMatrix.quantize(matrix, dtype)
+        searches = [(dtype, lambda query: exact_search(quantized, query, top_k))]
+        if rescore:
+            searches.append((f"{dtype} rescore={rescore}", lambda query: rescored_search(matrix, quantized, query, top_k, rescore)))
+        for name, search in searches:
+            startTime = time.time()
+            results = [search(query) for query in queries]
+            search_ms = (time.time() - startTime) * 1000 / n_queries
+            print(f"{name:<24}{get_recall(exact_results, results):>12.3f}{search_ms:>12.3f}{quantized.nbytes / 1024 / 1024:>10.1f}")
@@ -0,0 +1,207 @@
+"""
+    This script runs the benchmark suite against a local stub model endpoint, so it needs no network or tokens.
+
+    For every corpus size, a synthetic blog corpus is generated and two fresh processes are started: one that builds
+    the index, and one that loads it and answers the benchmark questions. It measures:
+    - the index build time and the index load time, and the size of the persisted index
+    - the retrieval latency (p50/p95) per question
+    - the end-to-end throughput of answer_question in questions per second, with concurrent questions
+    - the peak RSS (resident memory) of both processes
+
+    The results are written as JSON, so two runs can be compared with --compare.
+
+    The script is going to use the following command line parameters:
+    - Optional: the corpus sizes, e.g. python benchmarks/run-benchmarks.py 100,1000 (default: 50,200,1000)
+    - Optional: --output <file> to write the results to another file (default: benchmarks/results/benchmark-<timestamp>.json)
+    - Or: --compare <baseline.json> <results.json> to show the difference between two runs
+
+    Environment Variables:
+    - BENCHMARK_QUESTIONS: The number of questions to ask per corpus size (default: 50).
+    - BENCHMARK_CONCURRENCY: The number of concurrent questions for the throughput measurement (default: 4).
+    - STUB_LATENCY_MS, STUB_TOKEN_LATENCY_MS, STUB_EMBEDDING_DIM, STUB_REQUESTS_PER_MINUTE, STUB_TOKENS_PER_MINUTE:
+      The settings of the stub endpoint, see stub_server.py.
+"""
+import sys, os, time, math, json, subprocess, tempfile, platform, contextlib, resource
+from datetime import datetime, timezone
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIRECTORY = os.path.dirname(BENCHMARKS_DIRECTORY)
+sys.path.insert(0, BENCHMARKS_DIRECTORY)
+
+# The metrics that are compared between runs, with True when higher is better
+METRICS = {
+    "build_seconds": False,
+    "load_seconds": False,
+    "retrieval_ms_p50": False,
+    "retrieval_ms_p95": False,
+    "questions_per_second": True,
+    "build_peak_rss_mb": False,
+    "index_mb": False,
+    "query_peak_rss_mb": False,
+}
+
+def percentile(sorted_values, percentage):
+    # nearest-rank percentile
+    return sorted_values[max(0, math.ceil(percentage / 100 * len(sorted_values)) - 1)]
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_build(corpus_directory):
+    """
+    Builds the index for the corpus in the current directory, in a fresh process.
+    """
+    sys.path.insert(0, REPOSITORY_DIRECTORY)
+    from utils import setup_local, get_index, get_directory_stats
+
+    startTime = time.time()
+    setup_local()
+    index = get_index(corpus_directory)
+    build_seconds = round(time.time() - startTime, 3)
+    return {
+        "fragments": len(index.index_struct.nodes_dict),
+        "build_seconds": build_seconds,
+        "build_peak_rss_mb": get_peak_rss_mb(),
+        "index_mb": round(get_directory_stats("blog_index")[1] / 1024 / 1024, 2),
+    }
+
+def run_queries(corpus_directory):
+    """
+    Loads the index from the current directory and answers the benchmark questions, in a fresh process.
+    """
+    sys.path.insert(0, REPOSITORY_DIRECTORY)
+    from concurrent.futures import ThreadPoolExecutor
+    from utils import setup_local, get_index, retrieve_fragments, answer_question
+    from synthetic_corpus import generate_questions
+
+    startTime = time.time()
+    setup_local()
+    index = get_index(corpus_directory)
+    load_seconds = round(time.time() - startTime, 3)
+
+    questions = generate_questions(int(os.getenv("BENCHMARK_QUESTIONS", "50")))
+    latencies = []
+    for question in questions:
+        questionTime = time.perf_counter()
+        retrieve_fragments(index, question)
+        latencies.append((time.perf_counter() - questionTime) * 1000)
+    latencies.sort()
+
+    # the questions were embedded during the retrieval measurement, so use other questions for the throughput
+    questions = [f"{question} Please explain." for question in questions]
+    startTime = time.time()
+    with ThreadPoolExecutor(max_workers=int(os.getenv("BENCHMARK_CONCURRENCY", "4"))) as executor:
+        list(executor.map(lambda question: answer_question(index, corpus_directory, question), questions))
+    duration = time.time() - startTime
+
+    return {
+        "load_seconds": load_seconds,
+        "retrieval_ms_p50": round(percentile(latencies, 50), 2),
+        "retrieval_ms_p95": round(percentile(latencies, 95), 2),
+        "questions_per_second": round(len(questions) / duration, 2),
+        "query_peak_rss_mb": get_peak_rss_mb(),
+    }
+
+def run_phase(phase, corpus_directory, work_directory, stub_url):
+    """
+    Runs a phase of the benchmark in a fresh process, so the load time and peak RSS are not affected by the other phases.
+    """
+    env = dict(os.environ)
+    env.update({
+        "GITHUB_TOKEN": "stub",
+        "GITHUB_MODELS_ENDPOINT": stub_url,
+        "EMBEDDING_CACHE_PATH": os.path.join(work_directory, "embedding_cache.sqlite"),
+        "ANSWER_CACHE": "off",
+    })
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--phase", phase, corpus_directory],
+        cwd=work_directory, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"The [{phase}] phase failed:\n{result.stderr[-4000:]}")
+    # the phase prints its result as the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def get_git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY_DIRECTORY, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(baseline_file, results_file):
+    with open(baseline_file, "r") as file:
+        baseline = {result["posts"]: result for result in json.load(file)["results"]}
+    with open(results_file, "r") as file:
+        results = json.load(file)["results"]
+
+    print(f"{'posts':>7} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>9}")
+    for result in results:
+        if result["posts"] not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline[result["posts"]].get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            regression = change < -10 if higher_is_better else change > 10
+            print(f"{result['posts']:>7} {metric:<22} {old:>10} {new:>10} {change:>+8.1f}%{'  <- regression' if regression else ''}")
+
+# Main script
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--phase":
+        # run a single phase, called by run_phase: the pipeline prints every step, so only print the result
+        phase, corpus_directory = sys.argv[2], sys.argv[3]
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = run_build(corpus_directory) if phase == "build" else run_queries(corpus_directory)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--compare":
+        compare(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    from stub_server import from_env
+    from synthetic_corpus import generate_corpus
+
+    arguments = sys.argv[1:]
+    output_file = os.path.join(BENCHMARKS_DIRECTORY, "results", f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    if "--output" in arguments:
+        output_file = arguments[arguments.index("--output") + 1]
+        arguments = [argument for argument in arguments if argument not in ("--output", output_file)]
+    sizes = [int(size) for size in (arguments[0] if arguments else "50,200,1000").split(",")]
+
+    stub = from_env().start()
+    print(f"Stub model endpoint running on [{stub.url}]")
+    results = []
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as work_directory:
+                corpus_directory = os.path.join(work_directory, "posts") + "/"
+                corpus_bytes = generate_corpus(corpus_directory, size)
+                print(f"Benchmarking [{size}] posts ([{round(corpus_bytes / 1024)}] KB)")
+                result = {"posts": size, "corpus_kb": round(corpus_bytes / 1024)}
+                result.update(run_phase("build", corpus_directory, work_directory, stub.url))
+                result.update(run_phase("query", corpus_directory, work_directory, stub.url))
+                print(f"\t{json.dumps(result)}")
+                results.append(result)
+    finally:
+        stub.stop()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, "w") as file:
+        json.dump({
+            "created": datetime.now(timezone.utc).isoformat(),
+            "commit": get_git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {name: os.getenv(name) for name in [
+                "BENCHMARK_QUESTIONS", "BENCHMARK_CONCURRENCY", "STUB_LATENCY_MS", "STUB_TOKEN_LATENCY_MS",
+                "STUB_EMBEDDING_DIM", "STUB_REQUESTS_PER_MINUTE", "STUB_TOKENS_PER_MINUTE", "RETRIEVAL_MODE", "ANN_INDEX",
+                "VECTOR_QUANTIZATION", "DOCSTORE_COMPRESSION", "RETRIEVAL_FANOUT",
+            ] if os.getenv(name)},
+            "results": results,
+        }, file, indent=2)
+    print(f"Wrote the results to [{output_file}]")
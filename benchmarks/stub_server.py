@@ -0,0 +1,236 @@
+"""
+    Local stub for the OpenAI compatible endpoints of GitHub Models (and Azure OpenAI), for offline benchmarks.
+
+    The embeddings are deterministic: every word is hashed into a few dimensions of the vector, so texts that share
+    words have a higher similarity, like with a real embedding model. The completions are a fixed answer with the
+    token usage of the request. Every response has the `x-ratelimit-*` headers, counted over a sliding window of one
+    minute, and requests over the limits are answered with a 429 and a `retry-after` header.
+
+    Run it standalone with python benchmarks/stub_server.py, and point the scripts at it with
+    GITHUB_MODELS_ENDPOINT=http://127.0.0.1:8001/
+
+    Environment Variables:
+    - STUB_PORT: The port to listen on when running standalone (default: 8001).
+    - STUB_LATENCY_MS: The latency of every request in milliseconds (default: 20).
+    - STUB_TOKEN_LATENCY_MS: The latency per streamed completion token in milliseconds (default: 0).
+    - STUB_EMBEDDING_DIM: The number of dimensions of the embeddings (default: 1536).
+    - STUB_REQUESTS_PER_MINUTE: The request limit that is reported and enforced (default: 100000).
+    - STUB_TOKENS_PER_MINUTE: The token limit that is reported and enforced (default: 100000000).
+"""
+import os, re, json, time, zlib, base64, threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+ANSWER_WORDS = "This is a deterministic answer from the stub model endpoint for benchmarking".split()
+
+def embed_text(text, dim):
+    """
+    Embeds a text by hashing every word into three dimensions of the vector, with a sign.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        word_hash = zlib.crc32(word.encode("utf-8"))
+        for offset in range(3):
+            position = (word_hash >> (offset * 10)) % dim
+            vector[position] += 1.0 if (word_hash >> (offset + 29)) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+class RateLimiter:
+    """
+    Counts the requests and tokens of the last minute, like the rate limits of GitHub Models.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._lock = threading.Lock()
+        self._calls = deque()
+
+    def acquire(self, tokens):
+        """
+        Returns:
+            tuple: Whether the call is allowed, and the rate limit headers for the response.
+        """
+        now = time.time()
+        with self._lock:
+            while self._calls and self._calls[0][0] < now - 60:
+                self._calls.popleft()
+            used_requests = len(self._calls)
+            used_tokens = sum(call_tokens for _, call_tokens in self._calls)
+            allowed = used_requests < self.requests_per_minute and used_tokens + tokens <= self.tokens_per_minute
+            if allowed:
+                self._calls.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            retry_after = max(1, round(self._calls[0][0] + 60 - now)) if self._calls else 1
+        headers = {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(max(0, self.requests_per_minute - used_requests)),
+            "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+            "x-ratelimit-remaining-tokens": str(max(0, self.tokens_per_minute - used_tokens)),
+        }
+        if not allowed:
+            headers["retry-after"] = str(retry_after)
+        return allowed, headers
+
+class StubHandler(BaseHTTPRequestHandler):
+    # set by StubServer
+    settings = None
+    rate_limiter = None
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.settings["latency_ms"] / 1000)
+
+        if path.endswith("/embeddings"):
+            texts = body.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            tokens = sum(count_tokens(text) for text in texts)
+            allowed, headers = self.rate_limiter.acquire(tokens)
+            if not allowed:
+                return self.send_rate_limited(headers)
+            self.send_json(self.embeddings_response(body, texts, tokens), headers)
+        elif path.endswith("/chat/completions"):
+            prompt_tokens = sum(count_tokens(str(message.get("content") or "")) for message in body.get("messages", []))
+            allowed, headers = self.rate_limiter.acquire(prompt_tokens + len(ANSWER_WORDS))
+            if not allowed:
+                return self.send_rate_limited(headers)
+            if body.get("stream"):
+                self.stream_completion(body, prompt_tokens, headers)
+            else:
+                self.send_json(self.completion_response(body, prompt_tokens), headers)
+        else:
+            self.send_json({"error": {"message": f"Unknown path [{path}]"}}, {}, status_code=404)
+
+    def embeddings_response(self, body, texts, tokens):
+        data = []
+        for index, text in enumerate(texts):
+            vector = embed_text(text, self.settings["embedding_dim"])
+            # the OpenAI client asks for base64 encoded float32 embeddings by default
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii") if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def completion_response(self, body, prompt_tokens):
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(ANSWER_WORDS), "context": {"citations": []}},
+                "finish_reason": "stop",
+            }],
+            "usage": self.usage(prompt_tokens),
+        }
+
+    def stream_completion(self, body, prompt_tokens, headers):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def send_chunk(choices, usage=None):
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model"), "choices": choices}
+            if usage:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for position, word in enumerate(ANSWER_WORDS):
+            time.sleep(self.settings["token_latency_ms"] / 1000)
+            delta = {"content": word if position == 0 else f" {word}"}
+            if position == 0:
+                delta["role"] = "assistant"
+            send_chunk([{"index": 0, "delta": delta, "finish_reason": None}])
+        send_chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send_chunk([], usage=self.usage(prompt_tokens))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def usage(prompt_tokens):
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(ANSWER_WORDS), "total_tokens": prompt_tokens + len(ANSWER_WORDS)}
+
+    def send_rate_limited(self, headers):
+        self.send_json({"error": {"message": "Rate limit exceeded", "code": "RateLimitReached"}}, headers, status_code=429)
+
+    def send_json(self, data, headers, status_code=200):
+        content = json.dumps(data).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer:
+    """
+    Runs the stub endpoint on a background thread.
+
+    Args:
+        host (str): The host to listen on.
+        port (int): The port to listen on, 0 picks a free port.
+        latency_ms (float): The latency of every request in milliseconds.
+        token_latency_ms (float): The latency per streamed completion token in milliseconds.
+        embedding_dim (int): The number of dimensions of the embeddings.
+        requests_per_minute (int): The request limit that is reported and enforced.
+        tokens_per_minute (int): The token limit that is reported and enforced.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=20, token_latency_ms=0, embedding_dim=1536, requests_per_minute=100_000, tokens_per_minute=100_000_000):
+        handler = type("ConfiguredStubHandler", (StubHandler,), {
+            "settings": {"latency_ms": latency_ms, "token_latency_ms": token_latency_ms, "embedding_dim": embedding_dim},
+            "rate_limiter": RateLimiter(requests_per_minute, tokens_per_minute),
+        })
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def from_env(port=0):
+    """
+    Creates a stub server configured with the environment variables.
+    """
+    return StubServer(
+        port=port,
+        latency_ms=float(os.getenv("STUB_LATENCY_MS", "20")),
+        token_latency_ms=float(os.getenv("STUB_TOKEN_LATENCY_MS", "0")),
+        embedding_dim=int(os.getenv("STUB_EMBEDDING_DIM", "1536")),
+        requests_per_minute=int(os.getenv("STUB_REQUESTS_PER_MINUTE", "100000")),
+        tokens_per_minute=int(os.getenv("STUB_TOKENS_PER_MINUTE", "100000000")),
+    )
+
+# Main script
+if __name__ == "__main__":
+    server = from_env(port=int(os.getenv("STUB_PORT", "8001"))).start()
+    print(f"Stub model endpoint running on [{server.url}], set GITHUB_MODELS_ENDPOINT={server.url} to use it")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
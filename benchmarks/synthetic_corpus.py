@@ -0,0 +1,97 @@
+"""
+    Generates a synthetic blog corpus with the same shape as the real blog posts, for reproducible benchmarks.
+
+    Every post has the Jekyll front matter with the date, is about one topic and mixes sentences with the terms of
+    that topic with general sentences, including action names and CLI flags for the keyword search. The same seed
+    always generates the same corpus and questions.
+"""
+import os, random
+
+TOPICS = {
+    "github-actions": ["workflow", "runner", "actions/checkout@v4", "matrix", "job", "step", "secrets", "GITHUB_TOKEN", "permissions", "composite"],
+    "security": ["dependabot", "codeql", "secret scanning", "supply chain", "SHA pinning", "OIDC", "least privilege", "vulnerability", "SBOM", "attestation"],
+    "azure": ["App Service", "Key Vault", "managed identity", "Bicep", "resource group", "az login", "--subscription", "Container Apps", "Azure Monitor", "Entra ID"],
+    "copilot": ["completions", "chat", "prompt", "context", "extensions", "agent", "code review", "suggestions", "telemetry", "seat"],
+    "docker": ["Dockerfile", "image", "layer", "--no-cache", "multi-stage build", "registry", "buildx", "compose", "healthcheck", "distroless"],
+    "devops": ["pipeline", "deployment", "feature flag", "trunk based", "DORA metrics", "incident", "observability", "rollback", "environment", "approval"],
+}
+
+GENERAL_SENTENCES = [
+    "In this post I want to share what I learned while setting this up for a customer.",
+    "This turned out to be more work than I expected, so here are the details.",
+    "Let me know if you have a better way to do this.",
+    "The documentation does not cover this scenario very well.",
+    "After a few iterations the setup was stable enough to roll out to all teams.",
+    "Always test this in a separate environment first.",
+]
+
+TOPIC_TEMPLATES = [
+    "You can configure the {0} together with the {1} to get a faster feedback loop.",
+    "When the {0} fails, check the {1} first, as that is the most common cause.",
+    "I prefer to use {0} over {1}, because it is easier to maintain.",
+    "The {0} needs access to the {1}, so make sure that is set up before you start.",
+    "Using {0} with {1} is a good default for most repositories.",
+]
+
+def generate_post(rng, topic, post_number):
+    terms = TOPICS[topic]
+    title_terms = rng.sample(terms, 2)
+    paragraphs = []
+    for _ in range(rng.randint(4, 12)):
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            if rng.random() < 0.7:
+                sentences.append(rng.choice(TOPIC_TEMPLATES).format(*rng.sample(terms, 2)))
+            else:
+                sentences.append(rng.choice(GENERAL_SENTENCES))
+        paragraphs.append(" ".join(sentences))
+    title = f"Using {title_terms[0]} with {title_terms[1]} ({post_number})"
+    return title, "\n\n".join(paragraphs)
+
+def generate_corpus(directory, n_posts, seed=42):
+    """
+    Writes the synthetic blog posts to a directory.
+
+    Args:
+        directory (str): The directory to write the posts to, created if needed.
+        n_posts (int): The number of posts to generate.
+        seed (int): The seed for the random generator.
+
+    Returns:
+        int: The total number of bytes written.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    total_bytes = 0
+    for post_number in range(n_posts):
+        topic = rng.choice(sorted(TOPICS))
+        title, content = generate_post(rng, topic, post_number)
+        date = f"20{18 + post_number % 7}-{1 + post_number % 12:02d}-{1 + post_number % 28:02d}"
+        text = f"---\nlayout: post\ntitle: \"{title}\"\ndate: {date}\ntags: [{topic}]\n---\n\n# {title}\n\n{content}\n"
+        with open(os.path.join(directory, f"{date}-{topic}-{post_number}.md"), "w") as file:
+            file.write(text)
+        total_bytes += len(text.encode("utf-8"))
+    return total_bytes
+
+def generate_questions(n_questions, seed=7):
+    """
+    Generates questions about the topics of the synthetic corpus.
+
+    Args:
+        n_questions (int): The number of questions to generate.
+        seed (int): The seed for the random generator.
+
+    Returns:
+        list: The questions.
+    """
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(n_questions):
+        terms = TOPICS[rng.choice(sorted(TOPICS))]
+        first, second = rng.sample(terms, 2)
+        questions.append(rng.choice([
+            f"How can I use {first} with {second}?",
+            f"What should I check when {first} fails?",
+            f"Why would you prefer {first} over {second}?",
+        ]))
+    return questions
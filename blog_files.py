@@ -0,0 +1,208 @@
+"""
+    Helpers for the blog posts on disk: getting the blogging repository, hashing the files and reading the posts with
+    the date from their front matter.
+
+    Only uses the standard library, so scripts that only need the blog posts (like upload-data.py) start fast.
+"""
+import os, hashlib, threading
+from collections import OrderedDict
+from corpus_sync import get_corpus_sync
+
+def get_blogging_directory():
+    """
+    Ensures the blogging directory is present and up-to-date.
+
+    This function performs the following steps:
+    1. Checks if the "blog" directory has a clone of the blogging repository.
+    2. If there is no clone yet, it clones the blogging repository from GitHub.
+    3. If the last fetch is older than 24 hours, it pulls the latest changes from the repository on a background
+       thread, so the blog posts on disk are used while the refresh happens (see corpus_sync.py).
+    4. Displays the size and the number of files in the "_posts" subdirectory of the blogging directory.
+
+    Returns:
+        str: The path to the "_posts" subdirectory within the blogging directory.
+    """
+    blogging_directory = get_corpus_sync().ensure()
+    show_files_in_directory(blogging_directory, "files in the blogging directory")
+    return blogging_directory
+
+def get_directory_stats(directory):
+    """
+    Counts the files in a directory and its subdirectories and adds up their size, in a single pass.
+
+    Hidden files and directories are skipped, the same way `ls` skips them.
+
+    Args:
+        directory (str): The path to the directory.
+
+    Returns:
+        tuple: The number of files and their total size in bytes.
+    """
+    nr_of_files = 0
+    total_size = 0
+    directories = [directory]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    nr_of_files += 1
+                    total_size += entry.stat(follow_symlinks=False).st_size
+    return nr_of_files, total_size
+
+def format_size(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{round(size, 1)} {unit}"
+        size /= 1024
+    return f"{round(size, 1)} GB"
+
+def show_files_in_directory(directory, message):
+    """
+    Displays the number of files in the specified directory and their size, along with a custom message.
+
+    Args:
+        directory (str): The path to the directory whose files are to be counted.
+        message (str): The custom message to be displayed alongside the file count.
+
+    Returns:
+        None
+    """
+    nr_of_files, total_size = get_directory_stats(directory)
+    print(f"{nr_of_files} {message} ({format_size(total_size)})")
+
+def get_file_hashes(directory, file_names=None):
+    """
+    Calculates the content hash of each file in a directory.
+
+    Hidden files are skipped, the same way the SimpleDirectoryReader skips them when loading the data.
+
+    Args:
+        directory (str): The path to the directory containing the blog posts.
+        file_names (list): Only hash these files, the files that no longer exist are left out (default: all files).
+
+    Returns:
+        dict: A dictionary with the file name as key and the sha256 hash of the content as value.
+    """
+    hashes = {}
+    if file_names is None:
+        file_names = [entry.name for entry in os.scandir(directory) if entry.is_file() and not entry.name.startswith(".")]
+    for file_name in file_names:
+        try:
+            with open(os.path.join(directory, file_name), "rb") as file:
+                hashes[file_name] = hashlib.sha256(file.read()).hexdigest()
+        except FileNotFoundError:
+            continue
+    return hashes
+
+# Cache with the content and front matter date of the blog posts, most recently used last
+_document_cache = OrderedDict()
+_document_cache_lock = threading.Lock()
+
+def read_blog_post(file_path):
+    """
+    Reads a blog post and parses the date from its header, using an in-memory LRU cache.
+
+    The cache entry of a file is invalidated when the modification time or the size of the file changed.
+
+    Environment Variables:
+    - DOCUMENT_CACHE_SIZE: The maximum number of blog posts to keep in memory (default: 256).
+
+    Args:
+        file_path (str): The path to the blog post.
+
+    Returns:
+        tuple: The content of the blog post and the date line from its header, or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+    with _document_cache_lock:
+        cached = _document_cache.get(file_path)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            _document_cache.move_to_end(file_path)
+            return cached[1]
+
+    try:
+        with open(file_path, "r") as file:
+            content = file.read()
+    except FileNotFoundError:
+        # the file was deleted by a refresh of the blogging repository after the check above
+        return None
+    blog_post = (content, parse_blog_header_date(content))
+
+    with _document_cache_lock:
+        _document_cache[file_path] = ((stat.st_mtime_ns, stat.st_size), blog_post)
+        _document_cache.move_to_end(file_path)
+        while len(_document_cache) > int(os.getenv("DOCUMENT_CACHE_SIZE", "256")):
+            _document_cache.popitem(last=False)
+    return blog_post
+
+def convert_filename_to_url(document, date, base_url):
+    """
+    Converts a filename to a blog URL.
+
+    Args:
+        document (str): The file path of the document. Example: 'blog/_posts//2022-10-09-Enabling-GitHub-Actions-on-Enterprise-Server.md'.
+        date (str): The date in the format 'Date: yyyy-mm-dd'. Example: 'Date: 2022-10-09'.
+        base_url (str): The base URL of the blog. Example: 'https://devopsjournal.io'.
+
+    Returns:
+        str: The constructed blog URL. Example: 'https://devopsjournal.io/blog/2022/10/09/Enabling-GitHub-Actions-on-Enterprise-Server'.
+    """
+    # convert the filename to the blog url
+    # file_name example: blog/_posts//2022-10-09-Enabling-GitHub-Actions-on-Enterprise-Server.md
+    # actual blog url example: https://devopsjournal.io/blog/2022/10/08/Enabling-GitHub-Actions-on-Enterprise-Server
+    file_name = document.split("/")[-1]
+    file_name = file_name.replace(".md", "")
+    # get the three date fields in the file name
+    parts = file_name.split("-")
+    year, month, day = parts[:3]
+    title = "-".join(parts[3:])
+    # remove the date from the filename
+    file_name = file_name.replace(f"{year}-{month}-{day}-", "")
+    # insert the date from the file itself in yyyy/mm/dd format
+    # get year from date
+    year = date.split(": ")[1].split("-")[0]
+    month = date.split(": ")[1].split("-")[1]
+    day = date.split(": ")[1].split("-")[2]
+    # insert the date in the file name
+    file_name = f"{year}/{month}/{day}/{file_name}"    
+    return f"{base_url}/{file_name}"
+
+def parse_blog_header_date(content):
+    """
+    Parses the date from the header of a blog post.
+
+    The header is expected to be in the following format:
+    ---
+    layout: post
+    title: "Blog Post Title"
+    date: YYYY-MM-DD
+    tags: [tag1, tag2, ...]
+    ---
+    blog content...
+
+    Args:
+        content (str): The content of the blog post including the header.
+
+    Returns:
+        str: The date string in the format 'YYYY-MM-DD' extracted from the header.
+
+    Raises:
+        IndexError: If the date field is not found in the header.
+    """
+    header = content.split("---")[1]
+    header = header.split("\n")
+    header = [line.strip() for line in header if line.strip()]
+    # find the date tag
+    try:
+        date = [line for line in header if line.startswith("date")][0]
+    except IndexError:
+        date = None  # or you can use a default value or message
+    return date
@@ -0,0 +1,171 @@
+"""
+    In-process BM25 keyword index over the fragments of the blog index.
+
+    The vector search finds fragments with the same meaning as the question, but misses exact terms like action names
+    (`actions/checkout`) and CLI flags (`--no-cache`). The BM25 index is an inverted index from each term to the
+    fragments it occurs in, with the term frequency per fragment, so keyword-heavy questions only score the fragments
+    that contain the terms. It is persisted as `bm25.json` next to the vector store in the `blog_index` folder.
+"""
+import os, re, json, math
+from collections import Counter
+
+BM25_FNAME = "bm25.json"
+
+# Words that occur in almost every question and fragment, and only add noise to the keyword scores
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "use", "was", "what", "when", "where", "which", "why", "with", "you",
+}
+
+# Keep the characters that are part of action names, versions and CLI flags together in one term
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_\-./@]*[a-z0-9]|[a-z0-9]")
+
+def tokenize(text):
+    """
+    Splits a text into lowercase terms, without the stopwords.
+
+    Terms with separators (e.g. "actions/checkout@v4") are also split into their parts, so they match both the
+    full term and the parts.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The terms in the text.
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = re.split(r"[_\-./@]+", token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+class BM25Index:
+    """
+    Inverted index with the BM25 (Okapi) ranking function.
+
+    Args:
+        k1 (float): Controls how quickly the score saturates for repeated terms.
+        b (float): Controls how much the score is normalized by the length of the fragment.
+    """
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {node_id: term frequency}
+        self.postings = {}
+        # node_id -> number of terms in the fragment
+        self.lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def node_ids(self):
+        return set(self.lengths)
+
+    def add(self, node_id, text):
+        """
+        Adds a fragment to the index, replacing it if it was indexed before.
+
+        Args:
+            node_id (str): The id of the fragment.
+            text (str): The text of the fragment.
+        """
+        if node_id in self.lengths:
+            self.remove([node_id])
+        terms = tokenize(text)
+        for term, frequency in Counter(terms).items():
+            self.postings.setdefault(term, {})[node_id] = frequency
+        self.lengths[node_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, node_ids):
+        """
+        Removes fragments from the index.
+
+        Args:
+            node_ids (iterable): The ids of the fragments to remove.
+        """
+        node_ids = {node_id for node_id in node_ids if node_id in self.lengths}
+        if not node_ids:
+            return
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for node_id in node_ids.intersection(postings):
+                del postings[node_id]
+            if not postings:
+                del self.postings[term]
+        for node_id in node_ids:
+            self.total_length -= self.lengths.pop(node_id)
+
+    def copy(self):
+        """
+        Copies the index, so it can be changed while searches run on the original.
+        """
+        index = BM25Index(k1=self.k1, b=self.b)
+        index.postings = {term: dict(postings) for term, postings in self.postings.items()}
+        index.lengths = dict(self.lengths)
+        index.total_length = self.total_length
+        return index
+
+    def search(self, query, top_k=10):
+        """
+        Finds the fragments with the highest BM25 score for the query.
+
+        Args:
+            query (str): The question of the user.
+            top_k (int): The number of fragments to return.
+
+        Returns:
+            list: Tuples with the node id and the score, highest score first.
+        """
+        if not self.lengths:
+            return []
+        average_length = self.total_length / len(self.lengths)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for node_id, frequency in postings.items():
+                normalization = self.k1 * (1 - self.b + self.b * self.lengths[node_id] / average_length)
+                scores[node_id] = scores.get(node_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + normalization)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def persist(self, persist_dir):
+        """
+        Saves the index to `bm25.json` in the persist directory.
+
+        Args:
+            persist_dir (str): The path to the directory where the index is persisted.
+        """
+        path = os.path.join(persist_dir, BM25_FNAME)
+        with open(path + ".tmp", "w") as file:
+            json.dump({"k1": self.k1, "b": self.b, "postings": self.postings, "lengths": self.lengths}, file)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        """
+        Loads the index from the persist directory.
+
+        Args:
+            persist_dir (str): The path to the directory where the index is persisted.
+
+        Returns:
+            BM25Index: The loaded index, or an empty index when it was not persisted yet.
+        """
+        path = os.path.join(persist_dir, BM25_FNAME)
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as file:
+            data = json.load(file)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.postings = data["postings"]
+        index.lengths = data["lengths"]
+        index.total_length = sum(index.lengths.values())
+        return index
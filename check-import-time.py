@@ -0,0 +1,245 @@
+"""
+    This script checks how long each script takes to start, against a startup-time budget per script.
+
+    Every script is started in a fresh interpreter against a local stub endpoint (for GitHub Models, Azure OpenAI and
+    the Blob Storage), in a temporary directory with a small blogging repository. The startup time is the time until
+    the script sends its first request to the stub, or until it exits when it does not use the network. So the
+    imports that are deferred into the functions (like openai in setup_azure_client) are measured as well, on the
+    path the script really takes. The script is stopped at its first request. The fastest of a few runs is compared
+    with the budget, and the slowest imports (from `python -X importtime`) are listed for every script.
+
+    The script is going to use the following command line parameters:
+    - Optional: the scripts to check, e.g. python check-import-time.py azure-openai.py upload-data.py (default: all scripts with a budget)
+
+    The script exits with 1 when a script goes over its budget. Scripts with an import that is not installed are skipped.
+    Run `python -m pytest tests/test_import_time.py` to run the same check as a test.
+
+    Environment Variables:
+    - IMPORT_TIME_RUNS: The number of runs per script, the fastest run is used (default: 3).
+    - IMPORT_BUDGET_FACTOR: Multiplies the budgets, e.g. 2 on a slow CI machine (default: 1.0).
+"""
+import sys, os, time, socket, subprocess, tempfile, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# The startup-time budget in milliseconds of each script, until its first request
+IMPORT_BUDGETS_MS = {
+    "upload-data.py": 800,
+    "azure-openai.py": 2500,
+    "batch-questions.py": 2500,
+    "trace-report.py": 150,
+    "local-script.py": 8000,
+    "query-server.py": 8000,
+}
+
+class StubEndpoint:
+    """
+    HTTP server that records when the first request arrives, and answers every request with a 503.
+    """
+    def __init__(self):
+        self.first_request = None
+        self.received = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self):
+                if not stub.received.is_set():
+                    stub.first_request = time.perf_counter()
+                    stub.received.set()
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_GET = do_POST = do_PUT = do_HEAD = handle_request
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def reset(self):
+        self.first_request = None
+        self.received.clear()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def prepare_directory(directory):
+    """
+    Fills the working directory of the scripts with a blogging repository that does not need a refresh, an empty
+    trace file and a file with a question.
+    """
+    os.makedirs(os.path.join(directory, "blog", ".git"), exist_ok=True)
+    os.makedirs(os.path.join(directory, "blog", "_posts"), exist_ok=True)
+    with open(os.path.join(directory, "blog", ".git", "HEAD"), "w") as file:
+        file.write("ref: refs/heads/main\n")
+    with open(os.path.join(directory, "blog", "_posts", "2024-01-01-startup.md"), "w") as file:
+        file.write("---\ndate: 2024-01-01\n---\n# Startup\nA blog post to check the startup time of the scripts.\n")
+    with open(os.path.join(directory, "traces.jsonl"), "w"):
+        pass
+    with open(os.path.join(directory, "questions.jsonl"), "w") as file:
+        file.write('{"id": "q1", "question": "How can you use GitHub Actions with security in mind?"}\n')
+
+def get_startup_command(script, stub_url):
+    """
+    Gets the arguments and environment variables that point a script at the stub endpoint.
+
+    Returns:
+        tuple: The command line arguments and the environment variables for the script.
+    """
+    environment = {
+        "GITHUB_TOKEN": "startup-check",
+        "GITHUB_MODELS_ENDPOINT": stub_url + "/",
+        "ENDPOINT_URL": stub_url + "/",
+        "AZURE_OPENAI_API_KEY": "startup-check",
+        "AZURE_STORAGE_CONNECTION_STRING": (
+            "DefaultEndpointsProtocol=http;AccountName=devstoreaccount1;"
+            f"AccountKey=c3RhcnR1cC1jaGVjaw==;BlobEndpoint={stub_url}/devstoreaccount1;"
+        ),
+        "CORPUS_REFRESH_HOURS": "1000000",
+        # a cached answer or embedding would skip the first request
+        "ANSWER_CACHE": "off",
+        "EMBEDDING_CACHE_PATH": ":memory:",
+        "SERVER_PORT": str(get_free_port()),
+        "TRACING": "",
+    }
+    arguments = {
+        "batch-questions.py": ["questions.jsonl", "answers.jsonl", "azure"],
+    }.get(script, [])
+    return arguments, environment
+
+def get_startup_modules():
+    # the modules the interpreter imports at startup are not part of the startup time of a script
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"], capture_output=True, text=True)
+    return {name for _, name, _ in parse_importtime(result.stderr)}
+
+def parse_importtime(output):
+    """
+    Parses the output of -X importtime.
+
+    Returns:
+        list: The imported modules as (depth, name, cumulative microseconds).
+    """
+    imports = []
+    for line in output.splitlines():
+        # e.g. "import time:       321 |      11826 |   dotenv.main", nested imports are indented by two spaces
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative)))
+    return imports
+
+def run_script(script, stub, directory, timeout=120):
+    """
+    Runs a script until its first request to the stub endpoint, or until it exits.
+
+    Returns:
+        tuple: The startup time in milliseconds and the -X importtime output, or None when an import is not installed.
+    """
+    arguments, environment = get_startup_command(script, stub.url)
+    stub.reset()
+    startTime = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", os.path.join(ROOT_DIRECTORY, script), *arguments],
+        cwd=directory, env=dict(os.environ, **environment),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    # read the output while the script runs, so it never blocks on a full pipe
+    output = []
+    reader = threading.Thread(target=lambda: output.append(process.stderr.read()), daemon=True)
+    reader.start()
+    deadline = time.time() + timeout
+    while not stub.received.wait(0.01):
+        if process.poll() is not None or time.time() > deadline:
+            break
+    endTime = stub.first_request if stub.received.is_set() else time.perf_counter()
+    returncode = process.poll()
+    process.kill()
+    process.wait()
+    reader.join()
+    stderr = output[0] if output else ""
+
+    if stub.received.is_set() or returncode == 0:
+        return (endTime - startTime) * 1000, stderr
+    if "ModuleNotFoundError" in stderr:
+        return None
+    if returncode is None:
+        raise RuntimeError(f"[{script}] did not send a request within [{timeout}] seconds")
+    raise RuntimeError(f"[{script}] failed before its first request:\n{stderr[-2000:]}")
+
+def measure_script(script, runs=3, stub=None, startup_modules=None):
+    """
+    Measures the startup time of a script, the fastest of a few runs.
+
+    Returns:
+        tuple: The startup time in milliseconds and the slowest top level imports, or None when an import is not installed.
+    """
+    own_stub = stub is None
+    stub = stub or StubEndpoint()
+    startup_modules = startup_modules if startup_modules is not None else get_startup_modules()
+    fastest = None
+    try:
+        for _ in range(runs):
+            # a fresh directory for every run, so the index is not loaded from an earlier run
+            with tempfile.TemporaryDirectory() as directory:
+                prepare_directory(directory)
+                result = run_script(script, stub, directory)
+            if result is None:
+                return None
+            duration, stderr = result
+            if fastest is None or duration < fastest[0]:
+                fastest = (duration, stderr)
+    finally:
+        if own_stub:
+            stub.close()
+
+    duration, stderr = fastest
+    top_level = [(name, cumulative) for depth, name, cumulative in parse_importtime(stderr) if depth == 0 and name not in startup_modules]
+    slowest = sorted(top_level, key=lambda item: item[1], reverse=True)[:3]
+    return round(duration), [(name, round(cumulative / 1000)) for name, cumulative in slowest]
+
+def get_budget(script):
+    return round(IMPORT_BUDGETS_MS.get(script, 0) * float(os.getenv("IMPORT_BUDGET_FACTOR", "1.0")))
+
+# Main script
+if __name__ == "__main__":
+    scripts = sys.argv[1:] or list(IMPORT_BUDGETS_MS)
+    runs = int(os.getenv("IMPORT_TIME_RUNS", "3"))
+
+    startup_modules = get_startup_modules()
+    # compile the bytecode first, so the first run does not measure compiling the modules
+    subprocess.run([sys.executable, "-m", "compileall", "-q", ROOT_DIRECTORY], capture_output=True)
+
+    stub = StubEndpoint()
+    over_budget = []
+    for script in scripts:
+        budget = get_budget(script)
+        measurement = measure_script(script, runs, stub, startup_modules)
+        if measurement is None:
+            print(f"[{script}] skipped, not all of its imports are installed")
+            continue
+        duration, slowest = measurement
+        status = "OK" if duration <= budget else "OVER BUDGET"
+        print(f"[{script}] starts in [{duration}] ms, budget [{budget}] ms: {status}")
+        print(f"\tslowest imports: {', '.join(f'{name} [{milliseconds}] ms' for name, milliseconds in slowest)}")
+        if duration > budget:
+            over_budget.append(script)
+    stub.close()
+
+    if over_budget:
+        print(f"[ERROR] [{len(over_budget)}] scripts go over their startup-time budget: {', '.join(over_budget)}")
+        sys.exit(1)
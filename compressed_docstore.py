@@ -0,0 +1,81 @@
+"""
+    Document store that keeps the text of the fragments compressed, in memory and in `docstore.json`.
+
+    The text of every fragment is compressed with zlib and stored base64 encoded next to the node, so loading the
+    index with `load_index_from_storage` keeps the compressed text in memory. The text is only decompressed when a
+    node is read from the store, e.g. for the fragments that were retrieved for a question. Fragments that were
+    stored without compression (by the SimpleDocumentStore) are read as they are.
+"""
+import os, zlib, base64
+from typing import Optional
+from llama_index.core.constants import DATA_KEY
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.types import DEFAULT_PERSIST_FNAME
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.core.storage.kvstore.simple_kvstore import SimpleKVStore
+
+TEXT_KEY = "__text_zlib__"
+
+def compress_text(text):
+    return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
+
+def decompress_text(data):
+    return zlib.decompress(base64.b64decode(data)).decode("utf-8")
+
+def _json_to_doc(json):
+    if TEXT_KEY not in json:
+        return json_to_doc(json)
+    text = decompress_text(json[TEXT_KEY])
+    json = {key: value for key, value in json.items() if key != TEXT_KEY}
+    json[DATA_KEY] = dict(json[DATA_KEY], text=text)
+    return json_to_doc(json)
+
+class CompressedDocumentStore(SimpleDocumentStore):
+    """
+    SimpleDocumentStore that stores the text of the nodes compressed.
+
+    Args:
+        compress (bool): Whether to compress the text of the nodes that are added, the nodes that are stored
+            compressed are decompressed when read either way.
+    """
+    def __init__(self, simple_kvstore=None, namespace=None, compress=True, **kwargs):
+        super().__init__(simple_kvstore, namespace=namespace, **kwargs)
+        self.compress = compress
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, namespace=None, compress=True):
+        """
+        Loads the document store from a persist directory, like SimpleDocumentStore.from_persist_dir.
+        """
+        simple_kvstore = SimpleKVStore.from_persist_path(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME))
+        return cls(simple_kvstore, namespace, compress=compress)
+
+    @property
+    def docs(self):
+        json_dict = self._kvstore.get_all(collection=self._node_collection)
+        return {key: _json_to_doc(json) for key, json in json_dict.items()}
+
+    def _get_kv_pairs_for_insert(self, node, ref_doc_info, store_text):
+        node_kv_pair, metadata_kv_pair, ref_doc_kv_pair = super()._get_kv_pairs_for_insert(node, ref_doc_info, store_text)
+        text = node_kv_pair[1][DATA_KEY].get("text") if node_kv_pair is not None and self.compress else None
+        if text:
+            node_key, json = node_kv_pair
+            node_kv_pair = (node_key, dict(json, **{DATA_KEY: dict(json[DATA_KEY], text=""), TEXT_KEY: compress_text(text)}))
+        return node_kv_pair, metadata_kv_pair, ref_doc_kv_pair
+
+    def get_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        json = self._kvstore.get(doc_id, collection=self._node_collection)
+        if json is None:
+            if raise_error:
+                raise ValueError(f"doc_id {doc_id} not found.")
+            return None
+        return _json_to_doc(json)
+
+    async def aget_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        json = await self._kvstore.aget(doc_id, collection=self._node_collection)
+        if json is None:
+            if raise_error:
+                raise ValueError(f"doc_id {doc_id} not found.")
+            return None
+        return _json_to_doc(json)
@@ -0,0 +1,167 @@
+"""
+    Packs the content of the matching blog posts into a context that fits a token budget.
+
+    Sending the full content of every matching blog post makes the prompt grow with the length of the posts, which
+    costs tokens, latency and rate limit budget. Instead, the posts are split into passages (paragraphs), the passages
+    are ranked by the score of the retrieved fragments they are part of, duplicate passages are dropped, and the best
+    passages are packed into the context until the token budget of the model is used. Tokens are counted locally with
+    the tokenizer of the model.
+"""
+import os, re, hashlib
+from functools import lru_cache
+import tiktoken
+
+# Maximum number of context tokens per model. The GitHub Models rate limits allow 8000 input tokens per request
+# for these models, so leave room for the system prompt and the question.
+MODEL_CONTEXT_BUDGETS = {
+    "gpt-4o-mini": 6000,
+    "gpt-4o": 6000,
+}
+DEFAULT_CONTEXT_BUDGET = 6000
+
+# Paragraphs shorter than this number of tokens are merged with the next paragraph, so headings stay with their text
+MIN_PASSAGE_TOKENS = 32
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads the encoding on first use, which fails without network access
+        print(f"[WARNING] Could not load the tokenizer for [{model}], estimating the tokens instead: {e}")
+        return None
+
+def count_tokens(text, model="gpt-4o-mini"):
+    """
+    Counts the tokens of a text with the tokenizer of the model.
+
+    Args:
+        text (str): The text to count the tokens of.
+        model (str): The name of the model, e.g. "gpt-4o-mini".
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def get_context_budget(model):
+    """
+    Gets the maximum number of context tokens for a model.
+
+    Environment Variables:
+    - CONTEXT_TOKEN_BUDGET: Overrides the token budget for the context of all models.
+
+    Args:
+        model (str): The name of the model, e.g. "gpt-4o-mini".
+
+    Returns:
+        int: The maximum number of tokens in the context.
+    """
+    if os.getenv("CONTEXT_TOKEN_BUDGET"):
+        return int(os.getenv("CONTEXT_TOKEN_BUDGET"))
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def split_passages(content, model="gpt-4o-mini"):
+    """
+    Splits the content of a blog post into passages on blank lines, merging short paragraphs with the next one.
+
+    Returns:
+        list: The passages as tuples with the text and the number of tokens.
+    """
+    passages = []
+    current, current_tokens = [], 0
+    for paragraph in re.split(r"\n\s*\n", content):
+        if not paragraph.strip():
+            continue
+        current.append(paragraph.strip("\n"))
+        current_tokens += count_tokens(paragraph, model)
+        if current_tokens >= MIN_PASSAGE_TOKENS:
+            passages.append(("\n\n".join(current), current_tokens))
+            current, current_tokens = [], 0
+    if current:
+        passages.append(("\n\n".join(current), current_tokens))
+    return passages
+
+def pack_context(documents_content, fragments, model="gpt-4o-mini", budget=None, separator="\n------\n"):
+    """
+    Packs the best passages of the documents into a context that fits the token budget.
+
+    A passage is scored with the highest score of the retrieved fragments it overlaps with. Passages without a
+    matching fragment follow, in the order of the documents (which are ordered by relevance). The packed passages
+    are put back in their original order per document, so the context stays readable.
+
+    Args:
+        documents_content (list): The content of the documents, ordered by relevance.
+        fragments (list): The fragments as returned by the retriever, with their text and score.
+        model (str): The name of the model, used for the tokenizer and the default budget.
+        budget (int): The maximum number of tokens in the context, defaults to the budget of the model.
+        separator (str): The text between the documents in the context.
+
+    Returns:
+        tuple: The packed context and a dict with the number of documents and passages, the tokens of the full
+            documents, the tokens of the packed context and the tokens saved.
+    """
+    if budget is None:
+        budget = get_context_budget(model)
+    fragment_texts = [(normalize_text(fragment.text), fragment.score or 0.0) for fragment in fragments]
+    separator_tokens = count_tokens(separator, model)
+
+    # Split the documents into passages and drop the passages we have seen before
+    candidates = []
+    seen = set()
+    total_tokens = 0
+    passage_count = 0
+    for document_index, content in enumerate(documents_content):
+        total_tokens += count_tokens(content, model) + (separator_tokens if document_index > 0 else 0)
+        for position, (text, tokens) in enumerate(split_passages(content, model)):
+            passage_count += 1
+            normalized = normalize_text(text)
+            text_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+            if text_hash in seen:
+                continue
+            seen.add(text_hash)
+            score = max(
+                [score for fragment_text, score in fragment_texts if normalized in fragment_text or fragment_text in normalized],
+                default=None,
+            )
+            candidates.append((score, document_index, position, text, tokens))
+
+    # Pack the passages with the best score first, then the rest in order of relevance of the documents
+    ranked = sorted(candidates, key=lambda candidate: (candidate[0] is None, -(candidate[0] or 0.0), candidate[1], candidate[2]))
+    selected = []
+    used_tokens = 0
+    used_documents = set()
+    for score, document_index, position, text, tokens in ranked:
+        # passages within a document are joined by a blank line, documents by the separator
+        extra_tokens = tokens + (separator_tokens if document_index not in used_documents else 2)
+        if used_tokens + extra_tokens > budget:
+            continue
+        selected.append((document_index, position, text))
+        used_tokens += extra_tokens
+        used_documents.add(document_index)
+
+    documents = {}
+    for document_index, position, text in sorted(selected):
+        documents.setdefault(document_index, []).append(text)
+    context = separator.join("\n\n".join(passages) for passages in documents.values())
+
+    context_tokens = count_tokens(context, model)
+    return context, {
+        "documents": len(documents_content),
+        "passages": passage_count,
+        "packed_passages": len(selected),
+        "duplicate_passages": passage_count - len(candidates),
+        "budget": budget,
+        "full_tokens": total_tokens,
+        "context_tokens": context_tokens,
+        "tokens_saved": max(total_tokens - context_tokens, 0),
+    }
@@ -0,0 +1,213 @@
+"""
+    Keeps the clone of the blogging repository up to date without blocking the scripts.
+
+    The repository is only cloned in the foreground when there is no clone yet. When the last fetch is older than the
+    refresh interval, `git fetch` runs on a background thread, so the scripts keep working with the blog posts that
+    are on disk while the refresh happens. The fetched changes are only merged into the working copy while nothing
+    reads the blog posts for the index: update_index holds `working_copy_lock` while it hashes and reads the blog
+    posts (not while it embeds them), and the merge waits for it. The blog posts that changed in the merge are
+    reported to the listeners, so only those need to be indexed again; a script without listeners indexes them on its
+    next run.
+
+    Environment Variables:
+    - CORPUS_REFRESH_HOURS: The number of hours after the last fetch before the repository is fetched again (default: 24).
+"""
+import os, time, shutil, subprocess, threading
+
+BLOG_REPOSITORY_URL = "https://github.com/rajbos/rajbos.github.io.git"
+POSTS_DIRECTORY = "_posts"
+
+class CorpusSync:
+    """
+    Clones and refreshes the blogging repository.
+
+    Args:
+        directory (str): The directory of the clone.
+        repository_url (str): The URL of the blogging repository.
+        refresh_hours (float): The number of hours after the last fetch before the repository is fetched again.
+    """
+    def __init__(self, directory="blog", repository_url=BLOG_REPOSITORY_URL, refresh_hours=24):
+        self.directory = directory
+        self.repository_url = repository_url
+        self.refresh_hours = refresh_hours
+        # the file names of the blog posts that were added, changed or deleted by the last refresh
+        self.changed_files = []
+        self._thread = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        # held while the working copy is merged, and by update_index while it hashes and reads the blog posts
+        self.working_copy_lock = threading.RLock()
+
+    @property
+    def posts_directory(self):
+        return f"{self.directory}/{POSTS_DIRECTORY}/"
+
+    @property
+    def refreshed_marker(self):
+        return os.path.join(self.directory, ".git", "corpus-sync-refreshed")
+
+    def last_refreshed(self):
+        """
+        Gets the time of the last complete refresh: the marker is written after every merge, a fresh clone only has
+        HEAD. A refresh that was interrupted (e.g. the script finished during the fetch) does not count, so the next
+        run refreshes again.
+
+        Returns:
+            float: The timestamp of the last refresh, or 0 when the directory is not a clone.
+        """
+        for path in [self.refreshed_marker, os.path.join(self.directory, ".git", "HEAD")]:
+            if os.path.exists(path):
+                return os.path.getmtime(path)
+        return 0
+
+    def is_stale(self):
+        return self.last_refreshed() < time.time() - self.refresh_hours * 60 * 60
+
+    def ensure(self):
+        """
+        Makes sure the blog posts are on disk: clones the repository when needed, and starts a background refresh
+        when the last fetch is too old.
+
+        Returns:
+            str: The path to the directory with the blog posts.
+        """
+        if not os.path.exists(os.path.join(self.directory, ".git")):
+            self.clone()
+        elif self.is_stale():
+            self.refresh()
+        return self.posts_directory
+
+    def clone(self):
+        """
+        Clones the repository into a temporary directory next to the directory, and renames it into place when the
+        clone is complete, so an interrupted clone does not leave a directory behind that looks like a clone.
+        """
+        if os.path.isdir(self.directory) and os.listdir(self.directory):
+            raise RuntimeError(f"The directory [{self.directory}] exists but is not a clone of the blogging repository, remove it to clone the repository again")
+        print("Cloning the blogging repository")
+        clone_directory = f"{os.path.normpath(self.directory)}.clone"
+        # the leftover of a clone that was interrupted
+        shutil.rmtree(clone_directory, ignore_errors=True)
+        try:
+            subprocess.run(["git", "clone", "--quiet", self.repository_url, clone_directory], capture_output=True, text=True, check=True)
+            if os.path.isdir(self.directory):
+                os.rmdir(self.directory)
+            os.replace(clone_directory, self.directory)
+        finally:
+            shutil.rmtree(clone_directory, ignore_errors=True)
+
+    def refresh(self):
+        """
+        Starts fetching and merging the latest changes on a background thread, if no refresh is running yet.
+        The merge waits until no index update is reading the blog posts.
+
+        The thread is a daemon thread, so a script that finishes first does not wait for the network. The merge runs
+        in a git process of its own session, which finishes the merge when the script exits (or is interrupted with
+        Ctrl+C) halfway.
+
+        Returns:
+            threading.Thread: The thread of the refresh.
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                print("Fetching the latest changes of the blogging repository in the background")
+                self._thread = threading.Thread(target=self._refresh, name="corpus-sync", daemon=True)
+                self._thread.start()
+            return self._thread
+
+    def refresh_periodically(self, check_seconds=None):
+        """
+        Keeps checking whether the last fetch is too old on a background (daemon) thread, and starts a refresh when
+        it is, for processes that keep running like the query server.
+
+        Args:
+            check_seconds (float): The number of seconds between the checks, defaults to the refresh interval (at most
+                an hour, at least a minute).
+
+        Returns:
+            threading.Thread: The thread that checks the repository.
+        """
+        check_seconds = check_seconds or max(60, min(60 * 60, self.refresh_hours * 60 * 60))
+
+        def check():
+            while True:
+                time.sleep(check_seconds)
+                try:
+                    self.ensure()
+                except (OSError, subprocess.CalledProcessError) as e:
+                    print(f"[WARNING] Checking the blogging repository for changes failed: {getattr(e, 'stderr', None) or e}")
+
+        thread = threading.Thread(target=check, name="corpus-sync-check", daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout=None):
+        """
+        Waits for the running refresh to finish.
+
+        Returns:
+            list: The file names of the blog posts that changed in the last refresh.
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.changed_files
+
+    def on_change(self, listener):
+        """
+        Registers a function that is called with the changed file names after a refresh changed blog posts.
+        The function is called on the thread of the refresh.
+        """
+        self._listeners.append(listener)
+
+    def _refresh(self):
+        startTime = time.time()
+        try:
+            self._git("fetch", "--quiet")
+            # merge at a safe point, not while an index update is reading the blog posts
+            with self.working_copy_lock:
+                old_head = self._git("rev-parse", "HEAD")
+                self._merge()
+                new_head = self._git("rev-parse", "HEAD")
+            with open(self.refreshed_marker, "w"):
+                pass
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"[WARNING] Refreshing the blogging repository failed, using the blog posts on disk: {getattr(e, 'stderr', None) or e}")
+            return
+
+        changed_files = []
+        if new_head != old_head:
+            changed_paths = self._git("diff", "--name-only", "--no-renames", old_head, new_head, "--", POSTS_DIRECTORY)
+            changed_files = sorted(os.path.basename(path) for path in changed_paths.splitlines() if path)
+        self.changed_files = changed_files
+        print(f"Refreshed the blogging repository in [{round(time.time() - startTime, 1)}] seconds, [{len(changed_files)}] blog posts changed")
+        if changed_files:
+            for listener in self._listeners:
+                listener(changed_files)
+
+    def _merge(self):
+        # not a child of the session of the script, so the merge is not interrupted with the script
+        process = subprocess.Popen(
+            ["git", "merge", "--ff-only", "--quiet", "@{upstream}"],
+            cwd=self.directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, start_new_session=True,
+        )
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, process.args, stderr=stderr)
+
+    def _git(self, *args):
+        result = subprocess.run(["git", *args], cwd=self.directory, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+
+_corpus_sync = None
+_corpus_sync_lock = threading.Lock()
+
+def get_corpus_sync():
+    """
+    Gets the corpus sync for the blogging repository of this process, configured with environment variables.
+    """
+    global _corpus_sync
+    with _corpus_sync_lock:
+        if _corpus_sync is None:
+            _corpus_sync = CorpusSync(refresh_hours=float(os.getenv("CORPUS_REFRESH_HOURS", "24")))
+    return _corpus_sync
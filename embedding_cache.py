@@ -0,0 +1,205 @@
+"""
+    Persistent cache for the embeddings, so text we have already embedded does not cost a call to GitHub Models again.
+
+    The cache is a SQLite database keyed by the embedding model and the sha256 hash of the text. The embeddings are
+    stored as float32 blobs. When the cache grows beyond the configured number of entries, the least recently used
+    embeddings are evicted.
+"""
+import os, time, sqlite3, hashlib, threading
+from array import array
+from typing import Any, List
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+class EmbeddingCache:
+    """
+    SQLite backed store for embeddings, keyed by (model, text hash).
+
+    Args:
+        path (str): The path to the SQLite database file.
+        max_entries (int): The maximum number of embeddings to keep before evicting the least recently used ones.
+    """
+    def __init__(self, path="embedding_cache.sqlite", max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " embedding BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """
+        Looks up the embeddings for a list of texts.
+
+        Args:
+            model (str): The name of the embedding model.
+            texts (list): The texts to look up.
+
+        Returns:
+            list: The embeddings in the same order as the texts, with None for the texts that are not cached.
+        """
+        hashes = [self.hash_text(text) for text in texts]
+        found = {}
+        with self._lock:
+            # stay below the SQLite limit on the number of query parameters
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found],
+                )
+                self._connection.commit()
+
+        embeddings = [found.get(text_hash) for text_hash in hashes]
+        hits = sum(1 for embedding in embeddings if embedding is not None)
+        self.hits += hits
+        self.misses += len(embeddings) - hits
+        return embeddings
+
+    def put_many(self, model, texts, embeddings):
+        """
+        Stores the embeddings for a list of texts and evicts the least recently used entries if the cache is full.
+
+        Args:
+            model (str): The name of the embedding model.
+            texts (list): The texts that were embedded.
+            embeddings (list): The embeddings in the same order as the texts.
+        """
+        now = time.time()
+        rows = [(model, self.hash_text(text), array("f", embedding).tobytes(), now) for text, embedding in zip(texts, embeddings)]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            count = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._connection.commit()
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model that answers from the EmbeddingCache and only calls the wrapped model for text that is not cached.
+
+    Query and text embeddings are cached separately, as some models embed them differently.
+
+    Args:
+        embed_model (BaseEmbedding): The embedding model to wrap, e.g. the OpenAIEmbedding from setup_local.
+        cache (EmbeddingCache): The cache to use.
+    """
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _embed_with_cache(self, kind, texts, embed_missing):
+        model = f"{self.model_name}:{kind}"
+        embeddings = self._cache.get_many(model, texts)
+        # embed every missing text only once, even when it occurs multiple times in the batch
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = embed_missing(missing)
+            self._cache.put_many(model, missing, new_embeddings)
+            new_embeddings = dict(zip(missing, new_embeddings))
+            embeddings = [new_embeddings[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    async def _aembed_with_cache(self, kind, texts, aembed_missing):
+        model = f"{self.model_name}:{kind}"
+        embeddings = self._cache.get_many(model, texts)
+        # embed every missing text only once, even when it occurs multiple times in the batch
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = await aembed_missing(missing)
+            self._cache.put_many(model, missing, new_embeddings)
+            new_embeddings = dict(zip(missing, new_embeddings))
+            embeddings = [new_embeddings[text] if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_with_cache("query", [query], lambda texts: [self._embed_model._get_query_embedding(texts[0])])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        async def embed(texts):
+            return [await self._embed_model._aget_query_embedding(texts[0])]
+        return (await self._aembed_with_cache("query", [query], embed))[0]
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeds several queries with one request to the wrapped model, for the sub-queries of a question.
+
+        The OpenAI models embed queries and texts the same way, so the queries are sent as a batch of texts. They are
+        cached as queries, so get_query_embedding finds them as well.
+        """
+        return self._embed_with_cache("query", queries, self._embed_model._get_text_embeddings)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_with_cache("text", texts, self._embed_model._get_text_embeddings)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_with_cache("text", texts, self._embed_model._aget_text_embeddings)
+
+def setup_embedding_cache(embed_model):
+    """
+    Wraps an embedding model with the persistent embedding cache.
+
+    Environment Variables:
+    - EMBEDDING_CACHE_PATH: The path to the SQLite database (default: "embedding_cache.sqlite").
+    - EMBEDDING_CACHE_MAX_ENTRIES: The maximum number of cached embeddings (default: 100000).
+
+    Args:
+        embed_model (BaseEmbedding): The embedding model to wrap.
+
+    Returns:
+        CachedEmbedding: The embedding model that uses the cache.
+    """
+    cache = EmbeddingCache(
+        path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000")),
+    )
+    return CachedEmbedding(embed_model, cache)
@@ -0,0 +1,134 @@
+"""
+    Hybrid retrieval: combines the vector search with the BM25 keyword index, using reciprocal rank fusion.
+
+    Both retrievers return a list of candidate fragments. Reciprocal rank fusion (RRF) scores every fragment with
+    `weight / (rrf_k + rank)` for each list it is in, so a fragment that ranks well in both lists ends up on top
+    without having to compare cosine similarities with BM25 scores. An optional local rerank stage rescores the
+    fused candidates with the exact similarity of their embedding and the share of question terms they contain.
+"""
+import numpy as np
+from typing import List
+from llama_index.core import Settings
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from bm25_index import BM25Index, tokenize
+
+# Loaded BM25 index per persist directory, kept in sync with the vector index by sync_bm25_index
+_bm25_indexes = {}
+
+def sync_bm25_index(index, persist_dir="blog_index"):
+    """
+    Brings the BM25 index in the persist directory up to date with the fragments in the vector index.
+
+    Fragments that were added since the BM25 index was persisted are indexed (their text is read from the
+    docstore in one batch), fragments that were removed are dropped, and the BM25 index is persisted again when
+    something changed. A BM25 index that was already loaded is not changed in place, but replaced by an updated copy.
+
+    Args:
+        index: The loaded index.
+        persist_dir (str): The path to the directory where the index is persisted.
+
+    Returns:
+        BM25Index: The BM25 index for the fragments of the index.
+    """
+    bm25_index = _bm25_indexes.get(persist_dir) or BM25Index.from_persist_dir(persist_dir)
+    node_ids = set(index.index_struct.nodes_dict)
+    added = node_ids - bm25_index.node_ids
+    removed = bm25_index.node_ids - node_ids
+    if (added or removed) and persist_dir in _bm25_indexes:
+        # the loaded BM25 index can be in use by retrievals on other threads (e.g. after a refresh in the query server), so change a copy
+        bm25_index = bm25_index.copy()
+    if added:
+        for node in index.docstore.get_nodes(sorted(added), raise_error=False):
+            bm25_index.add(node.node_id, get_keyword_text(node))
+    if removed:
+        bm25_index.remove(removed)
+    if added or removed:
+        print(f"Updated the keyword index with [{len(added)}] added and [{len(removed)}] removed fragments")
+        bm25_index.persist(persist_dir)
+    _bm25_indexes[persist_dir] = bm25_index
+    return bm25_index
+
+def get_bm25_index(index, persist_dir="blog_index"):
+    """
+    Gets the BM25 index for the index, loading and syncing it on first use.
+    """
+    if persist_dir not in _bm25_indexes:
+        return sync_bm25_index(index, persist_dir)
+    return _bm25_indexes[persist_dir]
+
+def get_keyword_text(node):
+    # the file name of a blog post has the keywords of the title in it
+    return f"{node.metadata.get('file_name', '')}\n{node.get_content(metadata_mode=MetadataMode.NONE)}"
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that fuses the vector search and the BM25 keyword search with reciprocal rank fusion.
+
+    The keyword search uses the `query_str` of the query bundle, the vector search uses the `embedding_strs`, so the
+    question can be embedded with extra instructions that would only add noise to the keyword search.
+
+    Args:
+        index: The loaded index.
+        bm25_index (BM25Index): The keyword index for the fragments of the index.
+        top_k (int): The number of fragments to return.
+        candidates (int): The number of fragments to take from each retriever before fusing.
+        vector_weight (float): The weight of the vector search in the fusion.
+        keyword_weight (float): The weight of the keyword search in the fusion.
+        rrf_k (int): Dampens the difference between the top ranks, 60 is the value from the RRF paper.
+        rerank (bool): Rescore the fused candidates locally before taking the top_k.
+        rerank_keyword_weight (float): The weight of the share of question terms in the rerank score.
+    """
+    def __init__(self, index, bm25_index, top_k=2, candidates=10, vector_weight=1.0, keyword_weight=1.0, rrf_k=60, rerank=False, rerank_keyword_weight=0.5):
+        super().__init__()
+        self._index = index
+        self._bm25_index = bm25_index
+        self._top_k = top_k
+        self._candidates = max(candidates, top_k)
+        self._vector_weight = vector_weight
+        self._keyword_weight = keyword_weight
+        self._rrf_k = rrf_k
+        self._rerank = rerank
+        self._rerank_keyword_weight = rerank_keyword_weight
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # embed the question once, for the vector search and the rerank stage
+        if query_bundle.embedding is None:
+            query_bundle.embedding = Settings.embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        vector_results = self._index.as_retriever(similarity_top_k=self._candidates).retrieve(query_bundle)
+        keyword_results = self._bm25_index.search(query_bundle.query_str, top_k=self._candidates)
+
+        # Reciprocal rank fusion of both lists
+        scores = {}
+        nodes = {result.node.node_id: result.node for result in vector_results}
+        for rank, result in enumerate(vector_results, start=1):
+            scores[result.node.node_id] = scores.get(result.node.node_id, 0.0) + self._vector_weight / (self._rrf_k + rank)
+        for rank, (node_id, _) in enumerate(keyword_results, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + self._keyword_weight / (self._rrf_k + rank)
+
+        # Load the fragments that were only found by the keyword search in one batch
+        missing = [node_id for node_id in scores if node_id not in nodes]
+        if missing:
+            nodes.update({node.node_id: node for node in self._index.docstore.get_nodes(missing, raise_error=False)})
+
+        fused = [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in scores.items() if node_id in nodes]
+        fused.sort(key=lambda result: result.score, reverse=True)
+        if self._rerank:
+            fused = self._rerank_results(query_bundle, fused[:self._candidates])
+        return fused[:self._top_k]
+
+    def _rerank_results(self, query_bundle, results):
+        """
+        Rescores the candidates with the cosine similarity of their embedding with the question, plus the share of
+        the question terms that occur in the fragment, and sorts them by the new score.
+        """
+        vector_store = self._index.vector_store
+        query = np.asarray(query_bundle.embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        query_terms = set(tokenize(query_bundle.query_str))
+        for result in results:
+            embedding = np.asarray(vector_store.get(result.node.node_id), dtype=np.float32)
+            similarity = float(embedding @ query / (np.linalg.norm(embedding) or 1.0))
+            coverage = len(query_terms.intersection(tokenize(get_keyword_text(result.node)))) / len(query_terms) if query_terms else 0.0
+            result.score = similarity + self._rerank_keyword_weight * coverage
+        return sorted(results, key=lambda result: result.score, reverse=True)
@@ -0,0 +1,160 @@
+"""
+    Building blocks for fast index builds: loading and splitting files on a process pool, and embedding the
+    fragments with concurrent requests.
+
+    The embedding requests are sent in waves of concurrent batches. After every wave, the batch size and the
+    concurrency are adapted to the rate limits: they grow while the calls succeed and the `x-ratelimit-*` headers
+    show enough remaining requests and tokens, and they are halved with a backoff when GitHub Models answers with
+    a 429 (Too Many Requests).
+"""
+import os, time, contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import openai
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.schema import MetadataMode
+from rate_limits import rate_limit_tracker
+
+def get_num_workers():
+    """
+    Gets the number of processes for loading and splitting the files.
+
+    Environment Variables:
+    - INDEX_WORKERS: The number of processes (default: the number of CPUs). Set to 1 to load on the main process.
+    """
+    return int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 1)))
+
+def load_and_split(input_files, num_workers=None):
+    """
+    Loads the files and splits them into fragments with the transformations from the Settings.
+
+    Both steps run on a process pool when there are enough files to make starting the processes worth it.
+
+    Args:
+        input_files (list): The paths to the files to load.
+        num_workers (int): The number of processes, defaults to get_num_workers().
+
+    Returns:
+        tuple: The loaded documents and the fragments (nodes) they are split into.
+    """
+    if num_workers is None:
+        num_workers = get_num_workers()
+    # starting a process costs more than loading a few files
+    if len(input_files) < 4 * num_workers:
+        num_workers = None
+
+    documents = SimpleDirectoryReader(input_files=input_files, filename_as_id=True).load_data(num_workers=num_workers)
+    pipeline = IngestionPipeline(transformations=Settings.transformations)
+    nodes = pipeline.run(documents=documents, num_workers=num_workers)
+    return documents, nodes
+
+class AdaptiveEmbedder:
+    """
+    Embeds fragments with concurrent batches, adapting the batch size and concurrency to the rate limits.
+
+    Environment Variables:
+    - EMBED_BATCH_SIZE: The number of fragments per request to start with (default: the batch size of the model).
+    - EMBED_MAX_BATCH_SIZE: The maximum number of fragments per request (default: 512).
+    - EMBED_CONCURRENCY: The number of concurrent requests to start with (default: 4).
+    - EMBED_MAX_CONCURRENCY: The maximum number of concurrent requests (default: 16).
+
+    Args:
+        embed_model (BaseEmbedding): The embedding model, e.g. Settings.embed_model.
+        tracker (RateLimitTracker): The tracker with the rate limit headers of the embedding calls.
+    """
+    def __init__(self, embed_model, tracker=rate_limit_tracker):
+        self.embed_model = embed_model
+        self.tracker = tracker
+        self.max_batch_size = int(os.getenv("EMBED_MAX_BATCH_SIZE", "512"))
+        self.max_concurrency = int(os.getenv("EMBED_MAX_CONCURRENCY", "16"))
+        self.batch_size = min(int(os.getenv("EMBED_BATCH_SIZE", str(embed_model.embed_batch_size))), self.max_batch_size)
+        self.concurrency = min(int(os.getenv("EMBED_CONCURRENCY", "4")), self.max_concurrency)
+        self.backoff_seconds = 1.0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def embed_nodes(self, nodes):
+        """
+        Sets the embedding of every fragment that does not have one yet.
+
+        Args:
+            nodes (list): The fragments to embed.
+        """
+        nodes = [node for node in nodes if node.embedding is None]
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        position = 0
+        retries = deque()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while position < len(texts) or retries:
+                # Take the batches for this wave, the batches that failed first
+                wave = []
+                while len(wave) < self.concurrency and (retries or position < len(texts)):
+                    if retries:
+                        wave.append(retries.popleft())
+                    else:
+                        end = min(position + self.batch_size, len(texts))
+                        wave.append((position, end))
+                        position = end
+
+                rate_limited_before = self.tracker.get(self.embed_model.model_name).get("rate_limited", 0)
+                # run the batches in the context of the caller, so they keep its request priority
+                futures = [(start, end, executor.submit(contextvars.copy_context().run, self._embed_batch, texts[start:end])) for start, end in wave]
+                failed = []
+                rate_limited = False
+                for start, end, future in futures:
+                    try:
+                        for node, embedding in zip(nodes[start:end], future.result()):
+                            node.embedding = embedding
+                    except openai.RateLimitError:
+                        failed.append((start, end))
+                        rate_limited = True
+                    except openai.BadRequestError:
+                        # the batch has more tokens than a request allows, retry it in smaller batches
+                        if end - start == 1:
+                            raise
+                        failed.append((start, end))
+                self.requests += len(wave)
+
+                limits = self.tracker.get(self.embed_model.model_name)
+                # the OpenAI client retries a 429 itself, so also check the responses the tracker has seen
+                rate_limited = rate_limited or limits.get("rate_limited", 0) > rate_limited_before
+                if failed or rate_limited:
+                    self._slow_down(failed, retries, limits, rate_limited)
+                else:
+                    self._speed_up(limits, texts[position:position + self.batch_size * self.concurrency])
+
+    def _embed_batch(self, texts):
+        # one request per batch: get_text_embedding_batch would split it again by the embed_batch_size of the model
+        return self.embed_model._get_text_embeddings(texts)
+
+    def _slow_down(self, failed, retries, limits, rate_limited):
+        self.batch_size = max(1, self.batch_size // 2)
+        # retry the failed batches in halves, so they fit the smaller batch size
+        for start, end in failed:
+            middle = start + max(1, (end - start) // 2)
+            retries.append((start, middle))
+            if middle < end:
+                retries.append((middle, end))
+        if not rate_limited:
+            return
+        self.rate_limited += 1
+        self.concurrency = max(1, self.concurrency // 2)
+        wait = limits.get("retry_after") or self.backoff_seconds
+        print(f"[WARNING] Rate limited while embedding, waiting [{wait}] seconds and continuing with batches of [{self.batch_size}] and a concurrency of [{self.concurrency}]")
+        time.sleep(wait)
+        self.backoff_seconds = min(self.backoff_seconds * 2, 60)
+
+    def _speed_up(self, limits, next_texts):
+        self.backoff_seconds = 1.0
+        remaining_requests = limits.get("remaining_requests")
+        remaining_tokens = limits.get("remaining_tokens")
+        # estimate about 4 characters per token for the next wave
+        next_tokens = sum(len(text) for text in next_texts) // 4
+        if remaining_requests is not None and remaining_requests < 2 * self.concurrency:
+            self.concurrency = max(1, remaining_requests // 2)
+        elif remaining_tokens is not None and remaining_tokens < 2 * next_tokens:
+            self.batch_size = max(1, self.batch_size // 2)
+        else:
+            self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+            self.batch_size = min(self.batch_size * 2, self.max_batch_size)
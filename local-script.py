@@ -1,5 +1,5 @@
-import sys, requests, time, os, json
-from utils import call_model_with_context, get_documents, setup_local, get_blogging_directory, get_index, log_duration, parse_blog_header_date, convert_filename_to_url, get_github_rate_limit
+import sys
+from utils import answer_question, print_answer_cache_stats, setup_local, get_blogging_directory, get_index, get_github_rate_limit
 
 # Main script
 if __name__ == "__main__":
@@ -10,53 +10,44 @@ if __name__ == "__main__":
     The script is going to use the following command line parameters:
     - The question to be answered, e.g. python script.py "How can you use GitHub Actions with security in mind?"
     - A flag to run with the entire content of the documents, e.g. python script.py "How can you use GitHub Actions with security in mind?" True
+    - Optional: --stream to print the answer while it is generated, e.g. python script.py "How can you use GitHub Actions with security in mind?" --stream
     """
 
+    # print the answer while it is generated when the --stream flag is given
+    stream = "--stream" in sys.argv
+    arguments = [argument for argument in sys.argv if argument != "--stream"]
+
     # read the user prompt from the command line parameters
     default_user_prompt = "How can you use GitHub Actions with security in mind?"
-    user_prompt = sys.argv[1] if len(sys.argv) > 1 else default_user_prompt
+    user_prompt = arguments[1] if len(arguments) > 1 else default_user_prompt
     # prevent issue when the user prompt is not given, but only the flag
     if user_prompt == "True":
         user_prompt = default_user_prompt
     # if there is a second argument, we are going to run with the entire content of the documents instead of the fragments
-    run_with_documents = len(sys.argv) > 2
+    run_with_documents = len(arguments) > 2
 
     # Set up the environment and initialize the models
     setup_local()
 
-    # Check the current rate limit of using GitHub Models
-    start_remaining_tokens, start_remaining_requests = get_github_rate_limit()
-
     # Get the blogging directory
     blogging_directory = get_blogging_directory()
 
     # Get the index
     index = get_index(blogging_directory)
 
-    startTime = time.time()
-    
-    # Get the retriever from the index
-    retriever = index.as_retriever()
+    # Answer the question: from the cache when this question, or a very similar one, was answered before with the
+    # same index, otherwise with retrieval and a model call that prints the answer
     print()
-
-    # Retrieve the fragments that match the question
-    fragments = retriever.retrieve(f"Find the documentens that answer the question: {user_prompt}")
-    log_duration(startTime, "Retrieval")
-
-    # Get the documents that contain the fragments
-    documents_content = get_documents(fragments, index, blogging_directory)
-
-    if run_with_documents:
-        # Join the documents_content list into a single string
-        documents_content_str = "\n------\n".join(documents_content)
-        call_model_with_context(user_prompt, documents_content_str, "and the context in all file content", "Model call")
-    else:
-        # Join the fragments into a single context string
-        context = "\n------\n".join([ fragment.text for fragment in fragments ])
-        call_model_with_context(user_prompt, context, "and the context in all fragments", "Model call")
-    
-    # Check the remaining rate limits
-    remaining_tokens, remaining_requests = get_github_rate_limit()
-    # show the used tokens and requests
-    print(f"Total tokens used: {start_remaining_tokens - remaining_tokens}")
-    print(f"Total requests used: {start_remaining_requests - remaining_requests}")
+    result = answer_question(index, blogging_directory, user_prompt, run_with_documents=run_with_documents, stream=stream)
+    if result.get("cache_hit"):
+        for line in result["answer"].splitlines():
+            print(f"\t{line}")
+        print()
+        for citation in result["citations"]:
+            print(f"\t- File: [{citation['file_name']}] which leads to [{citation['url']}]")
+        print()
+
+    # Check the remaining rate limits, from the headers of the calls we made
+    get_github_rate_limit("gpt-4o-mini")
+    get_github_rate_limit("text-embedding-3-small")
+    print_answer_cache_stats()
\ No newline at end of file
@@ -0,0 +1,400 @@
+"""
+    Sets up the models of GitHub Models, and builds, loads and updates the local index with the blog posts.
+
+    The index is persisted in the blog_index directory, next to a manifest with the content hash of every blog post,
+    so only the blog posts that changed are embedded again.
+"""
+import os, time, dotenv, logging, sys, hashlib, json
+from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.core import VectorStoreIndex
+from llama_index.core import Settings
+from llama_index.core import StorageContext
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core import load_index_from_storage
+from embedding_cache import setup_embedding_cache
+from mmap_vector_store import MmapVectorStore
+from compressed_docstore import CompressedDocumentStore
+from rate_limits import rate_limit_tracker
+from rate_scheduler import get_rate_limit_scheduler, request_priority, BACKGROUND
+from index_builder import load_and_split, AdaptiveEmbedder
+from hybrid_retrieval import sync_bm25_index
+from blog_files import get_file_hashes, show_files_in_directory
+from corpus_sync import get_corpus_sync
+from tracing import traced, set_attributes, log_duration
+
+@traced("setup")
+def setup_local():
+    """
+    Sets up the environment and initializes the necessary models and logging.
+
+    This function performs the following steps:
+    1. Loads environment variables from a .env file.
+    2. Checks if the `GITHUB_TOKEN` environment variable is set and raises a `ValueError` if not.
+    3. Sets the `OPENAI_API_KEY` environment variable to the value of `GITHUB_TOKEN`.
+    4. Sets the `OPENAI_BASE_URL` environment variable to the Azure inference URL, or the `GITHUB_MODELS_ENDPOINT` when set
+       (e.g. the stub server from the benchmarks).
+    5. Configures logging to output to standard output with an INFO level by default.
+    6. Initializes the OpenAI language model (`llm`) and embedding model (`embed_model`) with the specified API key and base URL,
+       using HTTP clients that record the rate limit headers of every response, and that hold back the requests
+       with the shared rate limit scheduler before the limits are hit (see rate_scheduler.py).
+    7. Wraps the embedding model with the persistent embedding cache, so text that was embedded before is not sent again.
+    8. Assigns the initialized models to the `Settings` class attributes `llm` and `embed_model`.
+
+    Raises:
+        ValueError: If the `GITHUB_TOKEN` environment variable is not set.
+    """
+    # Load the environment variables
+    dotenv.load_dotenv()
+
+    # Check if the GITHUB_TOKEN is set
+    if not os.getenv("GITHUB_TOKEN"):
+        raise ValueError("GITHUB_TOKEN is not set")
+
+    # Set the OPENAI_API_KEY to the GITHUB_TOKEN
+    os.environ["OPENAI_API_KEY"] = os.getenv("GITHUB_TOKEN")
+    os.environ["OPENAI_BASE_URL"] = os.getenv("GITHUB_MODELS_ENDPOINT", "https://models.inference.ai.azure.com/")
+
+    # Set up the logging
+    logging.basicConfig(
+        stream=sys.stdout, level=logging.INFO
+    )  # change the logging.DEBUG for more verbose output
+    logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
+
+    # Both models share the scheduler that holds back the requests before the rate limits are hit
+    scheduler = get_rate_limit_scheduler()
+
+    # Set up the LLM model configuration to use
+    llm = OpenAI(   
+        model="gpt-4o-mini",     
+        api_key=os.getenv("OPENAI_API_KEY"),
+        api_base=os.getenv("OPENAI_BASE_URL"),
+        http_client=rate_limit_tracker.http_client(scheduler=scheduler),
+        async_http_client=rate_limit_tracker.async_http_client(scheduler=scheduler),
+    )
+
+    # Set up the embedding model configuration to use
+    embed_model = OpenAIEmbedding(
+        model="text-embedding-3-small",
+        api_key=os.getenv("OPENAI_API_KEY"),
+        api_base=os.getenv("OPENAI_BASE_URL"),
+        http_client=rate_limit_tracker.http_client(scheduler=scheduler),
+        async_http_client=rate_limit_tracker.async_http_client(scheduler=scheduler),
+    )
+
+    Settings.llm = llm
+    Settings.embed_model = setup_embedding_cache(embed_model)
+
+def get_github_rate_limit(model="gpt-4o-mini"):
+    """
+    Shows the rate limit information for a model from GitHub Models.
+
+    The information is read from the `x-ratelimit-*` headers of the calls that were already made to the model,
+    so checking the rate limit does not send an extra request. Before the first call to the model, the
+    remaining tokens and requests are unknown. The used tokens and requests are the limit minus the remaining
+    values, so they include the calls of other processes in the same rate limit window.
+
+    Args:
+        model (str): The name of the model, e.g. "gpt-4o-mini" or "text-embedding-3-small".
+
+    Returns:
+        tuple: The remaining tokens and remaining requests, or None for values that are not known yet.
+    """
+    limits = rate_limit_tracker.get(model)
+    remaining_tokens = limits.get("remaining_tokens")
+    remaining_requests = limits.get("remaining_requests")
+    print(f"Ratelimit for [{model}] after [{limits.get('requests_sent', 0)}] requests from this process:")
+    print(f"Ratelimit remaining tokens: {remaining_tokens}")
+    print(f"Ratelimit remaining requests: {remaining_requests}")
+    # show the used tokens and requests
+    if remaining_tokens is not None and limits.get("limit_tokens") is not None:
+        print(f"Total tokens used: {limits['limit_tokens'] - remaining_tokens} of {limits['limit_tokens']}")
+    if remaining_requests is not None and limits.get("limit_requests") is not None:
+        print(f"Total requests used: {limits['limit_requests'] - remaining_requests} of {limits['limit_requests']}")
+    scheduler = get_rate_limit_scheduler()
+    if scheduler is not None:
+        stats = scheduler.stats(model)
+        if stats.get("waited_requests"):
+            print(f"Held back [{stats['waited_requests']}/{stats['requests']}] requests for [{stats['waited_seconds']}] seconds to stay within the rate limit")
+
+    return remaining_tokens, remaining_requests
+
+@traced("index.load")
+def get_index(blogging_directory): 
+    """
+    Generates or loads an index from a specified blogging directory.
+
+    This function checks if a persistent directory for the index exists. If it does not exist,
+    it loads data from the specified blogging directory, creates a new index, and persists it.
+    If the persistent directory exists, it rebuilds the storage context from the directory
+    (with the embeddings memory-mapped from a binary file), loads the index from storage and brings it up to date with the files in the blogging directory.
+    A manifest with the content hash of each file is kept next to the index, so only added,
+    changed or deleted blog posts are embedded, inserted or removed.
+    The text of the fragments is stored compressed in the docstore and only decompressed for the retrieved fragments,
+    and the embeddings can be searched quantized (see configure_quantization).
+
+    Environment Variables:
+    - DOCSTORE_COMPRESSION: Set to "off" to store the text of new fragments uncompressed (default: on).
+
+    A new index is built with the same incremental update: the files are loaded and split on a process pool and
+    embedded with concurrent requests, and the index is persisted after every group of files. When a build is
+    interrupted, the next run continues with the files that are not in the index yet.
+
+    Args:
+        blogging_directory (str): The path to the directory containing blog posts.
+
+    Returns:
+        index: The generated or loaded index.
+    """
+    persist_dir="blog_index"
+    compress_docstore = os.getenv("DOCSTORE_COMPRESSION", "on").lower() != "off"
+    if not os.path.exists(persist_dir):
+        print("Loading the data from the blogposts and create the index")
+        startTime = time.time()
+        vector_store = MmapVectorStore()
+        configure_ann(vector_store)
+        configure_quantization(vector_store)
+        storage_context = StorageContext.from_defaults(
+            docstore=CompressedDocumentStore(compress=compress_docstore),
+            vector_store=vector_store,
+        )
+        # Start with an empty index, so the blog posts are added in groups that are persisted one by one
+        index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+        index.storage_context.persist(persist_dir)
+        save_manifest(persist_dir, {"files": {}})
+        update_index(index, blogging_directory, persist_dir)
+        log_duration(startTime, "Indexing")
+
+        # show the number and size of the files in the persist_dir
+        show_files_in_directory(persist_dir, "files in the persist directory")
+    else:
+        print("Rebuilding storage context from directory")
+        startTime = time.time()
+        vector_store = MmapVectorStore.from_persist_dir(persist_dir)
+        configure_ann(vector_store)
+        configure_quantization(vector_store)
+        storage_context = StorageContext.from_defaults(
+            docstore=CompressedDocumentStore.from_persist_dir(persist_dir, compress=compress_docstore),
+            vector_store=vector_store,
+            index_store=SimpleIndexStore.from_persist_dir(persist_dir),
+        )
+        index = load_index_from_storage(storage_context)
+        log_duration(startTime, "Rebuilding storage context")
+
+        # Only embed the blog posts that changed since the index was persisted
+        update_index(index, blogging_directory, persist_dir)
+
+        # show the number and size of the files in the persist_dir
+        show_files_in_directory(persist_dir, "files in the persist directory")
+
+    # Keep the keyword index for the hybrid retrieval in sync with the fragments in the index, otherwise it is synced
+    # when it is first used
+    if os.getenv("RETRIEVAL_MODE", "vector").lower() == "hybrid":
+        sync_bm25_index(index, persist_dir)
+    set_attributes(fragments=len(index.index_struct.nodes_dict))
+    return index
+
+def configure_ann(vector_store):
+    """
+    Enables the approximate nearest neighbour search on the vector store when configured.
+
+    Environment Variables:
+    - ANN_INDEX: Set to "ivf" to use the IVF index for retrieval instead of exact search (default: exact search).
+    - ANN_LISTS: The number of IVF lists (default: about the square root of the number of fragments).
+    - ANN_PROBES: The number of IVF lists to search per query (default: 8).
+
+    Args:
+        vector_store (MmapVectorStore): The vector store of the index.
+    """
+    if os.getenv("ANN_INDEX", "").lower() != "ivf":
+        return
+    n_lists = int(os.getenv("ANN_LISTS")) if os.getenv("ANN_LISTS") else None
+    n_probe = int(os.getenv("ANN_PROBES", "8"))
+    print(f"Using the IVF index for retrieval with [{n_lists or 'default'}] lists and [{n_probe}] probes")
+    vector_store.enable_ann(n_lists=n_lists, n_probe=n_probe)
+
+def configure_quantization(vector_store):
+    """
+    Enables searching the quantized embeddings on the vector store when configured.
+
+    Environment Variables:
+    - VECTOR_QUANTIZATION: Set to "float16" or "int8" to search a quantized copy of the embeddings (default: float32).
+    - VECTOR_RESCORE: The number of candidates per result that are rescored with the float32 embeddings, 0 to use
+      the quantized scores (default: 4).
+
+    Args:
+        vector_store (MmapVectorStore): The vector store of the index.
+    """
+    dtype = os.getenv("VECTOR_QUANTIZATION", "").lower()
+    if dtype in ("", "off", "float32"):
+        return
+    rescore = int(os.getenv("VECTOR_RESCORE", "4"))
+    print(f"Searching the [{dtype}] embeddings, rescoring [{rescore}] candidates per result")
+    vector_store.enable_quantization(dtype, rescore=rescore)
+
+def get_index_version(persist_dir="blog_index"):
+    """
+    Gets a version of the index that changes whenever documents are added, changed or removed.
+
+    Args:
+        persist_dir (str): The path to the directory where the index is persisted.
+
+    Returns:
+        str: A short hash of the manifest of the index, or "none" when the index has no manifest yet.
+    """
+    manifest_path = os.path.join(persist_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return "none"
+    with open(manifest_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+def load_manifest(persist_dir):
+    """
+    Loads the manifest with the file hashes and document ids that are stored in the index.
+
+    Args:
+        persist_dir (str): The path to the directory where the index is persisted.
+
+    Returns:
+        dict: The manifest, or None if the index was persisted without a manifest.
+    """
+    manifest_path = os.path.join(persist_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+def save_manifest(persist_dir, manifest):
+    """
+    Saves the manifest next to the persisted index.
+
+    Args:
+        persist_dir (str): The path to the directory where the index is persisted.
+        manifest (dict): The manifest to save.
+    """
+    # write to a temporary file first, so an interrupted run never leaves a half written manifest
+    manifest_path = os.path.join(persist_dir, "manifest.json")
+    with open(manifest_path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def add_documents_to_manifest(manifest, documents, file_hashes):
+    """
+    Records the document ids of the loaded documents in the manifest, together with the hash of their file.
+
+    Args:
+        manifest (dict): The manifest to update.
+        documents (list): The documents as loaded by the SimpleDirectoryReader.
+        file_hashes (dict): The file hashes as returned by get_file_hashes.
+    """
+    for document in documents:
+        file_name = document.metadata.get("file_name")
+        entry = manifest["files"].setdefault(file_name, {"hash": file_hashes.get(file_name), "doc_ids": []})
+        entry["hash"] = file_hashes.get(file_name)
+        entry["doc_ids"].append(document.doc_id)
+
+def build_manifest_from_index(index, file_hashes):
+    """
+    Creates a manifest for an index that was persisted before manifests were introduced.
+
+    The documents in the index are assumed to match the current content of their files, so they are
+    not embedded again. Files that are not in the index yet are left out of the manifest and will be
+    added, documents of files that no longer exist are kept in the manifest and will be removed.
+
+    Args:
+        index: The loaded index.
+        file_hashes (dict): The file hashes as returned by get_file_hashes.
+
+    Returns:
+        dict: The manifest for the index.
+    """
+    manifest = {"files": {}}
+    for doc_id, ref_doc_info in index.ref_doc_info.items():
+        file_name = ref_doc_info.metadata.get("file_name")
+        entry = manifest["files"].setdefault(file_name, {"hash": file_hashes.get(file_name), "doc_ids": []})
+        entry["doc_ids"].append(doc_id)
+    return manifest
+
+@traced("index.update")
+def update_index(index, blogging_directory, persist_dir):
+    """
+    Brings the index up to date with the files in the blogging directory.
+
+    The content hash of each file is compared with the manifest that was stored with the index.
+    Documents of deleted or changed files are removed from the index, and only added or changed
+    files are loaded and embedded. The index and manifest are persisted again when something changed.
+
+    The clone of the blogging repository is not merged while the files are hashed and read (see corpus_sync.py), so
+    the index and manifest never see a half merged set of blog posts. The merge can happen while a group is embedded:
+    the files of every group are hashed again when they are read, and the manifest records the hash of the content
+    that was indexed, so the blog posts that the merge changed are indexed on the next update.
+
+    Added and changed files are processed in groups: each group is loaded and split on a process pool, embedded
+    with concurrent requests and persisted together with the manifest, so an interrupted run resumes with the
+    next group. Embeddings of groups that were not persisted are still in the embedding cache.
+
+    Environment Variables:
+    - INDEX_GROUP_SIZE: The number of files to process before persisting the index (default: 100).
+
+    Args:
+        index: The loaded index.
+        blogging_directory (str): The path to the directory containing blog posts.
+        persist_dir (str): The path to the directory where the index is persisted.
+
+    Returns:
+        tuple: The lists of added, changed and deleted file names.
+    """
+    startTime = time.time()
+    # the blog posts must not change while they are read, so the background refresh of the clone waits with merging
+    with get_corpus_sync().working_copy_lock:
+        file_hashes = get_file_hashes(blogging_directory)
+    manifest = load_manifest(persist_dir)
+    if manifest is None:
+        print("No manifest found for the index, creating one from the indexed documents")
+        manifest = build_manifest_from_index(index, file_hashes)
+
+    indexed_files = manifest["files"]
+    added = sorted(name for name in file_hashes if name not in indexed_files)
+    changed = sorted(name for name in file_hashes if name in indexed_files and indexed_files[name]["hash"] != file_hashes[name])
+    deleted = sorted(name for name in indexed_files if name not in file_hashes)
+    print(f"Found [{len(added)}] added, [{len(changed)}] changed and [{len(deleted)}] deleted files since the last indexing run")
+    set_attributes(added=len(added), changed=len(changed), deleted=len(deleted))
+
+    # Remove the documents of the files that are gone or will be embedded again
+    for file_name in changed + deleted:
+        for doc_id in indexed_files.pop(file_name)["doc_ids"]:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+    # Embed and insert the new content, persisting the progress after every group of files
+    if added or changed:
+        file_names = added + changed
+        group_size = int(os.getenv("INDEX_GROUP_SIZE", "100"))
+        embedder = AdaptiveEmbedder(Settings.embed_model)
+        for start in range(0, len(file_names), group_size):
+            groupTime = time.time()
+            # only hold off the merge while the files of the group are read, not while they are embedded
+            with get_corpus_sync().working_copy_lock:
+                # a merge between the groups can have changed or deleted files, so hash the content that is loaded
+                group_hashes = get_file_hashes(blogging_directory, file_names[start:start + group_size])
+                input_files = [os.path.join(blogging_directory, file_name) for file_name in group_hashes]
+                documents, nodes = load_and_split(input_files) if input_files else ([], [])
+            # the questions that are answered meanwhile (e.g. by the query server) go first
+            with request_priority(BACKGROUND):
+                embedder.embed_nodes(nodes)
+            for document in documents:
+                # a run that was interrupted after persisting the index, but before saving the manifest, left this document behind
+                if index.docstore.get_ref_doc_info(document.doc_id) is not None:
+                    index.delete_ref_doc(document.doc_id, delete_from_docstore=True)
+                index.docstore.set_document_hash(document.doc_id, document.hash)
+            index.insert_nodes(nodes)
+            add_documents_to_manifest(manifest, documents, group_hashes)
+            index.storage_context.persist(persist_dir)
+            save_manifest(persist_dir, manifest)
+            log_duration(groupTime, f"Indexing [{min(start + group_size, len(file_names))}/{len(file_names)}] files with [{len(nodes)}] fragments (batch size [{embedder.batch_size}], concurrency [{embedder.concurrency}])")
+
+    if added or changed or deleted or not os.path.exists(os.path.join(persist_dir, "manifest.json")):
+        index.storage_context.persist(persist_dir)
+        save_manifest(persist_dir, manifest)
+        log_duration(startTime, "Updating the index")
+
+    return added, changed, deleted
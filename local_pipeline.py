@@ -0,0 +1,342 @@
+"""
+    Answers questions with the local index: retrieving the fragments, loading the blog posts, assembling the context
+    and calling the model, with the answers cached in the answer cache.
+"""
+import os, time
+from llama_index.core import Settings
+from llama_index.core.llms import ChatMessage
+from llama_index.core.schema import QueryBundle
+from answer_cache import lookup_answer, store_answer
+from blog_files import read_blog_post, convert_filename_to_url
+from context_packing import pack_context, get_context_budget
+from hybrid_retrieval import HybridRetriever, get_bm25_index
+from query_fanout import FanoutRetriever, split_question, split_question_with_model
+from local_index import get_index_version
+from tracing import span, traced, set_attributes, log_duration
+
+# The text that is embedded for the vector search of a question
+RETRIEVAL_INSTRUCTION = "Find the documentens that answer the question: {question}"
+
+@traced("documents.fetch")
+def get_documents(fragments, index, blogging_directory):
+    """
+    Loads the content of the blog posts that contain the fragments.
+
+    The fragments returned by the retriever already hold their node with the metadata, so only the fragments
+    without a file name are looked up in the docstore, in one batched call. The content of each blog post is read
+    through the document cache, so files that did not change are not read and parsed again.
+
+    Args:
+        fragments (list): The fragments as returned by the retriever.
+        index: The loaded index.
+        blogging_directory (str): The path to the directory containing blog posts.
+
+    Returns:
+        list: The content of every blog post that contains one of the fragments, ordered by the best fragment score.
+    """
+    # Resolve the fragments to their file names
+    missing_node_ids = [fragment.node_id for fragment in fragments if not fragment.node.metadata.get("file_name")]
+    docstore_nodes = {}
+    if missing_node_ids:
+        docstore_nodes = {node.node_id: node for node in index.storage_context.docstore.get_nodes(missing_node_ids, raise_error=False)}
+
+    documents = []
+    for fragment in fragments:
+        node = docstore_nodes.get(fragment.node_id, fragment.node)
+        file_name = node.metadata.get("file_name")
+        if file_name:
+            print(f"> Document with [{fragment.node_id}] was found in file [{file_name}]. Fragment relevance score: {round(fragment.score, 2)}")
+            #print(f"> Fragment content: {fragment.text}")
+            documents.append(file_name)
+        else:
+            print(f"[ERROR] Document with {fragment.node_id} was not found")
+
+    # Deduplicate the documents, keeping the order of relevance
+    documents = list(dict.fromkeys(documents))
+    print()
+    print(f"Found [{len(documents)}] documents that match the question:")
+
+    # Load the content of the documents
+    documents_content = []
+    for document in documents:
+        blog_post = read_blog_post(f"{blogging_directory}{document}")
+        # check if the file exists to prevent errors
+        if blog_post is None:
+            print(f"- [ERROR] File [{blogging_directory}{document}] does not exist")
+            continue
+
+        content, date = blog_post
+        documents_content.append(content)
+
+        # Load the information from the content to show a reference
+        url = convert_filename_to_url(document, date, "https://devopsjournal.io/blog") if date else None
+        print(f"\t- File: [{blogging_directory}{document}] which leads to [{url}]")
+
+    set_attributes(fragments=len(fragments), documents=len(documents_content))
+    return documents_content
+
+@traced("prompt.assemble")
+def build_documents_context(fragments, documents_content):
+    """
+    Packs the best passages of the documents into a context that fits the token budget of the model.
+
+    Args:
+        fragments (list): The fragments as returned by the retriever, used to rank the passages.
+        documents_content (list): The content of the documents, ordered by relevance.
+
+    Returns:
+        tuple: The context for the model and the token statistics, see context_packing.pack_context.
+    """
+    context, context_stats = pack_context(documents_content, fragments, model=Settings.llm.model)
+    set_attributes(context_bytes=len(context.encode("utf-8")), context_tokens=context_stats["context_tokens"], tokens_saved=context_stats["tokens_saved"])
+    print(f"Packed [{context_stats['packed_passages']}/{context_stats['passages']}] passages from [{context_stats['documents']}] documents into [{context_stats['context_tokens']}] tokens (budget [{context_stats['budget']}]), saved [{context_stats['tokens_saved']}] of [{context_stats['full_tokens']}] tokens")
+    return context, context_stats
+
+@traced("model.call")
+def call_model_with_context(user_prompt, context, prompt_log_message, log_duration_message, stream=False):
+    """
+    Calls the model with the user prompt and the context data, and prints the answer.
+
+    Args:
+        user_prompt (str): The question of the user.
+        context (str): The context data to answer the question with.
+        prompt_log_message (str): Describes the context in the log, e.g. "and the context in all fragments".
+        log_duration_message (str): The message for logging the duration of the model call.
+        stream (bool): Print the answer while the tokens arrive, and log the time to the first token separately.
+
+    Returns:
+        ChatResponse: The response of the model, with the answer and the token usage in `additional_kwargs`.
+    """
+    print()
+    startTime = time.time()
+    
+    # Prepare the prompt messages with the context data
+    messages = [
+        ChatMessage(role="system", content="You are a helpful assistant that answers some questions with the help of some context data.\n\nHere is the context data:\n\n" + context),
+        ChatMessage(role="user", content=user_prompt)
+    ]
+
+    print(f"Calling the model with the following prompt: [{user_prompt}] {prompt_log_message}")
+    if stream:
+        response = stream_model_response(messages, startTime, log_duration_message)
+    else:
+        response = Settings.llm.chat(messages)
+        print()
+        for line in response.message.content.splitlines():
+            print(f"\t{line}")
+    print()
+    ratelimit_info = response.additional_kwargs
+    print(f"{ratelimit_info.get('total_tokens')} tokens used")
+    set_attributes(
+        model=Settings.llm.model,
+        stream=stream,
+        context_bytes=len(context.encode("utf-8")),
+        prompt_tokens=ratelimit_info.get("prompt_tokens"),
+        completion_tokens=ratelimit_info.get("completion_tokens"),
+    )
+    log_duration(startTime, log_duration_message)
+    return response
+
+def stream_model_response(messages, startTime, log_duration_message):
+    """
+    Streams the answer of the model and prints the tokens as they arrive.
+
+    Args:
+        messages (list): The chat messages to send to the model.
+        startTime (float): The start time of the model call, to log the time to the first token.
+        log_duration_message (str): The message for logging the duration of the model call.
+
+    Returns:
+        ChatResponse: The last streamed response, with the full answer and the token usage.
+    """
+    response = None
+    first_token = True
+    # ask for the token usage, that is sent in a final chunk without content
+    for response in Settings.llm.stream_chat(messages, stream_options={"include_usage": True}):
+        if not response.delta:
+            continue
+        if first_token:
+            print()
+            set_attributes(time_to_first_token_ms=log_duration(startTime, f"{log_duration_message} time to first token"))
+            print("\t", end="")
+            first_token = False
+        print(response.delta.replace("\n", "\n\t"), end="", flush=True)
+    print()
+    return response
+
+def get_query_bundle(user_prompt):
+    # the instruction helps the vector search, the keyword search only uses the question itself
+    return QueryBundle(query_str=user_prompt, custom_embedding_strs=[RETRIEVAL_INSTRUCTION.format(question=user_prompt)])
+
+@traced("retrieval")
+def retrieve_fragments(index, user_prompt, query_bundle=None):
+    """
+    Retrieves the fragments from the index that match the question.
+
+    By default the fragments are found with the vector search. With RETRIEVAL_MODE=hybrid the vector search is
+    combined with the BM25 keyword index (see hybrid_retrieval.py), so questions with exact terms like action names
+    or CLI flags find the fragments that contain them. With RETRIEVAL_FANOUT, a
+    compound question is split into sub-queries that are searched in parallel (see query_fanout.py), and the
+    fragments of all sub-queries are returned.
+
+    Environment Variables:
+    - RETRIEVAL_MODE: "vector" for the vector search only, or "hybrid" for vector and keyword search (default: "vector").
+    - RETRIEVAL_TOP_K: The number of fragments to retrieve (default: 2), per sub-query with RETRIEVAL_FANOUT.
+    - RETRIEVAL_CANDIDATES: The number of candidates to take from each retriever before fusing them (default: 10).
+    - HYBRID_VECTOR_WEIGHT: The weight of the vector search in the fusion (default: 1.0).
+    - HYBRID_KEYWORD_WEIGHT: The weight of the keyword search in the fusion (default: 1.0).
+    - HYBRID_RRF_K: The rank constant of the reciprocal rank fusion (default: 60).
+    - RERANK: Set to "on" to rerank the fused candidates of the hybrid search locally (default: off).
+    - RETRIEVAL_FANOUT: "rules" to split the question with a few rules, "model" to split it with one short model call,
+      or "off" to search the question as a whole (default: off).
+    - FANOUT_MAX_QUERIES: The maximum number of sub-queries per question (default: 4).
+
+    Args:
+        index: The loaded index.
+        user_prompt (str): The question of the user.
+        query_bundle (QueryBundle): The question from get_query_bundle, with its embedding when it was already
+            embedded (e.g. for the answer cache), so it is not embedded again.
+
+    Returns:
+        list: The fragments (NodeWithScore) that match the question, most relevant first.
+    """
+    top_k = int(os.getenv("RETRIEVAL_TOP_K", "2"))
+    query_bundle = query_bundle or get_query_bundle(user_prompt)
+    mode = get_retrieval_mode()
+    if mode == "vector":
+        retriever = index.as_retriever(similarity_top_k=top_k)
+    else:
+        retriever = HybridRetriever(
+            index,
+            get_bm25_index(index),
+            top_k=top_k,
+            candidates=int(os.getenv("RETRIEVAL_CANDIDATES", "10")),
+            vector_weight=float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0")),
+            keyword_weight=float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0")),
+            rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+            rerank=os.getenv("RERANK", "off").lower() == "on",
+        )
+
+    fanout = get_fanout_mode()
+    if fanout != "off":
+        retriever = FanoutRetriever(
+            retriever,
+            split=split_question_with_model if fanout == "model" else split_question,
+            embedding_template=RETRIEVAL_INSTRUCTION,
+            max_queries=int(os.getenv("FANOUT_MAX_QUERIES", "4")),
+        )
+    fragments = retriever.retrieve(query_bundle)
+    set_attributes(mode=mode, fanout=fanout, top_k=top_k, fragments=len(fragments))
+    return fragments
+
+def get_retrieval_mode():
+    return "hybrid" if os.getenv("RETRIEVAL_MODE", "vector").lower() == "hybrid" else "vector"
+
+def get_fanout_mode():
+    fanout = os.getenv("RETRIEVAL_FANOUT", "off").lower()
+    return fanout if fanout in ("rules", "model") else "off"
+
+def get_citations(fragments, blogging_directory):
+    """
+    Lists the blog posts the fragments come from, with their URL and the best fragment score.
+
+    Args:
+        fragments (list): The fragments as returned by the retriever.
+        blogging_directory (str): The path to the directory containing blog posts.
+
+    Returns:
+        list: A dictionary with the file name, url and score for each blog post.
+    """
+    citations = {}
+    for fragment in fragments:
+        file_name = fragment.node.metadata.get("file_name")
+        if file_name in citations:
+            citations[file_name]["score"] = max(citations[file_name]["score"], fragment.score)
+            continue
+        url = None
+        blog_post = read_blog_post(f"{blogging_directory}{file_name}")
+        if blog_post and blog_post[1]:
+            url = convert_filename_to_url(file_name, blog_post[1], "https://devopsjournal.io/blog")
+        citations[file_name] = {"file_name": file_name, "url": url, "score": fragment.score}
+    return list(citations.values())
+
+def get_local_cache_namespace(run_with_documents):
+    """
+    Gets the answer cache namespace for the local index, so answers are not reused after the index changed.
+
+    Args:
+        run_with_documents (bool): Whether the answer uses the entire content of the documents instead of the fragments.
+
+    Returns:
+        str: The namespace for the answer cache.
+    """
+    # the packed context depends on the token budget, so answers with another budget are not reused
+    mode = f"documents-{get_context_budget(Settings.llm.model)}" if run_with_documents else "fragments"
+    retrieval = get_retrieval_mode() + ("-rerank" if os.getenv("RERANK", "off").lower() == "on" else "")
+    if get_fanout_mode() != "off":
+        retrieval += f"-fanout-{get_fanout_mode()}"
+    return f"local:{get_index_version()}:{mode}:{retrieval}"
+
+@traced("answer_question")
+def answer_question(index, blogging_directory, user_prompt, run_with_documents=False, stream=False):
+    """
+    Runs the full pipeline for one question: retrieval, loading the documents (if needed) and the model call.
+
+    Args:
+        index: The loaded index.
+        blogging_directory (str): The path to the directory containing blog posts.
+        user_prompt (str): The question of the user.
+        run_with_documents (bool): Use the entire content of the matching documents as context instead of the fragments.
+        stream (bool): Print the answer while the tokens arrive, see call_model_with_context.
+
+    Questions that were answered before with the same index version, or very similar questions, are answered
+    from the answer cache without retrieval or a model call.
+
+    Returns:
+        dict: The answer, the citations, the token usage and the duration of each stage in milliseconds.
+    """
+    # the question is embedded once, with the retrieval instruction, for the similarity lookup and the vector search
+    query_bundle = get_query_bundle(user_prompt)
+    def embed_question(_):
+        if query_bundle.embedding is None:
+            query_bundle.embedding = Settings.embed_model.get_query_embedding(query_bundle.embedding_strs[0])
+        return query_bundle.embedding
+
+    namespace = get_local_cache_namespace(run_with_documents)
+    cached = lookup_answer(namespace, user_prompt, embed_question)
+    if cached:
+        return cached
+
+    timings = {}
+    startTime = time.time()
+    fragments = retrieve_fragments(index, user_prompt, query_bundle)
+    timings["retrieval"] = log_duration(startTime, "Retrieval")
+
+    if run_with_documents:
+        stageTime = time.time()
+        documents_content = get_documents(fragments, index, blogging_directory)
+        context, context_stats = build_documents_context(fragments, documents_content)
+        timings["documents"] = log_duration(stageTime, "Loading documents")
+        prompt_log_message = "and the context in all file content"
+    else:
+        with span("prompt.assemble") as prompt_span:
+            context = "\n------\n".join([ fragment.text for fragment in fragments ])
+            prompt_span.set(fragments=len(fragments), context_bytes=len(context.encode("utf-8")))
+        prompt_log_message = "and the context in all fragments"
+
+    stageTime = time.time()
+    response = call_model_with_context(user_prompt, context, prompt_log_message, "Model call", stream=stream)
+    timings["model_call"] = round((time.time() - stageTime) * 1000)
+    timings["total"] = round((time.time() - startTime) * 1000)
+
+    result = {
+        "question": user_prompt,
+        "answer": response.message.content,
+        "citations": get_citations(fragments, blogging_directory),
+        "usage": response.additional_kwargs,
+        "timings_ms": timings,
+    }
+    if run_with_documents:
+        result["context_tokens"] = context_stats
+    store_answer(namespace, user_prompt, result, embed_question)
+    return result
@@ -0,0 +1,341 @@
+"""
+    Vector store that persists the embeddings as a binary float32 matrix instead of a JSON file.
+
+    The embeddings are stored normalized in a `.npy` file that is memory-mapped on load, so loading the index only
+    reads the header and the operating system shares the pages between processes. The node ids and their document
+    ids are stored in a small JSON sidecar, which names the `.npy` file of its rows. Queries are answered with a
+    single NumPy matrix-vector product, or with the optional IVF index from ann_index.py when approximate search is
+    enabled. With quantization enabled, the search runs on a float16 or int8 copy of the matrix (see
+    vector_quantization.py) and the top candidates are rescored with the float32 matrix.
+"""
+import os, json, glob, uuid
+import numpy as np
+from typing import Any, List, Optional, Sequence
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from ann_index import IVFIndex, IVF_FNAME
+from vector_quantization import QuantizedMatrix, remove_quantized_files
+
+# the vectors of stores that were persisted before the ids file named its vectors file
+VECTORS_FNAME = "vectors.npy"
+IDS_FNAME = "vector_ids.json"
+LEGACY_FNAME = "vector_store.json"
+NAMESPACE_SEP = "__"
+DEFAULT_VECTOR_STORE = "default"
+
+def get_vectors_fname(version):
+    return f"vectors.{version}.npy"
+
+def normalize(vectors):
+    """
+    Scales the vectors to unit length, so the dot product equals the cosine similarity.
+
+    Args:
+        vectors (np.ndarray): A single vector or a matrix with one vector per row.
+
+    Returns:
+        np.ndarray: The normalized float32 vectors.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store with the embeddings in a contiguous, memory-mapped float32 matrix.
+
+    Like the SimpleVectorStore it does not store the node text, the nodes themselves are kept in the docstore.
+    """
+    stores_text: bool = False
+
+    _matrix: np.ndarray = PrivateAttr()
+    _node_ids: List[str] = PrivateAttr()
+    _ref_doc_ids: List[str] = PrivateAttr()
+    _positions: dict = PrivateAttr()
+    _ann: Optional[IVFIndex] = PrivateAttr()
+    _ann_settings: Optional[dict] = PrivateAttr()
+    _quantized: Optional[QuantizedMatrix] = PrivateAttr()
+    _quantization_settings: Optional[dict] = PrivateAttr()
+    _prefix: Optional[str] = PrivateAttr()
+
+    def __init__(self, matrix=None, node_ids=None, ref_doc_ids=None, ann=None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._matrix = matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        self._node_ids = list(node_ids or [])
+        self._ref_doc_ids = list(ref_doc_ids or [])
+        self._positions = {node_id: i for i, node_id in enumerate(self._node_ids)}
+        # only use a persisted IVF index that was built on the same rows
+        self._ann = ann if ann is not None and ann.n_rows == len(self._node_ids) else None
+        self._ann_settings = None
+        self._quantized = None
+        self._quantization_settings = None
+        self._prefix = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The normalized embeddings, one row per node."""
+        return self._matrix
+
+    @property
+    def node_ids(self) -> List[str]:
+        """The node ids in the same order as the rows of the matrix."""
+        return self._node_ids
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, namespace=DEFAULT_VECTOR_STORE):
+        """
+        Loads the vector store from a persist directory.
+
+        Indexes that were persisted with the SimpleVectorStore are converted once: the binary files are written
+        and the JSON file is removed, so the next load is memory-mapped.
+
+        Args:
+            persist_dir (str): The path to the directory where the index is persisted.
+            namespace (str): The namespace of the vector store in the storage context.
+
+        Returns:
+            MmapVectorStore: The loaded vector store.
+        """
+        prefix = os.path.join(persist_dir, f"{namespace}{NAMESPACE_SEP}")
+        if not os.path.exists(prefix + IDS_FNAME) and os.path.exists(prefix + LEGACY_FNAME):
+            print(f"Converting [{prefix + LEGACY_FNAME}] to the binary vector store format")
+            vector_store = cls.from_simple_vector_store(SimpleVectorStore.from_persist_path(prefix + LEGACY_FNAME))
+            vector_store.persist(prefix + LEGACY_FNAME)
+            os.remove(prefix + LEGACY_FNAME)
+
+        for attempt in range(3):
+            with open(prefix + IDS_FNAME, "r") as file:
+                ids = json.load(file)
+            try:
+                matrix = np.load(prefix + ids.get("vectors", VECTORS_FNAME), mmap_mode="r")
+                break
+            except FileNotFoundError:
+                # another process persisted the store and removed these vectors after the ids were read
+                if attempt == 2:
+                    raise
+        if len(ids["node_ids"]) != matrix.shape[0]:
+            raise ValueError(f"The vector store in [{persist_dir}] has [{len(ids['node_ids'])}] node ids for [{matrix.shape[0]}] vectors")
+        ann = IVFIndex.load(prefix + IVF_FNAME) if os.path.exists(prefix + IVF_FNAME) else None
+        vector_store = cls(matrix=matrix, node_ids=ids["node_ids"], ref_doc_ids=ids["ref_doc_ids"], ann=ann)
+        vector_store._prefix = prefix
+        return vector_store
+
+    @classmethod
+    def from_simple_vector_store(cls, simple_vector_store):
+        """
+        Creates the vector store from the data of a SimpleVectorStore.
+
+        Args:
+            simple_vector_store (SimpleVectorStore): The vector store to convert.
+
+        Returns:
+            MmapVectorStore: The converted vector store.
+        """
+        data = simple_vector_store.data
+        node_ids = list(data.embedding_dict.keys())
+        matrix = normalize([data.embedding_dict[node_id] for node_id in node_ids]) if node_ids else None
+        ref_doc_ids = [data.text_id_to_ref_doc_id.get(node_id, "None") for node_id in node_ids]
+        return cls(matrix=matrix, node_ids=node_ids, ref_doc_ids=ref_doc_ids)
+
+    def enable_ann(self, n_lists=None, n_probe=8):
+        """
+        Answers queries with the approximate IVF index instead of exact search.
+
+        The index is built when it was not persisted yet, or when the vectors changed since it was built.
+        It is saved next to the vectors right away for a store that was loaded from disk, and otherwise
+        when the store is persisted.
+
+        Args:
+            n_lists (int): The number of k-means lists, defaults to about the square root of the number of vectors.
+            n_probe (int): The number of lists to search per query. Higher values give a better recall but are slower.
+        """
+        self._ann_settings = {"n_lists": n_lists, "n_probe": n_probe}
+        if self._ann is not None and n_lists is not None and self._ann.n_lists != n_lists:
+            self._ann = None
+        if self._ann is None and self._prefix is not None and self._get_ann() is not None:
+            self._ann.save(self._prefix + IVF_FNAME)
+
+    def _get_ann(self):
+        if self._ann_settings is None or len(self._node_ids) == 0:
+            return None
+        if self._ann is None:
+            self._ann = IVFIndex.build(self._matrix, n_lists=self._ann_settings["n_lists"])
+        return self._ann
+
+    def enable_quantization(self, dtype, rescore=4):
+        """
+        Searches a quantized copy of the vectors instead of the float32 matrix.
+
+        The quantized vectors are loaded from the persist directory when they match the vectors, and otherwise
+        quantized and saved right away for a store that was loaded from disk, like the IVF index.
+
+        Args:
+            dtype (str): float16 or int8.
+            rescore (int): The number of candidates per result that are rescored with the float32 vectors,
+                0 to return the quantized scores.
+        """
+        self._quantization_settings = {"dtype": dtype, "rescore": rescore}
+        if self._quantized is not None and self._quantized.dtype != dtype:
+            self._quantized = None
+        if self._quantized is None and self._prefix is not None and len(self._node_ids) > 0:
+            quantized = QuantizedMatrix.load(self._prefix, dtype)
+            if quantized is not None and len(quantized) == len(self._node_ids):
+                self._quantized = quantized
+            else:
+                QuantizedMatrix.quantize(self._matrix, dtype).save(self._prefix)
+                self._quantized = QuantizedMatrix.load(self._prefix, dtype)
+
+    def _get_search_matrix(self):
+        if self._quantization_settings is None or len(self._node_ids) == 0:
+            return self._matrix
+        if self._quantized is None:
+            self._quantized = QuantizedMatrix.quantize(self._matrix, self._quantization_settings["dtype"])
+        return self._quantized
+
+    def get(self, text_id: str) -> List[float]:
+        """Get the (normalized) embedding of a node."""
+        return self._matrix[self._positions[text_id]].tolist()
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        # replace the nodes that are added again, to keep one row per node
+        self.delete_nodes([node.node_id for node in nodes if node.node_id in self._positions])
+
+        new_rows = normalize([node.get_embedding() for node in nodes])
+        if len(self._node_ids) == 0:
+            self._matrix = new_rows
+        else:
+            self._matrix = np.vstack([self._matrix, new_rows])
+        for node in nodes:
+            self._positions[node.node_id] = len(self._node_ids)
+            self._node_ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id or "None")
+        self._ann = None
+        self._quantized = None
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._keep_rows([doc_id != ref_doc_id for doc_id in self._ref_doc_ids])
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters")
+        if node_ids is None:
+            self.clear()
+            return
+        node_id_set = set(node_ids)
+        self._keep_rows([node_id not in node_id_set for node_id in self._node_ids])
+
+    def clear(self) -> None:
+        self._keep_rows([False] * len(self._node_ids))
+
+    def _keep_rows(self, keep):
+        if all(keep):
+            return
+        keep = np.array(keep, dtype=bool)
+        # copies the remaining rows out of the memory map
+        self._matrix = np.ascontiguousarray(self._matrix[keep]) if keep.any() else np.zeros((0, 0), dtype=np.float32)
+        self._node_ids = [node_id for node_id, kept in zip(self._node_ids, keep) if kept]
+        self._ref_doc_ids = [doc_id for doc_id, kept in zip(self._ref_doc_ids, keep) if kept]
+        self._positions = {node_id: i for i, node_id in enumerate(self._node_ids)}
+        self._ann = None
+        self._quantized = None
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+        if len(self._node_ids) == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        query_embedding = normalize(query.query_embedding)
+        matrix = self._get_search_matrix()
+        top_k = query.similarity_top_k
+        rescore = self._quantization_settings["rescore"] if matrix is not self._matrix else 0
+        # take more candidates from the quantized scores, the float32 scores pick the results from them
+        n_candidates = top_k * rescore if rescore else top_k
+
+        ann = self._get_ann()
+        if ann is not None and query.node_ids is None:
+            rows, scores = ann.search(matrix, query_embedding, n_candidates, n_probe=self._ann_settings["n_probe"])
+        else:
+            scores = matrix @ query_embedding
+            if query.node_ids is not None:
+                available = np.zeros(len(self._node_ids), dtype=bool)
+                available[[self._positions[node_id] for node_id in query.node_ids if node_id in self._positions]] = True
+                scores = np.where(available, scores, -np.inf)
+
+            n_candidates = min(n_candidates, len(scores))
+            rows = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            rows = rows[np.isfinite(scores[rows])]
+            scores = scores[rows]
+
+        if rescore and len(rows) > 0:
+            # reads only the rows of the candidates from the memory-mapped float32 matrix, in file order
+            rows = np.sort(rows)
+            scores = self._matrix[rows] @ query_embedding
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        return VectorStoreQueryResult(
+            similarities=scores[top].tolist(),
+            ids=[self._node_ids[row] for row in rows[top]],
+        )
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        """
+        Writes the matrix and the id sidecar next to the given path.
+
+        The StorageContext passes the path of the JSON file it would write, e.g. `blog_index/default__vector_store.json`,
+        so the binary files are written as `blog_index/default__vectors.<version>.npy` and
+        `blog_index/default__vector_ids.json`. The vectors are written to a new file, and the ids file that names it is
+        replaced atomically, so a process that loads the store meanwhile gets either the previous or the new pair.
+        The previous vectors file is removed, processes that have it memory-mapped keep working.
+        The IVF index and the quantized vectors are written when they are enabled, and removed otherwise.
+        """
+        prefix = persist_path[:-len(LEGACY_FNAME)] if persist_path.endswith(LEGACY_FNAME) else persist_path
+        dirpath = os.path.dirname(prefix)
+        if dirpath and not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+
+        vectors_fname = get_vectors_fname(uuid.uuid4().hex[:12])
+        with open(prefix + vectors_fname, "wb") as file:
+            np.save(file, np.ascontiguousarray(self._matrix, dtype=np.float32))
+        with open(prefix + IDS_FNAME + ".tmp", "w") as file:
+            json.dump({"vectors": vectors_fname, "node_ids": self._node_ids, "ref_doc_ids": self._ref_doc_ids}, file)
+        os.replace(prefix + IDS_FNAME + ".tmp", prefix + IDS_FNAME)
+        for path in glob.glob(glob.escape(prefix) + get_vectors_fname("*")) + [prefix + VECTORS_FNAME]:
+            if path != prefix + vectors_fname and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    # e.g. still memory-mapped on Windows, removed by the next persist
+                    pass
+
+        ann = self._get_ann()
+        if ann is not None:
+            ann.save(prefix + IVF_FNAME)
+        elif os.path.exists(prefix + IVF_FNAME):
+            # the persisted IVF index no longer matches the vectors
+            os.remove(prefix + IVF_FNAME)
+
+        quantized = self._get_search_matrix()
+        if quantized is not self._matrix:
+            quantized.save(prefix)
+        remove_quantized_files(prefix, keep=quantized.dtype if quantized is not self._matrix else None)
@@ -0,0 +1,122 @@
+"""
+    This script runs a local HTTP server that keeps the index and the models loaded, and answers questions over HTTP.
+
+    The setup (models, blogging directory and index) is done once at startup, so each request only pays for the
+    retrieval and the model call. Requests are handled concurrently, each on its own thread.
+
+    While serving, the blogging repository is fetched again in the background whenever the last fetch is older than
+    CORPUS_REFRESH_HOURS (checked at least every hour). When the refresh changed blog posts, they are indexed into a
+    new copy of the index, which replaces the index when it is ready: requests that are running finish with the
+    previous index.
+
+    Endpoints:
+    - GET /health: returns the status of the server, the number of fragments in the index and the answer cache hit rates.
+    - POST /query: answers a question, e.g. curl -X POST localhost:8000/query -d '{"question": "How can you use GitHub Actions with security in mind?"}'
+      Add "full_documents": true to answer with the entire content of the documents instead of the fragments.
+      The response has the answer, the citations, the token usage and the duration of each stage.
+
+    Environment Variables:
+    - SERVER_HOST: The host to listen on (default: "127.0.0.1").
+    - SERVER_PORT: The port to listen on (default: 8000).
+"""
+import sys, os, time, json, contextlib, logging, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import setup_local, get_blogging_directory, get_index, answer_question, log_duration, get_corpus_sync
+from answer_cache import get_answer_cache
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # set at startup, shared by all request threads
+    index = None
+    blogging_directory = None
+    started_at = None
+    # only one thread at a time loads and updates the persisted index
+    index_lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"error": f"Unknown path [{self.path}]"})
+            return
+        answer_cache = get_answer_cache()
+        self.send_json(200, {
+            "status": "ok",
+            "fragments": len(self.index.index_struct.nodes_dict),
+            "uptime_seconds": round(time.time() - self.started_at),
+            "answer_cache": answer_cache.stats() if answer_cache else None,
+        })
+
+    def do_POST(self):
+        if self.path != "/query":
+            self.send_json(404, {"error": f"Unknown path [{self.path}]"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "The request body is not valid JSON"})
+            return
+        question = body.get("question")
+        if not question:
+            self.send_json(400, {"error": "The request body has no question"})
+            return
+
+        try:
+            result = answer_question(self.index, self.blogging_directory, question, run_with_documents=bool(body.get("full_documents", False)))
+        except Exception as e:
+            self.send_json(500, {"question": question, "error": str(e)})
+            return
+        self.send_json(200, result)
+
+    def send_json(self, status_code, data):
+        content = json.dumps(data).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # stdout is silenced while serving, so log the requests to stderr
+        sys.stderr.write(f"{self.address_string()} - {format % args}\n")
+
+def refresh_index(changed_files):
+    """
+    Indexes the blog posts that changed in a refresh of the blogging repository, and swaps in the updated index.
+    """
+    startTime = time.time()
+    try:
+        with QueryHandler.index_lock:
+            # loads a new copy of the index, the index of the running requests is not changed
+            QueryHandler.index = get_index(QueryHandler.blogging_directory)
+    except Exception as e:
+        sys.stderr.write(f"[ERROR] Indexing the [{len(changed_files)}] changed blog posts failed: {e}\n")
+        return
+    sys.stderr.write(f"Indexed the [{len(changed_files)}] changed blog posts in [{round(time.time() - startTime)}] seconds\n")
+
+# Main script
+if __name__ == "__main__":
+    host = os.getenv("SERVER_HOST", "127.0.0.1")
+    port = int(os.getenv("SERVER_PORT", "8000"))
+
+    # Set up the models and load the index once
+    startTime = time.time()
+    setup_local()
+    get_corpus_sync().on_change(refresh_index)
+    QueryHandler.blogging_directory = get_blogging_directory()
+    with QueryHandler.index_lock:
+        QueryHandler.index = get_index(QueryHandler.blogging_directory)
+    QueryHandler.started_at = time.time()
+    # fetch the blogging repository again whenever the last fetch gets older than CORPUS_REFRESH_HOURS while serving
+    get_corpus_sync().refresh_periodically()
+    log_duration(startTime, "Setup")
+
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    print(f"Serving questions on [http://{host}:{port}/query], health check on [http://{host}:{port}/health]")
+    # the pipeline prints every step, which is unreadable with concurrent requests
+    logging.getLogger().setLevel(logging.WARNING)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    server.server_close()
+    print("Stopped the server")
@@ -0,0 +1,142 @@
+"""
+    Multi-query retrieval: splits a compound question into sub-queries and merges the fragments they retrieve.
+
+    A question like "How do I pin actions to a SHA and how can Dependabot keep them up to date?" asks about two
+    things, and a single embedding of the whole question ends up between both topics. The question is split into
+    sub-queries, locally with a few rules or with one short model call. The sub-queries are embedded together with the
+    question in one batched request, and searched in parallel. The fragments are merged by node id with their best
+    score, so one model call gets the fragments for every part of the question.
+"""
+import re, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from llama_index.core import Settings
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.llms import ChatMessage
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from tracing import span
+
+# Split after a question mark, at a semicolon, or at "and"/"also" when a new question starts after it
+SPLIT_PATTERN = re.compile(
+    r"(?<=\?)\s+|;\s*|,?\s+(?:and|also|as well as)\s+(?=(?:how|what|which|why|when|where|who|can|could|should|do|does|is|are)\b)",
+    re.IGNORECASE,
+)
+# Sub-queries with fewer words are not worth a search of their own
+MIN_QUERY_WORDS = 3
+
+SPLIT_PROMPT = (
+    "Split the question into at most {max_queries} short, standalone search queries, one per line, without numbering. "
+    "If the question asks about one thing only, return the question itself.\n\nQuestion: {question}"
+)
+
+def split_question(question, max_queries=4):
+    """
+    Splits a compound question into sub-queries with a few rules: at question marks, semicolons, and at "and" when
+    a new question starts after it.
+
+    Args:
+        question (str): The question of the user.
+        max_queries (int): The maximum number of sub-queries.
+
+    Returns:
+        list: The sub-queries, or only the question when it could not be split.
+    """
+    parts = [part.strip(" ,.") for part in SPLIT_PATTERN.split(question)]
+    parts = list(dict.fromkeys(part for part in parts if len(part.split()) >= MIN_QUERY_WORDS))
+    return parts[:max_queries] if len(parts) > 1 else [question]
+
+def split_question_with_model(question, max_queries=4, llm=None):
+    """
+    Splits a compound question into sub-queries with one short call to the model, falling back to the rules when
+    the call fails.
+
+    Returns:
+        list: The sub-queries, or only the question when it could not be split.
+    """
+    llm = llm or Settings.llm
+    try:
+        response = llm.chat(
+            [ChatMessage(role="user", content=SPLIT_PROMPT.format(max_queries=max_queries, question=question))],
+            max_tokens=30 * max_queries,
+        )
+    except Exception as e:
+        print(f"[WARNING] Splitting the question with the model failed, splitting it with the rules: {e}")
+        return split_question(question, max_queries)
+    # remove the numbering or bullets the model adds anyway
+    parts = [re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", line).strip() for line in (response.message.content or "").splitlines()]
+    parts = list(dict.fromkeys(part for part in parts if len(part.split()) >= MIN_QUERY_WORDS))
+    return parts[:max_queries] if len(parts) > 1 else [question]
+
+def embed_queries(texts, embed_model=None):
+    """
+    Embeds the texts of the queries, in one batched request when the embedding model supports it (the
+    CachedEmbedding from embedding_cache.py), otherwise one by one.
+    """
+    embed_model = embed_model or Settings.embed_model
+    if hasattr(embed_model, "get_query_embedding_batch"):
+        return embed_model.get_query_embedding_batch(texts)
+    return [embed_model.get_query_embedding(text) for text in texts]
+
+def merge_results(results_per_query):
+    """
+    Merges the fragments of the sub-queries: every fragment once, with its best score, the best fragments first.
+
+    Args:
+        results_per_query (list): The list of fragments (NodeWithScore) of every sub-query.
+
+    Returns:
+        list: The merged fragments.
+    """
+    merged = {}
+    for results in results_per_query:
+        for result in results:
+            best = merged.get(result.node.node_id)
+            if best is None or (result.score or 0.0) > (best.score or 0.0):
+                merged[result.node.node_id] = result
+    return sorted(merged.values(), key=lambda result: result.score or 0.0, reverse=True)
+
+class FanoutRetriever(BaseRetriever):
+    """
+    Retriever that searches the question and its sub-queries in parallel with another retriever, and merges the
+    fragments.
+
+    Args:
+        retriever (BaseRetriever): The retriever for every query, e.g. the HybridRetriever.
+        split (callable): Splits the question into a list of sub-queries, e.g. split_question.
+        embedding_template (str): The text to embed for a query, with `{question}` for the query.
+        max_queries (int): The maximum number of sub-queries.
+    """
+    def __init__(self, retriever, split=split_question, embedding_template="{question}", max_queries=4):
+        super().__init__()
+        self._retriever = retriever
+        self._split = split
+        self._embedding_template = embedding_template
+        self._max_queries = max_queries
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with span("retrieval.split") as split_span:
+            sub_queries = self._split(query_bundle.query_str, self._max_queries)
+            split_span.set(queries=len(sub_queries))
+        if len(sub_queries) == 1:
+            return self._retriever.retrieve(query_bundle)
+
+        # the question itself is searched as well, so the fragments about the question as a whole are not lost
+        queries = [query_bundle.query_str] + [query for query in sub_queries if query != query_bundle.query_str]
+        embedding_strs = [query_bundle.embedding_strs[0]] + [self._embedding_template.format(question=query) for query in queries[1:]]
+        # the question itself can already be embedded, e.g. for the similarity lookup in the answer cache
+        texts = embedding_strs if query_bundle.embedding is None else embedding_strs[1:]
+        with span("retrieval.embed", queries=len(texts)):
+            embeddings = embed_queries(texts)
+        if query_bundle.embedding is not None:
+            embeddings = [query_bundle.embedding] + embeddings
+        bundles = [
+            QueryBundle(query_str=query, custom_embedding_strs=[embedding_str], embedding=embedding)
+            for query, embedding_str, embedding in zip(queries, embedding_strs, embeddings)
+        ]
+        print(f"Searching [{len(bundles)}] queries for the question: {', '.join(f'[{query}]' for query in queries[1:])}")
+
+        # every search runs in a copy of the context of the caller, so its spans are nested under this retrieval
+        with ThreadPoolExecutor(max_workers=len(bundles)) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, self._retriever.retrieve, bundle) for bundle in bundles]
+            results_per_query = [future.result() for future in futures]
+        return merge_results(results_per_query)
@@ -0,0 +1,105 @@
+"""
+    Tracks the GitHub Models rate limits from the `x-ratelimit-*` headers of the calls we already make.
+
+    The tracker is registered as an httpx event hook on the HTTP clients of the LLM and the embedding model, so
+    reading the remaining tokens and requests never costs an extra call to the API.
+"""
+import json, threading, time
+import httpx
+from openai import DefaultHttpxClient, DefaultAsyncHttpxClient
+
+class RateLimitTracker:
+    """
+    In-process counters with the latest rate limit information per model.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits = {}
+
+    def record(self, response):
+        """
+        Records the rate limit headers of a response. Used as httpx response event hook.
+
+        Args:
+            response (httpx.Response): The response from the API.
+        """
+        model = self._get_model(response.request)
+        headers = response.headers
+        with self._lock:
+            limits = self._limits.setdefault(model, {"requests_sent": 0})
+            limits["requests_sent"] += 1
+            limits["last_status_code"] = response.status_code
+            limits["updated_at"] = time.time()
+            if response.status_code == 429:
+                limits["rate_limited"] = limits.get("rate_limited", 0) + 1
+                retry_after = headers.get("retry-after")
+                if retry_after is not None and retry_after.isdigit():
+                    limits["retry_after"] = int(retry_after)
+            for name in ["remaining-tokens", "remaining-requests", "limit-tokens", "limit-requests"]:
+                value = headers.get(f"x-ratelimit-{name}")
+                if value is not None and value.isdigit():
+                    limits[name.replace("-", "_")] = int(value)
+
+    async def arecord(self, response):
+        """
+        Records the rate limit headers of a response. Used as httpx.AsyncClient response event hook.
+        """
+        self.record(response)
+
+    @staticmethod
+    def _get_model(request):
+        # the limits of GitHub Models are per model, so use the model from the request body
+        try:
+            return json.loads(request.content).get("model") or request.url.path
+        except (ValueError, AttributeError, httpx.RequestNotRead):
+            return request.url.path
+
+    def get(self, model):
+        """
+        Gets the latest rate limit information for a model.
+
+        Args:
+            model (str): The name of the model, e.g. "gpt-4o-mini".
+
+        Returns:
+            dict: The rate limit information, empty if no call to this model was made yet.
+        """
+        with self._lock:
+            return dict(self._limits.get(model, {}))
+
+    def all(self):
+        """
+        Returns:
+            dict: The rate limit information for all models that were called.
+        """
+        with self._lock:
+            return {model: dict(limits) for model, limits in self._limits.items()}
+
+    def http_client(self, scheduler=None, **kwargs):
+        """
+        Creates an httpx.Client with the OpenAI defaults (timeouts, connection limits) that reports every response to the tracker.
+
+        Args:
+            scheduler (RateLimitScheduler): Makes every request wait for the rate limits, see rate_scheduler.py.
+        """
+        event_hooks = {"request": [], "response": [self.record]}
+        if scheduler is not None:
+            event_hooks["request"].append(scheduler.before_request)
+            event_hooks["response"].append(scheduler.after_response)
+        return DefaultHttpxClient(event_hooks=event_hooks, **kwargs)
+
+    def async_http_client(self, scheduler=None, **kwargs):
+        """
+        Creates an httpx.AsyncClient with the OpenAI defaults that reports every response to the tracker.
+
+        Args:
+            scheduler (RateLimitScheduler): Makes every request wait for the rate limits, see rate_scheduler.py.
+        """
+        event_hooks = {"request": [], "response": [self.arecord]}
+        if scheduler is not None:
+            event_hooks["request"].append(scheduler.abefore_request)
+            event_hooks["response"].append(scheduler.aafter_response)
+        return DefaultAsyncHttpxClient(event_hooks=event_hooks, **kwargs)
+
+# Shared tracker for all models set up in this process
+rate_limit_tracker = RateLimitTracker()
@@ -0,0 +1,327 @@
+"""
+    Client-side scheduler for the GitHub Models calls, so we slow down before the rate limits are hit instead of
+    running into 429 (Too Many Requests) responses and retrying.
+
+    Every model has two token buckets: one with the requests and one with the tokens that can still be sent in the
+    current window. Before a request is sent, its token cost is estimated (the prompt or the embedding input, plus the
+    maximum completion tokens) and the request waits until both buckets have room. The
+    buckets refill at the rate of the limits, and are set to the `x-ratelimit-*` headers of every response, so they
+    follow what GitHub Models counted. After a 429 the model is paused for the `retry-after` seconds.
+
+    Waiting requests are served by priority: interactive questions go before background work like embedding the
+    blog posts for the index. The priority is set with a context variable:
+
+        with request_priority(BACKGROUND):
+            embedder.embed_nodes(nodes)
+
+    The scheduler is registered as httpx event hooks on the clients of the LLM and the embedding model, see
+    rate_limits.py.
+
+    Environment Variables:
+    - RATE_SCHEDULER: Set to "off" to send the requests without waiting for the rate limits (default: on).
+    - RATE_LIMIT_WINDOW_SECONDS: The window of the rate limits, the buckets refill in this time (default: 60).
+    - RATE_LIMIT_COMPLETION_TOKENS: The estimated completion tokens of a chat request without max_tokens (default: 500).
+"""
+import os, json, time, heapq, asyncio, itertools, threading, contextlib, contextvars
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_request_priority = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """
+    Sets the priority of the requests that are sent in this context (and by the threads that copy it).
+
+    Args:
+        priority (int): INTERACTIVE or BACKGROUND.
+    """
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+def estimate_tokens(body, completion_tokens=500):
+    """
+    Estimates the number of tokens a request counts for in the rate limit.
+
+    The text is estimated at about 4 characters per token: tokenizing every request with tiktoken would cost more
+    time (and memory for the encoding) than the estimate needs to be exact, the headers of the response correct it.
+
+    Args:
+        body (dict): The JSON body of the request.
+        completion_tokens (int): The completion tokens to count for a chat request without max_tokens.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    if "messages" in body:
+        # every message has a few tokens for the role and the separators
+        prompt_tokens = sum(len(str(message.get("content") or "")) // 4 + 4 for message in body["messages"])
+        return prompt_tokens + (body.get("max_tokens") or body.get("max_completion_tokens") or completion_tokens)
+    inputs = body.get("input", [])
+    inputs = [inputs] if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)) else inputs
+    # the input of an embedding request is either text or a list of token ids
+    return sum(len(item) if isinstance(item, list) else len(str(item)) // 4 + 1 for item in inputs)
+
+class _Bucket:
+    """
+    The requests and tokens that can still be sent for one model.
+    """
+    def __init__(self):
+        self.limit_requests = None
+        self.limit_tokens = None
+        self.requests = None
+        self.tokens = None
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        # ticket -> (tokens, sent at) of the requests that were sent and did not get a response yet
+        self.in_flight = {}
+        self.waiting = []
+
+class RateLimitScheduler:
+    """
+    Token bucket scheduler that makes the requests wait until the rate limits of their model have room.
+
+    Args:
+        window_seconds (float): The window of the rate limits, the buckets refill in this time.
+        completion_tokens (int): The estimated completion tokens of a chat request without max_tokens.
+    """
+    def __init__(self, window_seconds=60, completion_tokens=500):
+        self.window_seconds = window_seconds
+        self.completion_tokens = completion_tokens
+        self._condition = threading.Condition()
+        self._buckets = {}
+        self._tickets = itertools.count()
+        self._stats = {}
+
+    def _get_bucket(self, model):
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            bucket = self._buckets[model] = _Bucket()
+        return bucket
+
+    def _refill(self, bucket, now):
+        elapsed = now - bucket.updated_at
+        bucket.updated_at = now
+        if bucket.limit_requests is not None:
+            bucket.requests = min(bucket.limit_requests, bucket.requests + elapsed * bucket.limit_requests / self.window_seconds)
+        if bucket.limit_tokens is not None:
+            bucket.tokens = min(bucket.limit_tokens, bucket.tokens + elapsed * bucket.limit_tokens / self.window_seconds)
+
+    def _get_wait(self, bucket, tokens, now):
+        """
+        Gets the number of seconds until the buckets have room for the request, 0 when it can be sent now.
+        """
+        wait = max(0.0, bucket.paused_until - now)
+        if bucket.requests is not None and bucket.requests < 1:
+            wait = max(wait, (1 - bucket.requests) * self.window_seconds / bucket.limit_requests)
+        if bucket.tokens is not None:
+            # a request that is larger than the whole limit only waits for a full bucket
+            needed = min(tokens, bucket.limit_tokens)
+            if bucket.tokens < needed:
+                wait = max(wait, (needed - bucket.tokens) * self.window_seconds / bucket.limit_tokens)
+        return wait
+
+    def _try_acquire(self, model, tokens, ticket):
+        """
+        Takes the request and tokens from the buckets when the request is first in line and there is room.
+
+        Returns:
+            float: 0 when the request can be sent, otherwise the number of seconds to wait before trying again.
+        """
+        bucket = self._get_bucket(model)
+        now = time.monotonic()
+        self._refill(bucket, now)
+        if bucket.waiting[0] != ticket:
+            # wait for the requests with a higher priority, or that were queued earlier
+            return 0.05
+        wait = self._get_wait(bucket, tokens, now)
+        if wait > 0:
+            return wait
+        heapq.heappop(bucket.waiting)
+        if bucket.requests is not None:
+            bucket.requests -= 1
+        if bucket.tokens is not None:
+            bucket.tokens -= tokens
+        bucket.in_flight[ticket] = (tokens, now)
+        self._condition.notify_all()
+        return 0
+
+    def _cancel(self, model, ticket):
+        # a request that stopped waiting (e.g. a cancelled task) must not block the requests behind it
+        bucket = self._get_bucket(model)
+        if ticket in bucket.waiting:
+            bucket.waiting.remove(ticket)
+            heapq.heapify(bucket.waiting)
+            self._condition.notify_all()
+
+    def _record_wait(self, model, priority, waited):
+        stats = self._stats.setdefault(model, {"requests": 0, "waited_requests": 0, "waited_seconds": 0.0, "background_requests": 0})
+        stats["requests"] += 1
+        stats["background_requests"] += 1 if priority == BACKGROUND else 0
+        if waited > 0.001:
+            stats["waited_requests"] += 1
+            stats["waited_seconds"] = round(stats["waited_seconds"] + waited, 3)
+
+    def acquire(self, model, tokens, priority=None):
+        """
+        Waits until a request for the model can be sent.
+
+        Args:
+            model (str): The model of the request.
+            tokens (int): The estimated number of tokens of the request.
+            priority (int): INTERACTIVE or BACKGROUND, the priority of the context by default.
+
+        Returns:
+            tuple: The ticket of the request, to pass to release when the response arrives.
+        """
+        priority = _request_priority.get() if priority is None else priority
+        startTime = time.monotonic()
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._get_bucket(model).waiting, ticket)
+            try:
+                while True:
+                    wait = self._try_acquire(model, tokens, ticket)
+                    if wait == 0:
+                        break
+                    self._condition.wait(timeout=min(wait, 1.0))
+            except BaseException:
+                self._cancel(model, ticket)
+                raise
+            self._record_wait(model, priority, time.monotonic() - startTime)
+        return ticket
+
+    async def aacquire(self, model, tokens, priority=None):
+        """
+        Waits until a request for the model can be sent, without blocking the event loop.
+        """
+        priority = _request_priority.get() if priority is None else priority
+        startTime = time.monotonic()
+        with self._condition:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._get_bucket(model).waiting, ticket)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_acquire(model, tokens, ticket)
+                    if wait == 0:
+                        self._record_wait(model, priority, time.monotonic() - startTime)
+                        return ticket
+                await asyncio.sleep(min(wait, 1.0))
+        except BaseException:
+            with self._condition:
+                self._cancel(model, ticket)
+            raise
+
+    def release(self, model, ticket, headers=None, status_code=200):
+        """
+        Marks a request as finished and sets the buckets to the rate limit headers of its response.
+
+        Args:
+            model (str): The model of the request.
+            ticket (tuple): The ticket from acquire.
+            headers (dict): The headers of the response.
+            status_code (int): The status code of the response.
+        """
+        headers = headers or {}
+        with self._condition:
+            bucket = self._get_bucket(model)
+            now = time.monotonic()
+            bucket.in_flight.pop(ticket, None)
+            # forget the requests that failed without a response
+            for stale_ticket in [key for key, (_, sent_at) in bucket.in_flight.items() if sent_at < now - 5 * self.window_seconds]:
+                del bucket.in_flight[stale_ticket]
+            self._refill(bucket, now)
+            for name in ["requests", "tokens"]:
+                limit = headers.get(f"x-ratelimit-limit-{name}")
+                remaining = headers.get(f"x-ratelimit-remaining-{name}")
+                if limit is None or remaining is None or not limit.isdigit() or not remaining.isdigit() or int(limit) == 0:
+                    continue
+                # the requests that are still running were not counted in these headers yet
+                in_flight = len(bucket.in_flight) if name == "requests" else sum(tokens for tokens, _ in bucket.in_flight.values())
+                setattr(bucket, f"limit_{name}", int(limit))
+                setattr(bucket, name, float(int(remaining) - in_flight))
+            if status_code == 429:
+                retry_after = headers.get("retry-after")
+                pause = int(retry_after) if retry_after is not None and retry_after.isdigit() else 1
+                bucket.paused_until = max(bucket.paused_until, now + pause)
+            self._condition.notify_all()
+
+    def stats(self, model):
+        """
+        Returns:
+            dict: The number of requests, how many waited and how long, and the current buckets of the model.
+        """
+        with self._condition:
+            stats = dict(self._stats.get(model, {}))
+            bucket = self._buckets.get(model)
+            if bucket is not None:
+                self._refill(bucket, time.monotonic())
+                stats["available_requests"] = None if bucket.requests is None else int(bucket.requests)
+                stats["available_tokens"] = None if bucket.tokens is None else int(bucket.tokens)
+            return stats
+
+    def _get_request_cost(self, request):
+        try:
+            body = json.loads(request.content)
+        except (ValueError, AttributeError):
+            return None, 0
+        model = body.get("model") or request.url.path
+        return model, estimate_tokens(body, self.completion_tokens)
+
+    def before_request(self, request):
+        """
+        Waits until the request can be sent. Used as httpx request event hook.
+        """
+        model, tokens = self._get_request_cost(request)
+        if model is None:
+            return
+        request.extensions["rate_scheduler"] = (model, self.acquire(model, tokens))
+
+    def after_response(self, response):
+        """
+        Syncs the buckets with the rate limit headers of the response. Used as httpx response event hook.
+        """
+        scheduled = response.request.extensions.get("rate_scheduler")
+        if scheduled is not None:
+            self.release(scheduled[0], scheduled[1], response.headers, response.status_code)
+
+    async def abefore_request(self, request):
+        """
+        Waits until the request can be sent. Used as httpx.AsyncClient request event hook.
+        """
+        model, tokens = self._get_request_cost(request)
+        if model is None:
+            return
+        request.extensions["rate_scheduler"] = (model, await self.aacquire(model, tokens))
+
+    async def aafter_response(self, response):
+        """
+        Syncs the buckets with the rate limit headers of the response. Used as httpx.AsyncClient response event hook.
+        """
+        self.after_response(response)
+
+_rate_limit_scheduler = None
+_rate_limit_scheduler_lock = threading.Lock()
+
+def get_rate_limit_scheduler():
+    """
+    Gets the scheduler that is shared by all models of this process, configured with environment variables.
+
+    Returns:
+        RateLimitScheduler: The scheduler, or None when it is disabled.
+    """
+    global _rate_limit_scheduler
+    if os.getenv("RATE_SCHEDULER", "on").lower() == "off":
+        return None
+    with _rate_limit_scheduler_lock:
+        if _rate_limit_scheduler is None:
+            _rate_limit_scheduler = RateLimitScheduler(
+                window_seconds=float(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60")),
+                completion_tokens=int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "500")),
+            )
+    return _rate_limit_scheduler
@@ -0,0 +1,48 @@
+"""
+    Makes the modules and scripts in the root of the repository importable from the tests.
+"""
+import os, sys, importlib.util
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIRECTORY)
+
+def load_script(file_name):
+    """
+    Imports a script with a hyphen in its name, like upload-data.py, without running its main code.
+    """
+    spec = importlib.util.spec_from_file_location(file_name[:-3].replace("-", "_"), os.path.join(ROOT_DIRECTORY, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def make_clustered_vectors(n_vectors=2000, dimensions=64, n_topics=20, seed=42):
+    """
+    Creates normalized synthetic vectors around a few topics, to mimic the embeddings of a corpus.
+    """
+    import numpy as np
+    from mmap_vector_store import normalize
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dimensions))
+    return normalize(topics[rng.integers(n_topics, size=n_vectors)] + rng.normal(size=(n_vectors, dimensions)))
+
+def make_queries(vectors, n_queries=50, scale=0.3, seed=7):
+    """
+    Creates queries near the indexed vectors.
+    """
+    import numpy as np
+    from mmap_vector_store import normalize
+    rng = np.random.default_rng(seed)
+    return normalize(vectors[rng.integers(len(vectors), size=n_queries)] + rng.normal(scale=scale, size=(n_queries, vectors.shape[1])))
+
+def make_nodes(vectors, start=0, n_documents=5):
+    """
+    Creates nodes with the vectors as embedding, spread over a few documents.
+    """
+    from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+    return [
+        TextNode(
+            id_=f"node-{start + i}", text="", embedding=vector.tolist(),
+            relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"doc-{(start + i) % n_documents}")},
+        )
+        for i, vector in enumerate(vectors)
+    ]
@@ -0,0 +1,27 @@
+"""
+    Checks the startup time of every script against its budget, see check-import-time.py.
+"""
+import os
+import pytest
+from conftest import load_script
+
+check_import_time = load_script("check-import-time.py")
+
+@pytest.fixture(scope="module")
+def stub():
+    stub = check_import_time.StubEndpoint()
+    yield stub
+    stub.close()
+
+@pytest.fixture(scope="module")
+def startup_modules():
+    return check_import_time.get_startup_modules()
+
+@pytest.mark.parametrize("script", list(check_import_time.IMPORT_BUDGETS_MS))
+def test_script_starts_within_budget(script, stub, startup_modules):
+    measurement = check_import_time.measure_script(script, int(os.getenv("IMPORT_TIME_RUNS", "3")), stub, startup_modules)
+    if measurement is None:
+        pytest.skip(f"not all imports of {script} are installed")
+    duration, slowest = measurement
+    budget = check_import_time.get_budget(script)
+    assert duration <= budget, f"{script} starts in {duration} ms, budget {budget} ms, slowest imports: {slowest}"
@@ -0,0 +1,102 @@
+"""
+    Tests for the MmapVectorStore: the recall of the IVF index against the exact search, and that the node ids stay
+    aligned with the rows of the matrix when the store is persisted, loaded and changed.
+"""
+import json
+import numpy as np
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from conftest import make_clustered_vectors, make_queries, make_nodes
+from mmap_vector_store import MmapVectorStore, normalize
+
+def query_ids(vector_store, query, top_k=10):
+    return vector_store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=top_k)).ids
+
+def get_recall(exact_store, store, queries, top_k=10):
+    return np.mean([len(set(query_ids(exact_store, query, top_k)) & set(query_ids(store, query, top_k))) / top_k for query in queries])
+
+def assert_aligned(vector_store, embeddings):
+    node_ids = vector_store.node_ids
+    assert len(node_ids) == vector_store.matrix.shape[0] == len(set(node_ids))
+    assert set(node_ids) == set(embeddings)
+    for row, node_id in enumerate(node_ids):
+        np.testing.assert_allclose(vector_store.matrix[row], normalize(embeddings[node_id]), atol=1e-6)
+        # the row of a node is found as its own best match
+        assert query_ids(vector_store, vector_store.matrix[row], top_k=1) == [node_id]
+
+def test_ivf_recall_against_exact_search():
+    vectors = make_clustered_vectors()
+    node_ids = [f"node-{i}" for i in range(len(vectors))]
+    exact_store = MmapVectorStore(matrix=vectors, node_ids=node_ids, ref_doc_ids=node_ids)
+    ivf_store = MmapVectorStore(matrix=vectors, node_ids=node_ids, ref_doc_ids=node_ids)
+    ivf_store.enable_ann(n_probe=8)
+    assert get_recall(exact_store, ivf_store, make_queries(vectors)) >= 0.85
+
+def test_top_k_larger_than_the_store():
+    vectors = make_clustered_vectors(n_vectors=5)
+    node_ids = [f"node-{i}" for i in range(len(vectors))]
+    vector_store = MmapVectorStore(matrix=vectors, node_ids=node_ids, ref_doc_ids=node_ids)
+    assert sorted(query_ids(vector_store, vectors[0], top_k=50)) == sorted(node_ids)
+    vector_store.enable_ann(n_probe=8)
+    assert sorted(query_ids(vector_store, vectors[0], top_k=50)) == sorted(node_ids)
+
+def test_rows_stay_aligned_after_persist_load_add_and_delete(tmp_path):
+    vectors = make_clustered_vectors(n_vectors=60, seed=1)
+    persist_path = str(tmp_path / "default__vector_store.json")
+    embeddings = {}
+
+    vector_store = MmapVectorStore()
+    nodes = make_nodes(vectors[:40])
+    vector_store.add(nodes)
+    embeddings.update({node.node_id: node.embedding for node in nodes})
+    vector_store.persist(persist_path)
+
+    loaded = MmapVectorStore.from_persist_dir(str(tmp_path))
+    assert_aligned(loaded, embeddings)
+
+    # add new nodes and a node again with another embedding, then delete a document and a few nodes
+    nodes = make_nodes(vectors[40:], start=40) + make_nodes(-vectors[50:51], start=3)
+    loaded.enable_ann(n_probe=4)
+    loaded.add(nodes)
+    embeddings.update({node.node_id: node.embedding for node in nodes})
+    loaded.delete("doc-1")
+    loaded.delete_nodes(["node-0", "node-42"])
+    embeddings = {
+        node_id: embedding for node_id, embedding in embeddings.items()
+        if int(node_id.split("-")[1]) % 5 != 1 and node_id not in ("node-0", "node-42")
+    }
+    assert_aligned(loaded, embeddings)
+    loaded.persist(persist_path)
+
+    reloaded = MmapVectorStore.from_persist_dir(str(tmp_path))
+    reloaded.enable_ann(n_probe=4)
+    assert_aligned(reloaded, embeddings)
+    # the persisted IVF index was built on the same rows, so it was loaded instead of built again
+    assert reloaded._ann is not None and reloaded._ann.n_rows == len(embeddings)
+
+def test_persist_switches_the_vectors_and_the_node_ids_together(tmp_path):
+    vectors = make_clustered_vectors(n_vectors=20)
+    node_ids = [f"node-{i}" for i in range(len(vectors))]
+    persist_path = str(tmp_path / "default__vector_store.json")
+    vector_store = MmapVectorStore(matrix=vectors[:10], node_ids=node_ids[:10], ref_doc_ids=node_ids[:10])
+    vector_store.persist(persist_path)
+    # a reader that read the ids file before the next persist still finds the vectors file it names
+    loaded = MmapVectorStore.from_persist_dir(str(tmp_path))
+
+    vector_store.add(make_nodes(vectors[10:], start=10))
+    vector_store.persist(persist_path)
+    assert_aligned(loaded, dict(zip(node_ids[:10], vectors[:10])))
+    assert_aligned(MmapVectorStore.from_persist_dir(str(tmp_path)), dict(zip(node_ids, vectors)))
+    # only the vectors file of the last persist is kept
+    assert len(list(tmp_path.glob("default__vectors.*.npy"))) == 1
+
+def test_load_a_store_persisted_without_versioned_vectors(tmp_path):
+    vectors = make_clustered_vectors(n_vectors=10)
+    node_ids = [f"node-{i}" for i in range(len(vectors))]
+    np.save(tmp_path / "default__vectors.npy", normalize(vectors))
+    (tmp_path / "default__vector_ids.json").write_text(json.dumps({"node_ids": node_ids, "ref_doc_ids": node_ids}))
+    vector_store = MmapVectorStore.from_persist_dir(str(tmp_path))
+    assert_aligned(vector_store, dict(zip(node_ids, vectors)))
+
+    vector_store.persist(str(tmp_path / "default__vector_store.json"))
+    assert not (tmp_path / "default__vectors.npy").exists()
+    assert_aligned(MmapVectorStore.from_persist_dir(str(tmp_path)), dict(zip(node_ids, vectors)))
@@ -0,0 +1,98 @@
+"""
+    Tests for the sync of the blog posts to the blob storage in upload-data.py, against an in-memory container that
+    stands in for Azurite.
+"""
+import itertools
+from types import SimpleNamespace
+import pytest
+from conftest import load_script
+
+upload_data = load_script("upload-data.py")
+
+class FakeBlobClient:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def upload_blob(self, data, overwrite=False, content_settings=None):
+        assert overwrite, "the sync must overwrite blobs that changed"
+        if self.name in self.container.fail_on:
+            raise ConnectionError(f"Interrupted while uploading {self.name}")
+        etag = f'"0x{next(self.container.etags):04x}"'
+        # Azurite and Azure store the MD5 that is sent with the upload, a blob written by another tool may not have one
+        content_md5 = content_settings.content_md5 if self.container.store_md5 else None
+        self.container.blobs[self.name] = SimpleNamespace(
+            name=self.name, etag=etag, data=data.read(), content_settings=SimpleNamespace(content_md5=content_md5),
+        )
+        self.container.uploads.append(self.name)
+        return {"etag": etag}
+
+class FakeContainerClient:
+    """
+    The part of the ContainerClient that sync_directory uses.
+
+    Args:
+        store_md5 (bool): Whether the MD5 of an upload is stored with the blob.
+    """
+    def __init__(self, store_md5=True):
+        self.blobs = {}
+        self.uploads = []
+        self.fail_on = set()
+        self.store_md5 = store_md5
+        self.etags = itertools.count(1)
+
+    def list_blobs(self):
+        return list(self.blobs.values())
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self, name)
+
+@pytest.fixture
+def posts(tmp_path):
+    directory = tmp_path / "posts"
+    directory.mkdir()
+    for number in range(5):
+        (directory / f"2024-01-0{number + 1}-post-{number}.md").write_text(f"# Post {number}\n")
+    return directory
+
+def sync(container, posts, tmp_path):
+    return upload_data.sync_directory(container, str(posts), str(tmp_path / "checkpoint.json"), concurrency=1)
+
+def test_unchanged_files_are_skipped(posts, tmp_path):
+    container = FakeContainerClient()
+    assert sync(container, posts, tmp_path) == (5, 0)
+
+    container.uploads.clear()
+    assert sync(container, posts, tmp_path) == (0, 5)
+    assert container.uploads == []
+
+def test_changed_files_are_uploaded_again(posts, tmp_path):
+    container = FakeContainerClient()
+    sync(container, posts, tmp_path)
+
+    (posts / "2024-01-03-post-2.md").write_text("# Post 2, updated\n")
+    container.uploads.clear()
+    assert sync(container, posts, tmp_path) == (1, 4)
+    assert container.uploads == ["2024-01-03-post-2.md"]
+    assert container.blobs["2024-01-03-post-2.md"].data == b"# Post 2, updated\n"
+
+def test_interrupted_sync_resumes_from_the_checkpoint(posts, tmp_path):
+    # without the MD5 on the blobs, only the checkpoint tells which uploads finished
+    container = FakeContainerClient(store_md5=False)
+    container.fail_on.add("2024-01-04-post-3.md")
+    with pytest.raises(ConnectionError):
+        sync(container, posts, tmp_path)
+    finished = set(container.blobs)
+    assert finished and len(finished) < 5
+
+    container.fail_on.clear()
+    container.uploads.clear()
+    assert sync(container, posts, tmp_path) == (5 - len(finished), len(finished))
+    assert set(container.uploads) == {path.name for path in posts.iterdir()} - finished
+
+    # a blob that was changed by someone else gets another ETag, so the checkpoint no longer counts for it
+    blob = container.blobs["2024-01-01-post-0.md"]
+    blob.etag = '"0xffff"'
+    container.uploads.clear()
+    assert sync(container, posts, tmp_path) == (1, 4)
+    assert container.uploads == ["2024-01-01-post-0.md"]
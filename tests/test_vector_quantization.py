@@ -0,0 +1,67 @@
+"""
+    Tests for the quantized search of the MmapVectorStore: the recall of the float16 and int8 vectors against the
+    exact float32 search, and that the persisted quantized vectors follow the changes of the store.
+"""
+import os
+import numpy as np
+import pytest
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from conftest import make_clustered_vectors, make_queries, make_nodes
+from mmap_vector_store import MmapVectorStore
+from vector_quantization import QuantizedMatrix, get_quantized_fname
+
+def query_ids(vector_store, query, top_k=10):
+    return vector_store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=top_k)).ids
+
+def make_store(vectors):
+    node_ids = [f"node-{i}" for i in range(len(vectors))]
+    return MmapVectorStore(matrix=vectors, node_ids=node_ids, ref_doc_ids=node_ids)
+
+@pytest.mark.parametrize("dtype, rescore, min_recall", [
+    ("float16", 4, 0.98),
+    ("int8", 4, 0.98),
+    ("int8", 0, 0.95),
+])
+def test_quantized_recall_against_exact_search(dtype, rescore, min_recall):
+    vectors = make_clustered_vectors()
+    queries = make_queries(vectors)
+    exact_store = make_store(vectors)
+    quantized_store = make_store(vectors)
+    quantized_store.enable_quantization(dtype, rescore=rescore)
+
+    recall = np.mean([len(set(query_ids(exact_store, query)) & set(query_ids(quantized_store, query))) / 10 for query in queries])
+    assert recall >= min_recall
+
+def test_rescored_scores_are_the_float32_scores():
+    vectors = make_clustered_vectors(n_vectors=200)
+    query = make_queries(vectors, n_queries=1)[0]
+    exact = make_store(vectors).query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5))
+    quantized_store = make_store(vectors)
+    quantized_store.enable_quantization("int8", rescore=4)
+    result = quantized_store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=5))
+    assert result.ids == exact.ids
+    np.testing.assert_allclose(result.similarities, exact.similarities, rtol=1e-5)
+
+def test_persisted_quantized_vectors_follow_the_store(tmp_path):
+    vectors = make_clustered_vectors(n_vectors=100, seed=3)
+    persist_path = str(tmp_path / "default__vector_store.json")
+    prefix = str(tmp_path / "default__")
+    vector_store = make_store(vectors[:80])
+    vector_store.enable_quantization("int8")
+    vector_store.persist(persist_path)
+
+    loaded = MmapVectorStore.from_persist_dir(str(tmp_path))
+    loaded.enable_quantization("int8")
+    # the store is changed after loading: the quantized copy is made again from the current rows
+    loaded.delete_nodes(["node-0", "node-1"])
+    loaded.add(make_nodes(vectors[80:], start=80))
+    loaded.persist(persist_path)
+
+    reloaded = MmapVectorStore.from_persist_dir(str(tmp_path))
+    quantized = QuantizedMatrix.load(prefix, "int8")
+    assert len(quantized) == len(reloaded.node_ids) == reloaded.matrix.shape[0] == 98
+    np.testing.assert_allclose(quantized[np.arange(len(quantized))], reloaded.matrix, atol=0.02)
+
+    # the files of a quantization that is no longer used are removed
+    reloaded.persist(persist_path)
+    assert not os.path.exists(prefix + get_quantized_fname("int8"))
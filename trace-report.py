@@ -0,0 +1,35 @@
+"""
+    This script summarizes the spans in the trace file, with the p50 and p95 duration of every stage.
+
+    The script is going to use the following command line parameters:
+    - Optional: the trace file, e.g. python trace-report.py traces.jsonl (default: TRACE_FILE or "traces.jsonl")
+
+    Enable tracing with TRACING=jsonl when running the other scripts to fill the trace file.
+"""
+import sys, os, json, math
+
+def percentile(sorted_values, percentage):
+    # nearest-rank percentile
+    return sorted_values[max(0, math.ceil(percentage / 100 * len(sorted_values)) - 1)]
+
+# Main script
+if __name__ == "__main__":
+    trace_file = sys.argv[1] if len(sys.argv) > 1 else os.getenv("TRACE_FILE", "traces.jsonl")
+    if not os.path.exists(trace_file):
+        raise ValueError(f"Trace file [{trace_file}] does not exist, run the scripts with TRACING=jsonl first")
+
+    durations = {}
+    errors = {}
+    with open(trace_file, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            span = json.loads(line)
+            durations.setdefault(span["name"], []).append(span["duration_ms"])
+            if "error" in span["attributes"]:
+                errors[span["name"]] = errors.get(span["name"], 0) + 1
+
+    print(f"{'stage':<24} {'count':>7} {'errors':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for name, values in sorted(durations.items()):
+        values.sort()
+        print(f"{name:<24} {len(values):>7} {errors.get(name, 0):>7} {percentile(values, 50):>10.1f} {percentile(values, 95):>10.1f} {values[-1]:>10.1f}")
@@ -0,0 +1,217 @@
+"""
+    Structured tracing of the pipeline stages, so durations can be aggregated across runs instead of only printed.
+
+    Every stage runs in a span with a name, a duration and attributes like the number of fragments, the context size
+    or the used tokens. Spans are nested with a context variable: a span started while another span is active in the
+    same thread (or task) becomes its child and shares its trace id. Finished spans are written to a JSONL file and/or
+    exported to OpenTelemetry. Use `python trace-report.py` to see the p50/p95 duration of each stage.
+
+    When tracing is disabled (the default), `span` returns a shared no-op span, so the instrumentation costs a
+    single check per stage.
+
+    Environment Variables:
+    - TRACING: Where to send the spans: "off", "jsonl", "otel" or "jsonl,otel" (default: "off").
+    - TRACE_FILE: The path to the JSONL file with the spans (default: "traces.jsonl").
+"""
+import os, time, json, threading, functools, contextvars
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_config = None
+_config_lock = threading.Lock()
+_file_lock = threading.Lock()
+
+class _NoopSpan:
+    """
+    Span that is used when tracing is disabled: it records nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """
+    A traced stage of the pipeline.
+
+    Args:
+        name (str): The name of the stage, e.g. "retrieval".
+        attributes (dict): The attributes to start with.
+    """
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = None
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = None
+        self.start_time = None
+        self.duration_ms = None
+        self._start = None
+        self._token = None
+        self._otel_span = None
+
+    def set(self, **attributes):
+        """
+        Adds attributes to the span, e.g. span.set(fragments=2, cache_hit="exact").
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self._token = _current_span.set(self)
+        tracer = _get_config()["otel_tracer"]
+        if tracer is not None:
+            self._otel_span = tracer.start_span(self.name, context=_otel_context(parent))
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        _export(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+def span(name, **attributes):
+    """
+    Starts a span for a stage, to use as a context manager:
+
+        with span("retrieval", top_k=2) as retrieval_span:
+            fragments = ...
+            retrieval_span.set(fragments=len(fragments))
+
+    Args:
+        name (str): The name of the stage.
+        **attributes: The attributes to start with.
+
+    Returns:
+        Span: The span, or a no-op span when tracing is disabled.
+    """
+    if not _get_config()["enabled"]:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+def traced(name):
+    """
+    Decorator that runs every call of the function in a span with the given name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _get_config()["enabled"]:
+                return function(*args, **kwargs)
+            with Span(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def set_attributes(**attributes):
+    """
+    Adds attributes to the active span, if there is one.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+def log_duration(start_time, message):
+    """
+    Logs the duration of an operation in milliseconds.
+
+    Args:
+        start_time (float): The start time of the operation, typically obtained from time.time().
+        message (str): A message describing the operation.
+
+    Prints:
+        A message indicating the duration of the operation in milliseconds.
+
+    Returns:
+        int: The duration of the operation in milliseconds.
+    """
+    duration = round((time.time() - start_time) * 1000)
+    print(f"{message} took [{duration}] ms")
+    print()
+    return duration
+
+def _get_config():
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = _load_config()
+    return _config
+
+def _load_config():
+    sinks = {sink.strip() for sink in os.getenv("TRACING", "off").lower().split(",")} - {"", "off"}
+    config = {"enabled": bool(sinks), "trace_file": None, "otel_tracer": None}
+    if "jsonl" in sinks:
+        config["trace_file"] = os.getenv("TRACE_FILE", "traces.jsonl")
+    if "otel" in sinks:
+        config["otel_tracer"] = _setup_otel()
+    return config
+
+def _setup_otel():
+    """
+    Gets an OpenTelemetry tracer. When the application did not configure a tracer provider, one is set up with the
+    OTLP exporter (configured with the standard OTEL_EXPORTER_OTLP_* variables), or the console exporter when the
+    OTLP exporter is not installed.
+    """
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        print("[WARNING] TRACING=otel needs the opentelemetry-sdk package, skipping the OpenTelemetry export")
+        return None
+
+    if not isinstance(trace.get_tracer_provider(), TracerProvider):
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        except ImportError:
+            exporter = ConsoleSpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+    return trace.get_tracer("blog-rag")
+
+def _otel_context(parent):
+    if parent is None or parent._otel_span is None:
+        return None
+    from opentelemetry import trace
+    return trace.set_span_in_context(parent._otel_span)
+
+def _export(finished_span):
+    config = _get_config()
+    if finished_span._otel_span is not None:
+        for key, value in finished_span.attributes.items():
+            # OpenTelemetry only accepts primitive attribute values
+            finished_span._otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else json.dumps(value))
+        if "error" in finished_span.attributes:
+            from opentelemetry.trace import Status, StatusCode
+            finished_span._otel_span.set_status(Status(StatusCode.ERROR, finished_span.attributes["error"]))
+        finished_span._otel_span.end()
+    if config["trace_file"] is not None:
+        line = json.dumps(finished_span.to_dict(), default=str) + "\n"
+        with _file_lock:
+            with open(config["trace_file"], "a") as file:
+                file.write(line)
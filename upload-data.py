@@ -1,31 +1,130 @@
 """
     This script is going to upload the blogposts from the downloaded blog repository to an Azure Blob Storage.
 
+    The files are uploaded concurrently, and files whose MD5 hash already matches the blob in the container are skipped,
+    so the script is safe to re-run. A checkpoint file records every finished upload, so an interrupted sync resumes
+    where it stopped. The checkpoint is also the version of the uploaded blog posts for the answer cache of
+    azure-openai.py, so cached answers are not reused after an upload.
+
+    Environment Variables:
+    - AZURE_STORAGE_CONNECTION_STRING: The connection string of the storage account. Use "UseDevelopmentStorage=true" for a local Azurite emulator.
+    - UPLOAD_CONCURRENCY: The maximum number of concurrent uploads (default: 8).
+    - UPLOAD_CHECKPOINT: The path to the checkpoint file (default: "upload-checkpoint.json").
+
     See the documentation for Lab 3 for more details.
 """
-import os
-from azure.storage.blob import BlobServiceClient
+import os, json, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobServiceClient, ContentSettings
 from utils import get_blogging_directory
 
-# Check if the AZURE_STORAGE_CONNECTION_STRING is set
-if not os.getenv("AZURE_STORAGE_CONNECTION_STRING"):
-    raise ValueError("AZURE_STORAGE_CONNECTION_STRING is not set")
+def get_file_md5(file_path):
+    with open(file_path, "rb") as file:
+        return hashlib.md5(file.read()).hexdigest()
 
-# Main code
-blogging_directory = get_blogging_directory()
-# push the blogging directory into an Azure Blob Storage
-connect_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
-blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-container_name = "blogposts"
-container_client = blob_service_client.get_container_client(container_name)
-
-# Iterate over files in the blogging directory and upload each one
-for root, dirs, files in os.walk(blogging_directory):
-    for file_name in files:
-        file_path = os.path.join(root, file_name)
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, "r") as file:
+        return json.load(file)
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    with open(checkpoint_path + ".tmp", "w") as file:
+        json.dump(checkpoint, file, indent=2, sort_keys=True)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+def get_remote_blobs(container_client):
+    """
+    Lists the blobs in the container with one call, instead of requesting the properties of each blob.
+
+    Returns:
+        dict: The blob name with the hex MD5 hash of the content (None if not set) and the ETag of the blob.
+    """
+    blobs = {}
+    for blob in container_client.list_blobs():
+        content_md5 = blob.content_settings.content_md5
+        blobs[blob.name] = {"md5": bytes(content_md5).hex() if content_md5 else None, "etag": blob.etag}
+    return blobs
+
+def sync_directory(container_client, directory, checkpoint_path, concurrency=8):
+    """
+    Uploads the files in the directory to the container, skipping the files that are already up to date.
+
+    A file is up to date when the MD5 hash of the blob matches the local file, or when the checkpoint has the
+    local MD5 hash for a blob with the same ETag as the blob in the container.
+
+    Args:
+        container_client (ContainerClient): The client for the container to upload to.
+        directory (str): The path to the directory with the files.
+        checkpoint_path (str): The path to the checkpoint file.
+        concurrency (int): The maximum number of concurrent uploads.
+
+    Returns:
+        tuple: The number of uploaded and skipped files.
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    remote_blobs = get_remote_blobs(container_client)
+
+    to_upload = []
+    skipped = 0
+    for root, dirs, files in os.walk(directory):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            md5 = get_file_md5(file_path)
+            remote = remote_blobs.get(file_name)
+            checkpointed = checkpoint.get(file_name, {})
+            if remote and (remote["md5"] == md5 or (checkpointed.get("md5") == md5 and checkpointed.get("etag") == remote["etag"])):
+                skipped += 1
+                continue
+            to_upload.append((file_name, file_path, md5))
+    print(f"Uploading [{len(to_upload)}] files, skipping [{skipped}] files that are up to date")
+
+    checkpoint_lock = threading.Lock()
+
+    def upload(file_name, file_path, md5):
         blob_client = container_client.get_blob_client(file_name)
         with open(file_path, "rb") as data:
-            blob_client.upload_blob(data)
-        print(f"Uploaded {file_name} to the Azure Blob Storage")
+            result = blob_client.upload_blob(
+                data,
+                overwrite=True,
+                content_settings=ContentSettings(content_type="text/markdown", content_md5=bytearray(bytes.fromhex(md5))),
+            )
+        # record every finished upload, so an interrupted sync resumes from here
+        with checkpoint_lock:
+            checkpoint[file_name] = {"md5": md5, "etag": result.get("etag")}
+            save_checkpoint(checkpoint_path, checkpoint)
+        return file_name
+
+    uploaded = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(upload, *item) for item in to_upload]
+        for future in as_completed(futures):
+            print(f"Uploaded {future.result()} to the Azure Blob Storage")
+            uploaded += 1
+    return uploaded, skipped
+
+# Main code
+if __name__ == "__main__":
+    # Check if the AZURE_STORAGE_CONNECTION_STRING is set
+    if not os.getenv("AZURE_STORAGE_CONNECTION_STRING"):
+        raise ValueError("AZURE_STORAGE_CONNECTION_STRING is not set")
+
+    blogging_directory = get_blogging_directory()
+    # push the blogging directory into an Azure Blob Storage
+    connect_str = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
+    container_name = "blogposts"
+    container_client = blob_service_client.get_container_client(container_name)
+    try:
+        container_client.create_container()
+    except ResourceExistsError:
+        pass
 
-print("Uploaded all blogposts to the Azure Blob Storage")
+    uploaded, skipped = sync_directory(
+        container_client,
+        blogging_directory,
+        os.getenv("UPLOAD_CHECKPOINT", "upload-checkpoint.json"),
+        concurrency=int(os.getenv("UPLOAD_CONCURRENCY", "8")),
+    )
+    print(f"Uploaded [{uploaded}] blogposts to the Azure Blob Storage, [{skipped}] were already up to date")
@@ -0,0 +1,131 @@
+"""
+    Quantized copies of the embedding matrix of the MmapVectorStore, to search the index with less memory.
+
+    - float16: half the size of the float32 matrix, the scores hardly change, but NumPy converts float16 slowly, so
+      a search takes several times longer than with float32.
+    - int8: a quarter of the size, every vector is scaled to [-127, 127] with its own scale. About as fast as float32.
+
+    The scores are computed in chunks that are converted to float32, so a search never holds more than one chunk at
+    full precision. The top candidates can be rescored with the float32 matrix, which stays memory-mapped on disk, so
+    only the pages of those rows are read. Use `python benchmark-ann.py` to see the recall of each quantization.
+"""
+import os
+import numpy as np
+
+QUANTIZATIONS = ("float16", "int8")
+SCALES_FNAME = "vector_scales.npy"
+
+def get_quantized_fname(dtype):
+    return f"vectors_{dtype}.npy"
+
+class QuantizedMatrix:
+    """
+    A quantized matrix of normalized vectors, that can be multiplied with a query vector and indexed by row like the
+    float32 matrix.
+
+    Args:
+        codes (np.ndarray): The quantized vectors, float16 or int8.
+        scales (np.ndarray): The scale of every int8 vector, None for float16.
+        chunk_size (int): The number of rows that are converted to float32 at a time, small enough to stay in the cache.
+    """
+    def __init__(self, codes, scales=None, chunk_size=1024):
+        self.codes = codes
+        self.scales = scales
+        self.chunk_size = chunk_size
+
+    @property
+    def dtype(self):
+        return str(self.codes.dtype)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def quantize(cls, matrix, dtype):
+        """
+        Quantizes a matrix of normalized float32 vectors.
+
+        Args:
+            matrix (np.ndarray): The vectors, one per row.
+            dtype (str): float16 or int8.
+
+        Returns:
+            QuantizedMatrix: The quantized vectors.
+        """
+        if dtype == "float16":
+            return cls(np.asarray(matrix, dtype=np.float16))
+        if dtype != "int8":
+            raise ValueError(f"Unknown quantization: {dtype}, use one of {', '.join(QUANTIZATIONS)}")
+        matrix = np.asarray(matrix, dtype=np.float32)
+        scales = np.abs(matrix).max(axis=1) / 127 if len(matrix) else np.zeros(0, dtype=np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return cls(codes, scales.astype(np.float32))
+
+    def __getitem__(self, rows):
+        # the dequantized float32 rows, e.g. for the candidates of the IVF index
+        vectors = np.asarray(self.codes[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][..., None]
+        return vectors
+
+    def __matmul__(self, query):
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), self.chunk_size):
+            end = start + self.chunk_size
+            scores[start:end] = np.asarray(self.codes[start:end], dtype=np.float32) @ query
+            if self.scales is not None:
+                scores[start:end] *= self.scales[start:end]
+        return scores
+
+    def save(self, prefix):
+        """
+        Writes the quantized vectors (and scales) next to the float32 vectors, replacing the files atomically.
+
+        Args:
+            prefix (str): The prefix of the files of the vector store, e.g. `blog_index/default__`.
+        """
+        files = [(get_quantized_fname(self.dtype), self.codes)]
+        if self.scales is not None:
+            files.append((SCALES_FNAME, self.scales))
+        for fname, data in files:
+            with open(prefix + fname + ".tmp", "wb") as file:
+                np.save(file, np.ascontiguousarray(data))
+        for fname, _ in files:
+            os.replace(prefix + fname + ".tmp", prefix + fname)
+
+    @classmethod
+    def load(cls, prefix, dtype):
+        """
+        Memory-maps the quantized vectors of a vector store.
+
+        Returns:
+            QuantizedMatrix: The quantized vectors, or None when they were not persisted.
+        """
+        path = prefix + get_quantized_fname(dtype)
+        if not os.path.exists(path) or (dtype == "int8" and not os.path.exists(prefix + SCALES_FNAME)):
+            return None
+        scales = np.load(prefix + SCALES_FNAME, mmap_mode="r") if dtype == "int8" else None
+        return cls(np.load(path, mmap_mode="r"), scales)
+
+def remove_quantized_files(prefix, keep=None):
+    """
+    Removes the persisted quantized vectors that no longer match the float32 vectors.
+
+    Args:
+        prefix (str): The prefix of the files of the vector store.
+        keep (str): The quantization whose files are kept.
+    """
+    for dtype in QUANTIZATIONS:
+        fnames = [get_quantized_fname(dtype)] + ([SCALES_FNAME] if dtype == "int8" else [])
+        for fname in fnames:
+            if dtype != keep and os.path.exists(prefix + fname):
+                os.remove(prefix + fname)